@@ -0,0 +1,426 @@
+"""
+Gemini ปลอมสำหรับ load test แบบไม่ต่อ API จริง (HTTP server ที่ตอบแบบ REST API ของ Gemini v1beta)
+
+ให้บอทคุยกับ server นี้ผ่าน SDK ตัวจริงโดยตั้ง env ก่อนรัน (ทั้ง line_his2 และ workaw อ่านค่านี้):
+
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089   # genai.configure(transport="rest", client_options=...)
+
+รองรับ: GET models, generateContent, streamGenerateContent (JSON array และ alt=sse), countTokens
+และ cachedContents (create/get/update ttl/delete) ให้ทดสอบ context caching ได้
+ตั้งค่าได้: latency ก่อน token แรก, ความเร็ว token ต่อวินาที, ความยาวคำตอบ, 429 แบบสุ่ม (error_rate)
+และ 429 ตามโควต้าต่อนาที (rpm_limit) เหมือน free tier
+
+    python fake_gemini.py --port 8089 --gemini-latency 0.4 --tokens-per-second 80 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chat_history import estimate_tokens  # นับแบบเดียวกับบอท
+
+DEFAULT_MODELS = ("gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.0-flash-lite", "gemini-flash-latest")
+PAGE_MARKER_PATTERN = re.compile(r"\[--- Page (\d+) START ---\]")
+MODEL_PATH_PATTERN = re.compile(r"^/v1[a-z0-9]*/models/([^/:]+)(?::(\w+))?$")
+CACHE_PATH_PATTERN = re.compile(r"^/v1[a-z0-9]*/cachedContents(?:/([^/:]+))?$")
+FILLER = "ข้อมูลจำลองจากเอกสาร "
+ECHO_MAX_CHARS = 500  # คำถามยาวกว่านี้ (เช่นมี [CONTEXT] ทั้งก้อน) ไม่ทวน
+
+
+def request_text(payload):
+    """ข้อความทั้งหมดใน contents + system_instruction ของ request"""
+    texts = []
+    for content in payload.get("contents", []) + [payload.get("systemInstruction") or {}]:
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def last_user_text(payload):
+    for content in reversed(payload.get("contents", [])):
+        if content.get("role", "user") == "user":
+            return "".join(part.get("text", "") for part in content.get("parts", []))
+    return ""
+
+
+def make_answer(payload, output_tokens):
+    """
+    คำตอบยาวราว output_tokens token อ้างหน้าแรกที่อยู่ใน [CONTEXT] ของคำถามล่าสุด (ถ้ามี)
+    และทวนคำถามสั้นๆ ไว้ให้ driver จับคู่คำตอบกับคำถามได้
+    """
+    question = last_user_text(payload)
+    pages = PAGE_MARKER_PATTERN.findall(question)
+    cite = f" [PAGE: {pages[0]}]" if pages else ""
+    echo = f"ถาม: {question}\n" if len(question) <= ECHO_MAX_CHARS else ""
+    head = f"คำตอบจำลอง{cite}\n{echo}"
+    body_chars = max(0, output_tokens * 3 - len(head))
+    return head + (FILLER * (body_chars // len(FILLER) + 1))[:body_chars]
+
+
+def split_tokens(text, chunk_tokens):
+    size = max(1, chunk_tokens * 3)
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def parse_ttl(value, default=3600.0):
+    """ttl ของ REST API อยู่ในรูปวินาทีตามด้วย s เช่น 3600s"""
+    try:
+        return float(str(value).rstrip("s"))
+    except ValueError:
+        return default
+
+
+def timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{int(seconds % 1 * 1e6):06d}Z"
+
+
+def response_json(text, prompt_tokens, output_tokens, finish=True, cached_tokens=0):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+            "cachedContentTokenCount": cached_tokens,
+        },
+    }
+
+
+# --- 🤖 Fake Gemini Server ---
+class FakeGeminiServer:
+    """
+    latency: วินาทีก่อน token แรก (± jitter), tokens_per_second: ความเร็วปล่อย token หลังจากนั้น
+    error_rate: โอกาสตอบ 429 ต่อ request, rpm_limit: request ต่อนาทีต่อ model (0 = ไม่จำกัด) เกินแล้วตอบ 429
+    models: ชื่อ model ที่มีอยู่ (ชื่ออื่นตอบ 404 ให้ทดสอบ failover ได้)
+    cache_min_tokens: cached content ที่สั้นกว่านี้ตอบ 400 เหมือน API จริง, cache_error_rate: โอกาสที่ create/update cache ตอบ 503
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, jitter=0.05, tokens_per_second=80.0,
+                 output_tokens=150, chunk_tokens=20, error_rate=0.0, rpm_limit=0, models=DEFAULT_MODELS, seed=None,
+                 cache_min_tokens=0, cache_error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+        self.models = list(models)
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_error_rate = cache_error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows = {}  # model -> deque ของเวลาที่รับ request ใน 60 วินาทีล่าสุด
+        self.reset()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # ไม่ให้ chunk ถัดไปบน keep-alive รอ delayed ACK (~40ms)
+
+            def do_GET(self):
+                fake._handle(self, "GET")
+
+            def do_POST(self):
+                fake._handle(self, "POST")
+
+            def do_PATCH(self):
+                fake._handle(self, "PATCH")
+
+            def do_DELETE(self):
+                fake._handle(self, "DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # method -> จำนวน request
+            self.errors = Counter()  # status -> จำนวน
+            self.prompt_tokens = 0
+            self.output_tokens_total = 0
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.cached_contents = {}  # name -> {"model", "tokens", "expires_at", ...}
+            self.cache_creates = 0
+            self.cached_tokens_total = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens_total,
+                "cached_tokens": self.cached_tokens_total,
+                "cached_contents": len(self.cached_contents),
+                "max_in_flight": self.max_in_flight,
+            }
+
+    # --- การตอบแต่ละแบบ ---
+    def _handle(self, handler, verb):
+        parsed = urlparse(handler.path)
+        query = parse_qs(parsed.query)
+        payload = {}
+        if verb in ("POST", "PATCH"):
+            length = int(handler.headers.get("Content-Length", 0))
+            payload = json.loads(handler.rfile.read(length) or b"{}")
+
+        if verb == "GET" and re.match(r"^/v1[a-z0-9]*/models/?$", parsed.path):
+            return self._send_json(handler, 200, {"models": [self._model_info(m) for m in self.models]})
+        cache_match = CACHE_PATH_PATTERN.match(parsed.path)
+        if cache_match is not None:
+            return self._handle_cache(handler, verb, cache_match.group(1), payload)
+        match = MODEL_PATH_PATTERN.match(parsed.path)
+        if match is None:
+            return self._send_error(handler, 404, "NOT_FOUND", f"unknown path {parsed.path}")
+        model, method = match.group(1), match.group(2)
+        if model not in self.models:
+            return self._send_error(handler, 404, "NOT_FOUND", f"models/{model} is not found")
+        if verb == "GET" and method is None:
+            return self._send_json(handler, 200, self._model_info(model))
+
+        with self._lock:
+            self.requests[method] += 1
+        if method == "countTokens":
+            payload = payload.get("generateContentRequest", payload)
+            return self._send_json(handler, 200, {"totalTokens": estimate_tokens(request_text(payload))})
+        if method not in ("generateContent", "streamGenerateContent"):
+            return self._send_error(handler, 404, "NOT_FOUND", f"method {method} is not supported")
+        if self._should_reject(model):
+            return self._send_error(handler, 429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            cached_tokens = 0
+            if payload.get("cachedContent"):
+                cached = self._get_cached(payload["cachedContent"])
+                if cached is None:
+                    return self._send_error(handler, 404, "NOT_FOUND", f"{payload['cachedContent']} is not found")
+                cached_tokens = cached["tokens"]
+            prompt_tokens = estimate_tokens(request_text(payload)) + cached_tokens
+            answer = make_answer(payload, self.output_tokens)
+            output_tokens = estimate_tokens(answer)
+            with self._lock:
+                self.prompt_tokens += prompt_tokens
+                self.output_tokens_total += output_tokens
+                self.cached_tokens_total += cached_tokens
+            time.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+            if method == "generateContent":
+                time.sleep(output_tokens / self.tokens_per_second)
+                return self._send_json(handler, 200, response_json(answer, prompt_tokens, output_tokens,
+                                                                   cached_tokens=cached_tokens))
+            self._stream(handler, answer, prompt_tokens, output_tokens, sse=query.get("alt") == ["sse"],
+                         cached_tokens=cached_tokens)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _should_reject(self, model):
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors[429] += 1
+                return True
+            if self.rpm_limit:
+                window = self._windows.setdefault(model, deque())
+                now = time.monotonic()
+                while window and now - window[0] > 60:
+                    window.popleft()
+                if len(window) >= self.rpm_limit:
+                    self.errors[429] += 1
+                    return True
+                window.append(now)
+        return False
+
+    def _stream(self, handler, answer, prompt_tokens, output_tokens, sse, cached_tokens=0):
+        """ส่งทีละ chunk_tokens token ผ่าน chunked encoding (SDK แบบ rest อ่านเป็น JSON array)"""
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        pieces = split_tokens(answer, self.chunk_tokens)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+            last = i == len(pieces) - 1
+            body = json.dumps(response_json(piece, prompt_tokens, output_tokens if last else 0, finish=last,
+                                            cached_tokens=cached_tokens), ensure_ascii=False)
+            if sse:
+                data = f"data: {body}\r\n\r\n"
+            else:
+                data = ("[" if i == 0 else ",") + body + ("]" if last else "")
+            self._write_chunk(handler, data.encode("utf-8"))
+        self._write_chunk(handler, b"")
+
+    # --- cachedContents ---
+    def _handle_cache(self, handler, verb, cache_id, payload):
+        with self._lock:
+            self.requests[f"cachedContents.{verb}"] += 1
+        if verb == "POST" and cache_id is None:
+            return self._create_cached(handler, payload)
+        name = f"cachedContents/{cache_id}"
+        cached = self._get_cached(name)
+        if cached is None:
+            return self._send_error(handler, 404, "NOT_FOUND", f"{name} is not found")
+        if verb == "GET":
+            return self._send_json(handler, 200, self._cached_info(name, cached))
+        if verb == "DELETE":
+            with self._lock:
+                self.cached_contents.pop(name, None)
+            return self._send_json(handler, 200, {})
+        if verb == "PATCH":
+            if self._cache_should_fail():
+                return self._send_error(handler, 503, "UNAVAILABLE", "The service is currently unavailable.")
+            with self._lock:
+                cached["expires_at"] = time.time() + parse_ttl(payload.get("ttl"))
+                cached["updated_at"] = time.time()
+            return self._send_json(handler, 200, self._cached_info(name, cached))
+        return self._send_error(handler, 404, "NOT_FOUND", f"method {verb} is not supported")
+
+    def _create_cached(self, handler, payload):
+        model = payload.get("model", "").split("/", 1)[-1]
+        if model not in self.models:
+            return self._send_error(handler, 404, "NOT_FOUND", f"models/{model} is not found")
+        if self._cache_should_fail():
+            return self._send_error(handler, 503, "UNAVAILABLE", "The service is currently unavailable.")
+        tokens = estimate_tokens(request_text(payload))
+        if tokens < self.cache_min_tokens:
+            return self._send_error(handler, 400, "INVALID_ARGUMENT",
+                                    f"Cached content is too small. total_token_count={tokens}, "
+                                    f"min_total_token_count={self.cache_min_tokens}")
+        now = time.time()
+        with self._lock:
+            self.cache_creates += 1
+            name = f"cachedContents/fake{self.cache_creates:06d}"
+            self.cached_contents[name] = cached = {
+                "model": model, "display_name": payload.get("displayName", ""), "tokens": tokens,
+                "created_at": now, "updated_at": now, "expires_at": now + parse_ttl(payload.get("ttl")),
+            }
+        return self._send_json(handler, 200, self._cached_info(name, cached))
+
+    def _get_cached(self, name):
+        """cached content ที่ยังไม่หมดอายุ หรือ None"""
+        with self._lock:
+            cached = self.cached_contents.get(name)
+            if cached is not None and time.time() >= cached["expires_at"]:
+                del self.cached_contents[name]
+                cached = None
+            return cached
+
+    def _cache_should_fail(self):
+        with self._lock:
+            if self.cache_error_rate and self._rng.random() < self.cache_error_rate:
+                self.errors[503] += 1
+                return True
+        return False
+
+    @staticmethod
+    def _cached_info(name, cached):
+        return {
+            "name": name,
+            "model": f"models/{cached['model']}",
+            "displayName": cached["display_name"],
+            "createTime": timestamp(cached["created_at"]),
+            "updateTime": timestamp(cached["updated_at"]),
+            "expireTime": timestamp(cached["expires_at"]),
+            "usageMetadata": {"totalTokenCount": cached["tokens"]},
+        }
+
+    @staticmethod
+    def _write_chunk(handler, data):
+        handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        handler.wfile.flush()
+
+    @staticmethod
+    def _model_info(model):
+        return {
+            "name": f"models/{model}",
+            "displayName": model,
+            "inputTokenLimit": 1048576,
+            "outputTokenLimit": 65536,
+            "supportedGenerationMethods": ["generateContent", "countTokens", "createCachedContent"],
+        }
+
+    def _send_error(self, handler, status, reason, message):
+        if status not in (429, 503):
+            with self._lock:
+                self.errors[status] += 1
+        self._send_json(handler, status, {"error": {"code": status, "message": message, "status": reason}})
+
+    @staticmethod
+    def _send_json(handler, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=UTF-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def add_arguments(parser):
+    """option ของ Gemini ปลอม (ใช้ร่วมกันใน driver ทุกตัว)"""
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="วินาทีก่อน token แรก")
+    parser.add_argument("--gemini-jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=150, help="ความยาวคำตอบ (token)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="โอกาสตอบ 429 ต่อ request")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="โควต้า request ต่อนาทีต่อ model (0 = ไม่จำกัด)")
+
+
+def from_arguments(args, host="127.0.0.1", port=0, seed=None):
+    return FakeGeminiServer(
+        host=host,
+        port=port,
+        latency=args.gemini_latency,
+        jitter=args.gemini_jitter,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rpm_limit=args.rpm_limit,
+        seed=seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_arguments(args, args.host, args.port)
+    print(f"fake Gemini listening on {fake.url} (ตั้ง GEMINI_API_ENDPOINT={fake.url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
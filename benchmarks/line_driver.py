@@ -0,0 +1,149 @@
+"""
+Load test ของ line_his2: ยิง webhook (จาก recording หรือสร้างจำลอง) เข้า /callback ของ Flask app ตัวจริง
+โดย Gemini เป็น fake_gemini.py (ผ่าน SDK จริงแบบ rest) และ LINE เป็น StubLineServer
+
+    python line_driver.py                                  # recording จำลอง 40 user x 4 burst
+    python line_driver.py webhooks.jsonl --speed 2         # replay จาก LINE_RECORD_WEBHOOKS
+    python line_driver.py --error-rate 0.1 --no-batch      # ฉีด 429 และปิด micro-batching
+
+รายงาน throughput, latency ตอบ webhook (ack) และตั้งแต่ webhook เข้าจนได้ reply (p50/p95/p99),
+หน่วยความจำที่โตขึ้น และ token ที่ส่งให้ Gemini
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_gemini
+import report
+
+LINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "line_his2")
+sys.path.insert(0, LINE_DIR)
+import bench_replay  # noqa: E402
+import stubs  # noqa: E402
+
+
+def load_bot(gemini_url, args):
+    """import line_his2 ใหม่ด้วย env ของ scenario นี้ (ค่า config อ่านตอน import)"""
+    os.environ.update({
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "LINE_ASYNC_WEBHOOK": "1",
+        "LINE_MICRO_BATCH": "0" if args.no_batch else "1",
+        "LINE_BATCH_WINDOW_MS": str(args.batch_window),
+        "LINE_WORKER_CONCURRENCY": str(args.concurrency),
+        "LINE_MAX_PENDING_EVENTS": "100000",
+        "OBS_LOG_FILE": os.devnull,
+    })
+    os.environ.pop("LINE_RECORD_WEBHOOKS", None)
+    sys.modules.pop("line_his2", None)
+    import line_his2
+    return line_his2
+
+
+def run(args):
+    records = bench_replay.load_records(args.recording) if args.recording else \
+        bench_replay.to_offsets(bench_replay.make_records(args.users, args.bursts, seed=args.seed))
+    fake = fake_gemini.from_arguments(args, seed=args.seed).start()
+    line_stub = stubs.StubLineServer(latency=args.line_latency).start()
+    bot = load_bot(fake.url, args)
+    bot.LINE_API_BASE_PATH = line_stub.url
+    bot.app.logger.disabled = True
+    client = bot.app.test_client()
+    batches = report.track_batches(bot.dispatcher)
+    local = report.track_local_routes(bot.intent_router)
+
+    sent = {}  # {reply_token: posted_at}
+    questions = {}  # {reply_token: ข้อความ}
+    acks = []
+    statuses = []
+    lock = threading.Lock()
+
+    def post(body):
+        events = json.loads(body)["events"]
+        posted_at = time.perf_counter()
+        response = client.post("/callback", data=body.encode("utf-8"),
+                               headers={"Content-Type": "application/json", "X-Line-Signature": stubs.sign_body(body)})
+        acked = time.perf_counter() - posted_at
+        with lock:
+            # บอทตอบเฉพาะข้อความ text (sticker/follow ใน recording ไม่นับ)
+            for event in events:
+                if event.get("type") == "message" and event["message"].get("type") == "text":
+                    sent[event["replyToken"]] = posted_at
+                    questions[event["replyToken"]] = event["message"]["text"]
+            acks.append(acked)
+            statuses.append(response.status_code)
+
+    memory = report.MemoryTracker().start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for offset, body in records:
+            delay = started + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(post, body)
+    bot.dispatcher.join(timeout=args.timeout)
+    time.sleep(0.2)
+    memory_stats = memory.stop()
+    line_stub.stop()
+    fake.stop()
+
+    questions = {token: text for token, text in questions.items() if text not in local}
+    latencies = list(report.answered_latencies(sent, line_stub.replies, batches, questions,
+                                               unanswered_texts=(bot.FALLBACK_REPLY,)).values())
+    finished = max((ts for ts, _ in line_stub.replies), default=time.perf_counter())
+    gemini = fake.stats()
+    calls = gemini["requests"].get("generateContent", 0)
+    rejected = gemini["errors"].get(429, 0)
+    metrics = {
+        "messages": len(sent),
+        "answered_ratio": round(len(latencies) / len(sent), 4) if sent else 0.0,
+        "throughput_msgs_per_s": round(len(latencies) / max(1e-9, finished - started), 2),
+        "webhook_errors": sum(1 for status in statuses if status != 200),
+    }
+    metrics.update(report.latency_metrics("ack", acks))
+    metrics.update(report.latency_metrics("reply", latencies))
+    metrics.update(memory_stats)
+    metrics.update({
+        "gemini_calls": calls,
+        "gemini_429": rejected,
+        "prompt_tokens": gemini["prompt_tokens"],
+        "output_tokens": gemini["output_tokens"],
+        "prompt_tokens_per_call": round(gemini["prompt_tokens"] / (calls - rejected), 1) if calls > rejected else 0.0,
+        "local_route_ratio": round(bot.intent_router.stats()["local_share"], 4),
+    })
+    config = {
+        "webhooks": len(records), "speed": args.speed, "concurrency": args.concurrency,
+        "micro_batch": not args.no_batch, "batch_window_ms": args.batch_window,
+        "gemini_latency": args.gemini_latency, "tokens_per_second": args.tokens_per_second,
+        "output_tokens": args.output_tokens, "error_rate": args.error_rate, "rpm_limit": args.rpm_limit,
+    }
+    return {"config": config, "metrics": metrics}
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=40, help="จำนวน user ใน recording จำลอง")
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--speed", type=float, default=1.0, help="เร่งเวลา replay (2 = เร็วขึ้น 2 เท่า)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-batch", action="store_true", help="ปิด micro-batching")
+    parser.add_argument("--batch-window", type=int, default=300, help="ms")
+    parser.add_argument("--line-latency", type=float, default=0.05, help="วินาทีที่ stub LINE ใช้ตอบ reply")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    fake_gemini.add_arguments(parser)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test line_his2 กับ Gemini/LINE ปลอม")
+    parser.add_argument("recording", nargs="?", help="ไฟล์ jsonl จาก LINE_RECORD_WEBHOOKS (ไม่ระบุ = สร้างจำลอง)")
+    parser.add_argument("--output", help="เขียนผลเป็น JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    result = run(args)
+    report.print_result("line", result)
+    if args.output:
+        report.save_json(args.output, {"line": result})
@@ -0,0 +1,174 @@
+"""
+ตัวช่วยของ driver: สรุป latency เป็น p50/p95/p99, วัดหน่วยความจำที่โตขึ้นระหว่าง load test
+และเทียบผลกับ baseline (ค่าที่แย่ลงเกิน tolerance ถือว่า regression)
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import percentile  # noqa: E402
+
+# metric ที่ยิ่งมากยิ่งดี (ที่เหลือยิ่งน้อยยิ่งดี: latency, หน่วยความจำ, token, error)
+HIGHER_IS_BETTER = ("throughput", "answered_ratio", "answer_cache_hit_ratio", "local_route_ratio")
+# ส่วนต่างขั้นต่ำที่ยังไม่นับว่าแย่ลง (กันค่าเล็กๆ ที่แกว่งตามเครื่อง เช่น 3ms -> 5ms)
+ABSOLUTE_SLACK = {"_s": 0.05, "_kb": 1024, "_ratio": 0.05}
+# metric ที่เป็นเวลาจริงขึ้นกับความเร็วเครื่อง (runner ของ CI ใช้ร่วมกันและแกว่งมาก) จึงใช้ timing_tolerance ที่หลวมกว่า
+# ส่วน token, จำนวน request, ratio ไม่ขึ้นกับเครื่อง ใช้ tolerance ปกติ
+TIMING_SUFFIXES = ("_s",)
+TIMING_PREFIXES = ("throughput",)
+
+
+def latency_metrics(prefix, values):
+    """{prefix_p50_s, prefix_p95_s, prefix_p99_s, prefix_max_s} จาก list ของวินาที"""
+    return {
+        f"{prefix}_p50_s": round(percentile(values, 50), 4),
+        f"{prefix}_p95_s": round(percentile(values, 95), 4),
+        f"{prefix}_p99_s": round(percentile(values, 99), 4),
+        f"{prefix}_max_s": round(max(values), 4) if values else 0.0,
+    }
+
+
+# --- 📬 จับคู่ข้อความกับ reply ---
+def track_batches(dispatcher):
+    """
+    ห่อ handle_func ของ AsyncDispatcher ให้จดว่าแต่ละ batch มีข้อความไหนบ้าง
+    คืน dict {reply token ที่บอทใช้ตอบ (ของข้อความสุดท้ายใน batch): [reply token ของทุกข้อความใน batch]}
+    """
+    batches = {}
+    handle = dispatcher.handle_func
+
+    def tracked(events):
+        group = events if isinstance(events, list) else [events]
+        tokens = [event.reply_token for event in group]
+        batches[tokens[-1]] = tokens
+        return handle(events)
+
+    dispatcher.handle_func = tracked
+    return batches
+
+
+def track_local_routes(intent_router):
+    """จดข้อความที่ intent router ตอบเอง (คำตอบในเครื่องไม่ทวนคำถามเหมือน Gemini ปลอม)"""
+    local = set()
+    route = intent_router.route
+
+    def tracked(text):
+        result = route(text)
+        if result is not None:
+            local.add(text)
+        return result
+
+    intent_router.route = tracked
+    return local
+
+
+def answered_latencies(sent, replies, batches=None, questions=None, unanswered_texts=()):
+    """
+    จับคู่ข้อความกับ reply ด้วย replyToken และคำถาม แบบเดียวกับ bench_webhook.answered_count:
+    ข้อความนับว่าได้คำตอบเมื่อ reply token ของ batch ที่มันอยู่ถูกใช้ตอบ, reply นั้นไม่ได้มีแค่ unanswered_texts
+    (เช่น FALLBACK_REPLY) และถ้ามีใน questions ต้องมีคำถามนั้นอยู่ในคำตอบ (Gemini ปลอมทวนคำถาม)
+    reply ของข้อความหลังๆ จึงนับแทนข้อความที่หายไปไม่ได้
+
+    sent: {reply_token: เวลาที่ส่ง webhook}, replies: [(เวลา, payload)] จาก StubLineServer
+    batches: จาก track_batches() (None = หนึ่งข้อความต่อหนึ่ง reply), questions: {reply_token: ข้อความที่ถาม}
+    คืน {reply_token: วินาทีจนได้ reply} เฉพาะข้อความที่ได้คำตอบ
+    """
+    members = {}
+    for reply_token, tokens in (batches or {}).items():
+        for token in tokens:
+            members[token] = reply_token
+    answers = {}
+    for ts, payload in replies:
+        texts = [message.get("text", "") for message in payload.get("messages", [])]
+        if any(text not in unanswered_texts for text in texts):
+            answers.setdefault(payload.get("replyToken"), (ts, "\n".join(texts)))
+    latencies = {}
+    questions = questions or {}
+    for token, posted_at in sent.items():
+        answer = answers.get(members.get(token, token))
+        if answer is None or (token in questions and questions[token] not in answer[1]):
+            continue
+        latencies[token] = answer[0] - posted_at
+    return latencies
+
+
+# --- 🧠 วัดหน่วยความจำ ---
+class MemoryTracker:
+    """
+    ใช้ tracemalloc นับหน่วยความจำ Python ที่ยังถูกอ้างอยู่หลัง gc
+    start() หลัง warm-up แล้ว stop() ตอนจบ ได้ growth_kb = ส่วนที่โตขึ้นค้างไว้ (เช่น session/cache ที่ไม่ถูกทิ้ง)
+    """
+
+    def start(self):
+        gc.collect()
+        tracemalloc.start()
+        self._start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def stop(self):
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "memory_growth_kb": round((current - self._start) / 1024, 1),
+            "memory_peak_kb": round((peak - self._start) / 1024, 1),
+        }
+
+
+# --- 📏 เทียบกับ baseline ---
+def _slack(name):
+    for suffix, slack in ABSOLUTE_SLACK.items():
+        if name.endswith(suffix):
+            return slack
+    return 1
+
+
+def is_timing(name):
+    return name.endswith(TIMING_SUFFIXES) or name.startswith(TIMING_PREFIXES)
+
+
+def compare(results, baseline, tolerance=0.25, timing_tolerance=1.0):
+    """
+    คืน list ของ (scenario, metric, baseline, current) ที่แย่ลงเกิน tolerance (สัดส่วน) และเกิน ABSOLUTE_SLACK
+    (metric ที่เป็นสัดส่วนอยู่แล้ว เช่น answered_ratio ใช้ ABSOLUTE_SLACK อย่างเดียว
+    metric ที่เป็นเวลา/throughput ใช้ timing_tolerance แทน tolerance)
+    metric ที่ baseline ไม่มีจะถูกข้าม (เพิ่ม metric ใหม่ได้โดยไม่ต้องอัปเดต baseline ทันที)
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base_metrics = baseline.get(scenario, {}).get("metrics", {})
+        for name, current in result["metrics"].items():
+            if name not in base_metrics:
+                continue
+            base = base_metrics[name]
+            if name.endswith("_ratio"):
+                allowed = _slack(name)
+            else:
+                allowed = max(abs(base) * (timing_tolerance if is_timing(name) else tolerance), _slack(name))
+            if name.startswith(HIGHER_IS_BETTER):
+                worse = base - current > allowed
+            else:
+                worse = current - base > allowed
+            if worse:
+                regressions.append((scenario, name, base, current))
+    return regressions
+
+
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def print_result(scenario, result):
+    print(f"\n== {scenario} ==")
+    for name, value in result["metrics"].items():
+        print(f"  {name:<32} {value}")
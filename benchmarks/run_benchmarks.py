@@ -0,0 +1,120 @@
+"""
+รัน benchmark ทุก scenario (แต่ละตัวแยก process เพราะ config ของบอทอ่านจาก env ตอน import)
+แล้วเทียบกับ baseline.json ค่าที่แย่ลงเกิน tolerance ถือว่า regression (exit code 1) ใช้ใน CI ได้
+
+    python run_benchmarks.py --check                  # profile quick เทียบกับ baseline.json
+    python run_benchmarks.py --save-baseline          # รันแล้วเขียนผลเป็น baseline ใหม่ (commit ไฟล์นี้)
+    python run_benchmarks.py --profile full --only line,line_no_batch
+
+ผลล่าสุดอยู่ที่ results/latest.json
+"""
+import argparse
+import importlib.metadata
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import report
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "latest.json")
+
+# Gemini ปลอมตอบเร็วกว่าของจริง ให้ CI รันจบในไม่กี่นาที (เทียบกับ baseline ที่รันด้วยค่าเดียวกัน)
+FAST_GEMINI = ["--gemini-latency", "0.2", "--tokens-per-second", "300"]
+
+TRACKED_PACKAGES = ("google-generativeai", "line-bot-sdk", "pymupdf", "pythainlp", "scikit-learn", "streamlit")
+
+# profile -> {scenario: (driver, arguments)}
+PROFILES = {
+    "quick": {
+        "line": ("line_driver.py", ["--users", "20", "--bursts", "2", "--speed", "4"] + FAST_GEMINI),
+        "line_429": ("line_driver.py", ["--users", "20", "--bursts", "2", "--speed", "4", "--error-rate", "0.1"]
+                     + FAST_GEMINI),
+        "workaw": ("workaw_driver.py", ["--sessions", "4"] + FAST_GEMINI),
+    },
+    "full": {
+        "line": ("line_driver.py", []),
+        "line_no_batch": ("line_driver.py", ["--no-batch"]),
+        "line_429": ("line_driver.py", ["--error-rate", "0.1"]),
+        "workaw": ("workaw_driver.py", ["--sessions", "12"]),
+        "workaw_429": ("workaw_driver.py", ["--sessions", "4", "--error-rate", "0.1"]),
+    },
+}
+
+
+def package_versions():
+    """version ของ package ที่มีผลกับตัวเลข (pythainlp/scikit-learn เปลี่ยนวิธีตัดคำและ retrieval ถ้าไม่มี)"""
+    versions = {}
+    for name in TRACKED_PACKAGES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def run_scenario(driver, arguments):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "result.json")
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, driver), "--output", output] + arguments,
+                       cwd=BENCH_DIR, check=True)
+        return next(iter(report.load_json(output).values()))
+
+
+def run(args):
+    scenarios = PROFILES[args.profile]
+    if args.only:
+        scenarios = {name: scenarios[name] for name in args.only.split(",")}
+    results = {}
+    for name, (driver, arguments) in scenarios.items():
+        print(f"\n>>> {name}: {driver} {' '.join(arguments)}", flush=True)
+        started = time.perf_counter()
+        results[name] = run_scenario(driver, arguments)
+        results[name]["profile"] = args.profile
+        print(f"  ({time.perf_counter() - started:.1f}s)")
+
+    meta = {"python": platform.python_version(), "platform": platform.platform(), "profile": args.profile,
+            "packages": package_versions()}
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    report.save_json(RESULTS_PATH, dict(results, _meta=meta))
+    print(f"\nwrote {RESULTS_PATH}")
+
+    if args.save_baseline:
+        report.save_json(BASELINE_PATH, dict(results, _meta=meta))
+        print(f"wrote {BASELINE_PATH}")
+    if not args.check:
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print(f"ไม่พบ {BASELINE_PATH} (รันด้วย --save-baseline ก่อน)")
+        return 2
+    baseline = report.load_json(BASELINE_PATH)
+    skipped = [name for name in results if baseline.get(name, {}).get("profile") != args.profile]
+    if skipped:
+        print(f"ข้าม scenario ที่ baseline รันคนละ profile/ไม่มีใน baseline: {', '.join(skipped)}")
+    regressions = report.compare({k: v for k, v in results.items() if k not in skipped}, baseline,
+                                 args.tolerance, args.timing_tolerance)
+    limits = f"{args.tolerance:.0%} (เวลา/throughput {args.timing_tolerance:.0%})"
+    if not regressions:
+        print(f"✅ ไม่มี metric ไหนแย่ลงเกิน {limits} จาก baseline")
+        return 0
+    print(f"❌ แย่ลงเกิน {limits} จาก baseline:")
+    for scenario, name, base, current in regressions:
+        print(f"  {scenario:<14} {name:<28} {base} -> {current}")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ทั้งสองบอทกับ Gemini/LINE ปลอม")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--only", help="รันเฉพาะ scenario เหล่านี้ คั่นด้วย ,")
+    parser.add_argument("--check", action="store_true", help="เทียบกับ baseline.json แล้ว exit 1 ถ้าแย่ลง")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="สัดส่วนที่ยอมให้แย่ลงได้ (0.25 = 25%%)")
+    parser.add_argument("--timing-tolerance", type=float, default=1.0,
+                        help="สัดส่วนที่ยอมให้ metric เวลา/throughput แย่ลงได้ (1.0 = ช้าลงได้ถึง 2 เท่า)")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+Load test ของ workaw: รันบทสนทนาตามสคริปต์ผ่าน app.py ตัวจริงด้วย streamlit.testing (AppTest)
+โดย Gemini เป็น fake_gemini.py (ผ่าน SDK จริงแบบ rest) และเอกสารเป็น PDF จำลองที่สร้างขึ้นตอนรัน
+
+    python workaw_driver.py                                   # conversations.json วนจนครบ 8 session
+    python workaw_driver.py --sessions 20 --error-rate 0.05   # ฉีด 429 ให้เข้าทาง retry/failover
+    python workaw_driver.py --pdf ../workaw_chatbot/workaw/Graphic.pdf
+
+แต่ละ session คือ AppTest ใหม่ (เหมือนผู้ใช้เปิดแท็บใหม่) ส่วน cache_resource (answer cache, retriever,
+rate limiter) ใช้ร่วมกันทั้ง process เหมือนตอนรันจริง รายงาน latency ต่อ turn, TTFT, throughput,
+หน่วยความจำที่โตขึ้น, hit rate ของ answer cache และ token ที่ส่งให้ Gemini
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import fake_gemini
+import report
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "workaw_chatbot", "workaw")
+APP_PATH = os.path.join(APP_DIR, "app.py")
+DEFAULT_SCRIPT = os.path.join(BENCH_DIR, "conversations.json")
+
+TOPICS = [
+    ("Layer", "Layers stack images. Reorder layers in the Layers panel, lock, group and hide each layer."),
+    ("RGB CMYK", "RGB is for screens, CMYK is for print. Convert to CMYK before sending files to print."),
+    ("Resolution", "Print needs 300 ppi resolution. Screen images use 72 ppi resolution."),
+    ("Pen Tool", "The Pen Tool draws paths with anchor points. Drag to create curves, click for corners."),
+    ("Mask", "A Layer Mask hides pixels without deleting them, unlike the Eraser. Paint black to hide."),
+    ("Curves Levels", "Curves adjust tones with a curve. Levels adjust black, white and mid points."),
+    ("Smart Object", "A Smart Object keeps the original data so scaling does not lose quality."),
+    ("PNG Export", "Save PNG with transparency. Export for print as PDF with bleed and crop marks."),
+    ("Font", "Choose readable fonts. Thai fonts for print should have clear loops and spacing."),
+]
+
+
+def make_pdf(path, pages):
+    """PDF จำลอง: หัวข้อวนตาม TOPICS หน้าละหัวข้อ (ใช้ PyMuPDF ตัวเดียวกับ pdf_loader)"""
+    import fitz
+    doc = fitz.open()
+    for i in range(pages):
+        title, body = TOPICS[i % len(TOPICS)]
+        page = doc.new_page()
+        page.insert_text((56, 72), f"{title} (part {i // len(TOPICS) + 1})", fontsize=16)
+        page.insert_textbox(fitz.Rect(56, 96, 540, 780), (body + " ") * 12, fontsize=11)
+    doc.save(path)
+    doc.close()
+
+
+def configure_env(gemini_url, pdf_path, work_dir, args):
+    os.environ.update({
+        "GOOGLE_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "PDF_FILE": pdf_path,
+        "PDF_CACHE_DIR": os.path.join(work_dir, "pdf_cache"),
+        "MODEL_REGISTRY_PATH": os.path.join(work_dir, "model_registry.json"),
+        "RATE_LIMIT_RPM": str(args.rate_limit_rpm),
+        "RATE_LIMIT_BACKEND": "memory",
+        "CONTEXT_CACHE": "0",
+        "OBS_LOG_FILE": os.devnull,
+    })
+
+
+def run_session(questions, timeout):
+    """
+    หนึ่ง session = AppTest ใหม่ คืน [(วินาทีต่อ turn, ttft, ได้คำตอบไหม), ...] และ conversation stats
+    (ttft = 0 แปลว่าได้คำตอบจาก answer cache)
+    """
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"app.py error: {app.exception[0].value}")
+    turns = []
+    for question in questions:
+        started = time.perf_counter()
+        app.chat_input[0].set_value(question).run()
+        elapsed = time.perf_counter() - started
+        messages = app.session_state["messages"]
+        answered = messages[-1]["role"] == "model" and bool(messages[-1]["content"]) and not app.error
+        ttft = app.session_state["last_ttft"] if "last_ttft" in app.session_state else None
+        turns.append((elapsed, ttft, answered))
+    return turns, app.session_state["conversation"].stats()
+
+
+def run(args):
+    with open(args.script, encoding="utf-8") as f:
+        conversations = json.load(f)
+    work_dir = tempfile.mkdtemp(prefix="workaw-bench-")
+    pdf_path = args.pdf or os.path.join(work_dir, "bench.pdf")
+    if not args.pdf:
+        make_pdf(pdf_path, args.pages)
+
+    fake = fake_gemini.from_arguments(args, seed=args.seed).start()
+    configure_env(fake.url, pdf_path, work_dir, args)
+    sys.path.insert(0, APP_DIR)
+
+    # warm-up: โหลด PDF / ทำ index / probe model ครั้งแรก ไม่นับรวมในผล
+    warmup_started = time.perf_counter()
+    run_session([], args.timeout)
+    warmup = time.perf_counter() - warmup_started
+    fake.reset()
+
+    memory = report.MemoryTracker().start()
+    turn_times, ttfts, answered, cache_hits, history_tokens = [], [], 0, 0, []
+    started = time.perf_counter()
+    for i in range(args.sessions):
+        turns, conversation_stats = run_session(conversations[i % len(conversations)], args.timeout)
+        for elapsed, ttft, ok in turns:
+            turn_times.append(elapsed)
+            if not ok:
+                continue
+            answered += 1
+            if ttft:
+                ttfts.append(ttft)
+            else:
+                cache_hits += 1
+        history_tokens.append(conversation_stats["history_tokens"])
+    elapsed = time.perf_counter() - started
+    memory_stats = memory.stop()
+    fake.stop()
+
+    from instrumentation import metrics as app_metrics
+    counters = app_metrics.snapshot()["counters"]
+    gemini = fake.stats()
+    calls = gemini["requests"].get("streamGenerateContent", 0) + gemini["requests"].get("generateContent", 0)
+    rejected = gemini["errors"].get(429, 0)
+    metrics = {
+        "turns": len(turn_times),
+        "answered_ratio": round(answered / len(turn_times), 4) if turn_times else 0.0,
+        "throughput_turns_per_s": round(len(turn_times) / elapsed, 2),
+        "startup_s": round(warmup, 3),
+    }
+    metrics.update(report.latency_metrics("turn", turn_times))
+    metrics.update(report.latency_metrics("ttft", ttfts))
+    metrics.update(memory_stats)
+    metrics.update({
+        "gemini_calls": calls,
+        "gemini_429": rejected,
+        "retries": sum(v for k, v in counters.items() if k.startswith("retries_total")),
+        "prompt_tokens": gemini["prompt_tokens"],
+        "output_tokens": gemini["output_tokens"],
+        "prompt_tokens_per_call": round(gemini["prompt_tokens"] / (calls - rejected), 1) if calls > rejected else 0.0,
+        "history_tokens_max": max(history_tokens, default=0),
+        "answer_cache_hit_ratio": round(cache_hits / len(turn_times), 4) if turn_times else 0.0,
+    })
+    config = {
+        "sessions": args.sessions, "script": os.path.basename(args.script), "pdf_pages": args.pages if not args.pdf else None,
+        "gemini_latency": args.gemini_latency, "tokens_per_second": args.tokens_per_second,
+        "output_tokens": args.output_tokens, "error_rate": args.error_rate, "rpm_limit": args.rpm_limit,
+        "rate_limit_rpm": args.rate_limit_rpm,
+    }
+    return {"config": config, "metrics": metrics}
+
+
+def add_arguments(parser):
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="JSON: list ของบทสนทนา (list ของคำถาม)")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--pdf", help="ใช้ PDF จริงแทน PDF จำลอง")
+    parser.add_argument("--pages", type=int, default=40, help="จำนวนหน้าของ PDF จำลอง")
+    parser.add_argument("--rate-limit-rpm", type=float, default=600, help="RATE_LIMIT_RPM ของแอประหว่าง benchmark")
+    parser.add_argument("--timeout", type=float, default=120, help="วินาทีต่อหนึ่ง rerun ของ AppTest")
+    parser.add_argument("--seed", type=int, default=7)
+    fake_gemini.add_arguments(parser)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test workaw (Streamlit) กับ Gemini ปลอม")
+    parser.add_argument("--output", help="เขียนผลเป็น JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    result = run(args)
+    report.print_result("workaw", result)
+    if args.output:
+        report.save_json(args.output, {"workaw": result})
@@ -0,0 +1,17 @@
+"""
+ของที่ใช้ร่วมกันระหว่างประวัติแชทของ line_his2 (session_store.py) และ workaw_chatbot (conversation.py)
+รวมถึง benchmark ที่ต้องนับ token แบบเดียวกับบอท
+
+- SUMMARY_PREFIX / SUMMARY_ACK: คู่ข้อความ user/model ที่ใช้แทน turn เก่าที่ถูกย่อเป็นสรุป
+- estimate_tokens: นับ token แบบประมาณการ (ใช้จำกัดความยาว history และส่งให้ rate limiter)
+
+import เหมือน instrumentation.py คือเพิ่ม root ของ repo เข้า sys.path ก่อน
+"""
+
+SUMMARY_PREFIX = "(สรุปบทสนทนาก่อนหน้า)"
+SUMMARY_ACK = "รับทราบ จะใช้สรุปนี้ประกอบการตอบต่อไป"
+
+
+def estimate_tokens(text):
+    # ประมาณการคร่าวๆ: ภาษาไทยราว 2-3 ตัวอักษรต่อ token
+    return max(1, len(text) // 3)
@@ -0,0 +1,268 @@
+"""
+Instrumentation ที่ใช้ร่วมกันทั้ง line_his2 และ workaw_chatbot
+
+- metrics: counter / histogram / gauge แบบ in-process แล้ว export เป็น Prometheus text format
+- log: structured log (JSON ต่อบรรทัด) แบบ sampled และเขียนบน background thread ไม่บล็อก request
+
+ทั้งสองบอทอยู่คนละโฟลเดอร์ จึง import ไฟล์นี้โดยเพิ่ม root ของ repo เข้า sys.path
+"""
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+NAMESPACE = "chatbot"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key) + list(extra or [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets, recent=500):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=recent)  # ค่าล่าสุด ไว้คำนวณ p50/p95 ใน debug panel
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def percentile(values, pct):
+    """nearest-rank percentile (pct 0-100) ใช้ร่วมกันทั้ง debug panel และ benchmark ทุกตัว"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# --- 📈 Metrics ---
+class Metrics:
+    """
+    เก็บ metric ใน process เดียว (thread-safe)
+
+    - inc(name, value, **labels): counter
+    - observe(name, seconds, **labels) / timer(name, **labels): histogram
+    - set_gauge(name, value, **labels): gauge
+    - register_collector(key, func): func() -> [(name, labels, value), ...] เรียกตอน scrape
+      ใช้กับสถิติที่มีอยู่แล้ว เช่น cache.stats() (ลงทะเบียนซ้ำด้วย key เดิมจะแทนที่ตัวเก่า)
+    """
+
+    def __init__(self, namespace=NAMESPACE, buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _name(self, name):
+        return f"{self.namespace}_{name}"
+
+    def describe(self, name, help_text):
+        self._help[self._name(name)] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(self._name(name), _label_key(labels))] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_collector(self, key, func):
+        with self._lock:
+            self._collectors[key] = func
+
+    def _collect(self):
+        gauges = dict(self._gauges)
+        for key, func in list(self._collectors.items()):
+            try:
+                for name, labels, value in func():
+                    gauges[(self._name(name), _label_key(labels))] = value
+            except Exception as e:
+                log.error("metrics_collector_failed", collector=key, error=str(e))
+        return gauges
+
+    def render_prometheus(self):
+        """ข้อความสำหรับ endpoint /metrics (Prometheus text format 0.0.4)"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(h.counts), h.count, h.sum) for k, h in self._histograms.items()}
+        gauges = self._collect()
+        lines = []
+        typed = set()
+
+        def header(name, metric_type):
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, label_key), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(label_key)} {value}")
+        for (name, label_key), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(label_key)} {value}")
+        for (name, label_key), (counts, count, total) in sorted(histograms.items()):
+            header(name, "histogram")
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(label_key, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(label_key)} {total}")
+            lines.append(f"{name}_count{_format_labels(label_key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """สรุปแบบอ่านง่าย (ใช้ใน Streamlit debug panel)"""
+        with self._lock:
+            timings = {
+                self._short(name, label_key): {
+                    "count": h.count,
+                    "avg": h.sum / h.count if h.count else 0.0,
+                    "p50": percentile(h.recent, 50),
+                    "p95": percentile(h.recent, 95),
+                }
+                for (name, label_key), h in self._histograms.items()
+            }
+            counters = {self._short(name, label_key): value for (name, label_key), value in self._counters.items()}
+        gauges = {self._short(name, label_key): value for (name, label_key), value in self._collect().items()}
+        return {"timings": timings, "counters": counters, "gauges": gauges}
+
+    def _short(self, name, label_key):
+        name = name[len(self.namespace) + 1:]
+        labels = ",".join(f"{k}={v}" for k, v in label_key if k != "app")
+        return f"{name}[{labels}]" if labels else name
+
+
+# --- 📝 Structured log แบบ sampled + async ---
+class StructuredLogger:
+    """
+    เขียน log เป็น JSON ทีละบรรทัดบน background thread (request ไม่ต้องรอ I/O)
+
+    - info(): สุ่มเก็บตาม sample_rate (เช่น 0.1 = เก็บ 10%)
+    - warning() / error(): เก็บทุกครั้ง
+    - คิวเต็มจะทิ้ง log แล้วนับไว้ใน dropped แทนการบล็อก
+    """
+
+    def __init__(self, stream=None, sample_rate=1.0, max_queue=10000):
+        self.stream = stream or sys.stderr
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="structured-log", daemon=True)
+        self._thread.start()
+
+    def _emit(self, level, event, fields):
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def info(self, event, **fields):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            self._emit("info", event, fields)
+
+    def warning(self, event, **fields):
+        self._emit("warning", event, fields)
+
+    def error(self, event, **fields):
+        self._emit("error", event, fields)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                self.stream.flush()
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """รอจนเขียน log ในคิวหมด (ใช้ตอนปิดโปรแกรม / ใน benchmark)"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+
+def _open_log_stream():
+    path = os.getenv("OBS_LOG_FILE", "")
+    return open(path, "a", encoding="utf-8") if path else sys.stderr
+
+
+metrics = Metrics()
+metrics.describe("stage_seconds", "Latency of each request stage in seconds")
+metrics.describe("tokens_total", "Gemini tokens by kind (prompt, output, cached)")
+metrics.describe("retries_total", "Gemini retries by reason")
+metrics.describe("errors_total", "Unhandled errors by stage")
+metrics.describe("reply_truncated_total", "LINE replies cut to fit the 5-message limit")
+metrics.describe("cache_hit_ratio", "Hit ratio of in-process caches")
+
+log = StructuredLogger(
+    stream=_open_log_stream(),
+    sample_rate=float(os.getenv("OBS_LOG_SAMPLE_RATE", "0.1")),
+    max_queue=int(os.getenv("OBS_LOG_QUEUE", "10000")),
+)
+
+
+def record_usage(app, usage_metadata):
+    """นับ token จาก response.usage_metadata ของ Gemini"""
+    if usage_metadata is None:
+        return
+    prompt = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    output = getattr(usage_metadata, "candidates_token_count", 0) or 0
+    cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    metrics.inc("tokens_total", prompt, app=app, kind="prompt")
+    metrics.inc("tokens_total", output, app=app, kind="output")
+    if cached:
+        metrics.inc("tokens_total", cached, app=app, kind="cached")
@@ -0,0 +1,100 @@
+"""
+Benchmark: latency ของ IntentRouter เมื่อจำนวน rule โตขึ้นเป็นหลักพัน
+เทียบกับการวนเช็ค keyword ทีละตัว (แบบ `if keyword in message` ต่อกันไปเรื่อยๆ)
+
+    python bench_intent_router.py --sizes 100,1000,5000,10000 --messages 2000
+    python bench_intent_router.py --table ../workaw_chatbot/workaw/workaw_data.xlsx   # ใช้ตารางจริงเป็นฐาน
+"""
+import argparse
+import random
+import time
+
+import stubs
+from intent_router import IntentRouter, Rule, default_rules, load_rules, normalize
+
+SYLLABLES = ["กา", "รลา", "ค่า", "จ้าง", "งาน", "วัน", "หยุด", "สวัส", "ดิ", "การ", "แรง", "ชด", "เชย",
+             "ทำ", "ล่วง", "เวลา", "พัก", "ร้อง", "ทุกข์", "โทษ", "หญิง", "เด็ก", "ทหาร", "ฝึก", "อบรม"]
+
+
+def make_keyword(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 6)))
+
+
+def make_rules(size, rng, base_rules=()):
+    rules = list(default_rules()) + list(base_rules)
+    while len(rules) < size:
+        keyword = make_keyword(rng)
+        rules.append(Rule(f"faq-{len(rules)}", f"คำตอบของ {keyword}", keywords=[keyword]))
+    return rules
+
+
+def make_messages(rules, count, rng):
+    """ผสมข้อความ: ตรงเป๊ะ, keyword + คำลงท้าย, พิมพ์ผิด 1 ตัว และคำถามที่ไม่มีใน rule"""
+    keywords = [k for rule in rules for k in rule.keywords]
+    messages = []
+    for i in range(count):
+        keyword = rng.choice(keywords)
+        kind = i % 4
+        if kind == 0:
+            messages.append(keyword)
+        elif kind == 1:
+            messages.append(f"{keyword} คืออะไรครับ")
+        elif kind == 2 and len(keyword) > 4:
+            pos = rng.randrange(len(keyword))
+            messages.append(keyword[:pos] + keyword[pos + 1:])
+        else:
+            messages.append(f"อยากรู้ว่าถ้า{make_keyword(rng)}แล้ว{make_keyword(rng)}ต้องทำอย่างไร")
+    return messages
+
+
+def naive_route(rules, message):
+    key = normalize(message)
+    for rule in rules:
+        for keyword in rule.keywords:
+            if normalize(keyword) in key:
+                return rule
+    return None
+
+
+def measure(func, messages):
+    latencies = []
+    for message in messages:
+        started = time.perf_counter()
+        func(message)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name, latencies):
+    print(f"  {name:<8} p50={stubs.percentile(latencies, 50) * 1e6:8.1f}us "
+          f"p95={stubs.percentile(latencies, 95) * 1e6:8.1f}us "
+          f"p99={stubs.percentile(latencies, 99) * 1e6:8.1f}us "
+          f"mean={sum(latencies) / len(latencies) * 1e6:8.1f}us")
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    base_rules = load_rules(args.table) if args.table else []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        rules = make_rules(size, rng, base_rules)
+        started = time.perf_counter()
+        router = IntentRouter(rules)
+        build = time.perf_counter() - started
+        messages = make_messages(rules, args.messages, rng)
+
+        print(f"rules={len(rules)} build={build * 1000:.1f}ms")
+        report("router", measure(router.route, messages))
+        if not args.skip_naive:
+            report("naive", measure(lambda m: naive_route(rules, m), messages))
+        stats = router.stats()
+        print(f"  local_share={stats['local_share']:.1%} by_method={stats['by_method']}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Intent router latency benchmark")
+    parser.add_argument("--sizes", default="100,1000,5000,10000")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--table", help="ตาราง intent จริง (.xlsx/.csv/.json) ใช้เป็น rule ชุดแรก")
+    parser.add_argument("--skip-naive", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    run(parser.parse_args())
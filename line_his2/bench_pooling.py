@@ -0,0 +1,83 @@
+"""
+Benchmark overhead ต่อข้อความ: เปิด ApiClient / GenerativeModel ใหม่ทุกครั้ง (แบบเดิม) เทียบกับใช้ตัวเดียวร่วมกัน
+
+    python bench_pooling.py --messages 500 --threads 8
+
+ใช้ stub LINE server ในเครื่อง (stubs.py) จึงไม่ต้องต่อ API จริง
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi, ReplyMessageRequest, TextMessage
+
+import clients
+import stubs
+
+GENERATION_CONFIG = {"temperature": 1, "top_p": 0.95, "top_k": 64, "max_output_tokens": 2048}
+
+
+def reply_unpooled(configuration, i):
+    started = time.perf_counter()
+    with ApiClient(configuration) as api_client:
+        MessagingApi(api_client).reply_message(
+            ReplyMessageRequest(reply_token=f"token-{i}", messages=[TextMessage(text="ok")])
+        )
+    return time.perf_counter() - started
+
+
+def reply_pooled(configuration, i, pool_size):
+    started = time.perf_counter()
+    clients.get_messaging_api(configuration, pool_size=pool_size).reply_message(
+        ReplyMessageRequest(reply_token=f"token-{i}", messages=[TextMessage(text="ok")])
+    )
+    return time.perf_counter() - started
+
+
+def model_unpooled(_i):
+    started = time.perf_counter()
+    genai.GenerativeModel(model_name="gemini-2.5-flash", generation_config=GENERATION_CONFIG).start_chat(history=[])
+    return time.perf_counter() - started
+
+
+def model_pooled(_i):
+    started = time.perf_counter()
+    clients.get_model("gemini-2.5-flash", GENERATION_CONFIG).start_chat(history=[])
+    return time.perf_counter() - started
+
+
+def report(name, latencies, elapsed):
+    print(f"{name:<22} mean={statistics.mean(latencies) * 1000:7.2f}ms "
+          f"p50={stubs.percentile(latencies, 50) * 1000:7.2f}ms "
+          f"p99={stubs.percentile(latencies, 99) * 1000:7.2f}ms "
+          f"throughput={len(latencies) / elapsed:8.1f}/s")
+
+
+def run_case(name, func, messages, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(func, range(messages)))
+    report(name, latencies, time.perf_counter() - started)
+
+
+def run(args):
+    line_stub = stubs.StubLineServer().start()
+    configuration = Configuration(access_token="bench", host=line_stub.url)
+    genai.configure(api_key="bench")
+
+    run_case("line reply (new)", lambda i: reply_unpooled(configuration, i), args.messages, args.threads)
+    run_case("line reply (pooled)", lambda i: reply_pooled(configuration, i, args.threads * 2), args.messages, args.threads)
+    run_case("gemini model (new)", model_unpooled, args.messages, args.threads)
+    run_case("gemini model (pooled)", model_pooled, args.messages, args.threads)
+
+    clients.close_all()
+    line_stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark client pooling")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    run(parser.parse_args())
@@ -0,0 +1,163 @@
+"""
+Replay benchmark: ยิง webhook ที่บันทึกไว้ (LINE_RECORD_WEBHOOKS=webhooks.jsonl) กลับเข้า /callback
+ตามจังหวะเวลาเดิม แล้วเทียบแบบไม่รวมข้อความ กับ micro-batching หลายขนาด window
+
+    python bench_replay.py webhooks.jsonl --windows 0,150,300,600
+    python bench_replay.py --make-sample sample.jsonl --users 40 --bursts 5   # สร้างข้อมูลจำลองแบบ burst
+
+ใช้ stub LINE server และ Gemini ปลอม (ไม่ต่อ API จริง) รายงานจำนวน Gemini call, reply_message call
+และเวลาตั้งแต่ webhook เข้าจนผู้ใช้ได้คำตอบ (p50/p95/p99)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stubs
+
+# ตัวจับคู่ข้อความกับ reply ใช้ร่วมกับ benchmarks/line_driver.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import report  # noqa: E402
+
+
+def make_records(users, bursts, seed=7):
+    """recording จำลอง: แต่ละ user พิมพ์รัวๆ 1-4 ข้อความต่อ burst ห่างกัน 50-250ms"""
+    rng = random.Random(seed)
+    records = []
+    for user in range(users):
+        t = rng.uniform(0, 2.0)
+        for burst in range(bursts):
+            for i in range(rng.randint(1, 4)):
+                event = stubs.make_message_event(f"U{user:04d}", f"คำถาม {burst}-{i} ของ U{user:04d}")
+                records.append({"ts": t, "body": stubs.make_webhook_body([event])})
+                t += rng.uniform(0.05, 0.25)
+            t += rng.uniform(2.0, 5.0)
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def make_sample(path, users, bursts, seed=7):
+    records = make_records(users, bursts, seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"wrote {len(records)} webhooks to {path}")
+
+
+def to_offsets(records):
+    """[(วินาทีนับจาก webhook แรก, body), ...]"""
+    start = min(r["ts"] for r in records)
+    return [(r["ts"] - start, r["body"]) for r in records]
+
+
+def load_records(path):
+    with open(path, encoding="utf-8") as f:
+        return to_offsets([json.loads(line) for line in f if line.strip()])
+
+
+def load_bot(window_ms, concurrency):
+    os.environ["LINE_ASYNC_WEBHOOK"] = "1"
+    os.environ["LINE_MICRO_BATCH"] = "0" if window_ms is None else "1"
+    os.environ["LINE_BATCH_WINDOW_MS"] = str(window_ms or 0)
+    os.environ["LINE_WORKER_CONCURRENCY"] = str(concurrency)
+    os.environ["LINE_MAX_PENDING_EVENTS"] = "100000"
+    os.environ.pop("LINE_RECORD_WEBHOOKS", None)
+    sys.modules.pop("line_his2", None)
+    import line_his2
+    return line_his2
+
+
+def run_scenario(records, window_ms, args):
+    line_stub = stubs.StubLineServer().start()
+    bot = load_bot(window_ms, args.concurrency)
+    bot.LINE_API_BASE_PATH = line_stub.url
+    bot.app.logger.disabled = True
+
+    gemini_calls = 0
+    calls_lock = threading.Lock()
+    sessions = {}
+
+    def fake_chat(user_id, user_message):
+        nonlocal gemini_calls
+        with calls_lock:
+            gemini_calls += 1
+            session = sessions.setdefault(user_id, stubs.FakeChatSession(args.gemini_latency, args.gemini_jitter))
+        return session.send_message(user_message).text
+
+    bot.chat_with_gemini = fake_chat
+    client = bot.app.test_client()
+    batches = report.track_batches(bot.dispatcher)
+    local = report.track_local_routes(bot.intent_router)
+
+    # เวลาที่ webhook ของแต่ละข้อความเข้ามา และคำถาม (FakeChatSession ทวนคำถามในคำตอบ) ตาม replyToken
+    sent = {}
+    questions = {}
+    sent_lock = threading.Lock()
+
+    def post(body):
+        events = [event for event in json.loads(body)["events"]
+                  if event.get("type") == "message" and event["message"].get("type") == "text"]
+        posted_at = time.perf_counter()
+        client.post("/callback", data=body.encode("utf-8"),
+                    headers={"Content-Type": "application/json", "X-Line-Signature": stubs.sign_body(body)})
+        with sent_lock:
+            for event in events:
+                sent[event["replyToken"]] = posted_at
+                questions[event["replyToken"]] = event["message"]["text"]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for offset, body in records:
+            delay = started + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(post, body)
+    bot.dispatcher.join(timeout=args.timeout)
+    time.sleep(0.2)
+    line_stub.stop()
+
+    questions = {token: text for token, text in questions.items() if text not in local}
+    text_messages = sum(len(payload.get("messages", [])) for _, payload in line_stub.replies)
+    latencies = list(report.answered_latencies(sent, line_stub.replies, batches, questions,
+                                               unanswered_texts=(bot.FALLBACK_REPLY,)).values())
+
+    label = "no-batch" if window_ms is None else f"batch {window_ms}ms"
+    print(f"{label:<13} webhooks={len(sent):4d} gemini_calls={gemini_calls:4d} "
+          f"reply_calls={len(line_stub.replies):4d} text_messages={text_messages:4d} "
+          f"answered={len(latencies):4d} "
+          f"p50={stubs.percentile(latencies, 50):5.2f}s p95={stubs.percentile(latencies, 95):5.2f}s "
+          f"p99={stubs.percentile(latencies, 99):5.2f}s total={time.perf_counter() - started:6.2f}s")
+
+
+def run(args):
+    records = load_records(args.recording)
+    print(f"replay {len(records)} webhooks x{args.speed} speed, concurrency={args.concurrency}, "
+          f"gemini_latency={args.gemini_latency}s\n")
+    run_scenario(records, None, args)
+    for window in args.windows.split(","):
+        run_scenario(records, int(window), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded LINE webhooks")
+    parser.add_argument("recording", nargs="?", help="ไฟล์ jsonl จาก LINE_RECORD_WEBHOOKS")
+    parser.add_argument("--make-sample", metavar="PATH", help="สร้าง recording จำลองแบบ burst แล้วออก")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--windows", default="0,150,300,600", help="batch window (ms) ที่จะลอง คั่นด้วย ,")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--speed", type=float, default=1.0, help="เร่งเวลา replay (2 = เร็วขึ้น 2 เท่า)")
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    if args.make_sample:
+        make_sample(args.make_sample, args.users, args.bursts)
+    elif args.recording:
+        run(args)
+    else:
+        parser.error("ต้องระบุไฟล์ recording หรือ --make-sample")
@@ -0,0 +1,133 @@
+"""
+Load test ของ /callback โดยใช้ stub LINE server และ Gemini ปลอม (ไม่ต่อ API จริง)
+
+    python bench_webhook.py --mode async --messages 500 --clients 32 --gemini-latency 1.0
+    python bench_webhook.py --mode sync  --messages 200 --clients 32
+    python bench_webhook.py --mode async --messages 500 --batch-window-ms 300
+
+รายงาน latency ของ webhook (p50/p95/p99) และจำนวนข้อความที่ตอบกลับได้ต่อวินาที
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+import stubs
+
+QUESTION_PREFIX = "คำถามที่"
+
+
+def load_bot(mode, concurrency, max_pending, window_ms=None):
+    os.environ["LINE_ASYNC_WEBHOOK"] = "1" if mode == "async" else "0"
+    # micro-batching ปิดไว้เป็นค่าเริ่มต้น เพื่อให้ 1 ข้อความ = 1 reply เหมือนผลเดิม
+    os.environ["LINE_MICRO_BATCH"] = "0" if window_ms is None else "1"
+    if window_ms is not None:
+        os.environ["LINE_BATCH_WINDOW_MS"] = str(window_ms)
+    os.environ["LINE_WORKER_CONCURRENCY"] = str(concurrency)
+    os.environ["LINE_MAX_PENDING_EVENTS"] = str(max_pending)
+    sys.modules.pop("line_his2", None)
+    import line_his2
+    return line_his2
+
+
+def post_webhook(url, user_id, text):
+    body = stubs.make_webhook_body([stubs.make_message_event(user_id, text)])
+    request = urllib.request.Request(
+        url,
+        data=body.encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Line-Signature": stubs.sign_body(body)},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.perf_counter() - started, status
+
+
+def answered_count(line_stub):
+    """จำนวนคำถามที่ได้คำตอบแล้ว (reply เดียวอาจตอบหลายคำถามเมื่อเปิด micro-batching)"""
+    with line_stub._lock:
+        payloads = [payload for _, payload in line_stub.replies]
+    return sum(message.get("text", "").count(QUESTION_PREFIX)
+               for payload in payloads for message in payload.get("messages", []))
+
+
+def run(args):
+    line_stub = stubs.StubLineServer().start()
+    bot = load_bot(args.mode, args.concurrency, args.max_pending, args.batch_window_ms)
+    bot.LINE_API_BASE_PATH = line_stub.url
+    bot.app.logger.disabled = True
+
+    # แทน Gemini ด้วย session ปลอมที่หน่วงเวลาตามที่กำหนด
+    sessions = {}
+
+    def fake_chat(user_id, user_message):
+        session = sessions.setdefault(user_id, stubs.FakeChatSession(args.gemini_latency, args.gemini_jitter))
+        return session.send_message(user_message).text
+
+    bot.chat_with_gemini = fake_chat
+
+    server = make_server("127.0.0.1", 0, bot.app, threaded=True)
+    port = server.server_port
+    with ThreadPoolExecutor(max_workers=1) as server_pool:
+        server_pool.submit(server.serve_forever)
+        url = f"http://127.0.0.1:{port}/callback"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as clients:
+            futures = [
+                clients.submit(post_webhook, url, f"U{i % args.users:04d}", f"{QUESTION_PREFIX} {i}")
+                for i in range(args.messages)
+            ]
+            results = [f.result() for f in futures]
+        webhook_done = time.perf_counter()
+
+        accepted = sum(1 for _, status in results if status == 200)
+        deadline = time.time() + args.timeout
+        while answered_count(line_stub) < accepted and time.time() < deadline:
+            time.sleep(0.05)
+        server.shutdown()
+
+    latencies = [lat for lat, _ in results]
+    replies = line_stub.reply_count()
+    answered = answered_count(line_stub)
+    last_reply = line_stub.replies[-1][0] if line_stub.replies else webhook_done
+    elapsed = max(last_reply, webhook_done) - started
+    line_stub.stop()
+
+    print(f"mode={args.mode} messages={args.messages} clients={args.clients} users={args.users} "
+          f"gemini_latency={args.gemini_latency}s concurrency={args.concurrency} "
+          f"batch_window_ms={args.batch_window_ms}")
+    print(f"webhook latency  p50={stubs.percentile(latencies, 50) * 1000:.1f}ms "
+          f"p95={stubs.percentile(latencies, 95) * 1000:.1f}ms "
+          f"p99={stubs.percentile(latencies, 99) * 1000:.1f}ms "
+          f"mean={statistics.mean(latencies) * 1000:.1f}ms")
+    print(f"accepted={accepted} rejected={args.messages - accepted} answered={answered} replies={replies}")
+    print(f"sustained throughput: {answered / elapsed if elapsed else 0:.1f} msg/s over {elapsed:.2f}s")
+    if bot.dispatcher is not None:
+        print(f"dispatcher: {bot.dispatcher.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test LINE webhook")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=32, help="จำนวน connection ที่ยิง webhook พร้อมกัน")
+    parser.add_argument("--users", type=int, default=50, help="จำนวน user_id ที่วนใช้")
+    parser.add_argument("--concurrency", type=int, default=8, help="จำนวน worker ที่คุยกับ Gemini พร้อมกัน")
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--batch-window-ms", type=int, default=None,
+                        help="เปิด micro-batching ด้วย window นี้ (ไม่ใส่ = ปิด)")
+    parser.add_argument("--timeout", type=float, default=300)
+    run(parser.parse_args())
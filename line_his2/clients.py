@@ -0,0 +1,57 @@
+import threading
+
+import google.generativeai as genai
+from linebot.v3.messaging import ApiClient, MessagingApi
+
+# --- 🔌 Client/Model ที่ใช้ร่วมกันทั้ง process ---
+# ApiClient ของ LINE ใช้ urllib3 PoolManager ภายใน (thread-safe, keep-alive)
+# จึงสร้างครั้งเดียวแล้วใช้ซ้ำ แทนการเปิด ApiClient ใหม่ (และ TLS handshake ใหม่) ทุกข้อความ
+
+_lock = threading.Lock()
+_messaging_apis = {}
+_models = {}
+
+
+def get_messaging_api(configuration, pool_size=16, base_path=None):
+    """
+    คืนค่า MessagingApi ตัวเดียวต่อ configuration (connection pool ขนาด pool_size)
+    base_path: URL ของ API แทน https://api.line.me (SDK รุ่นใหม่ไม่อ่าน configuration.host แล้ว)
+    """
+    key = id(configuration)
+    api = _messaging_apis.get(key)
+    if api is None:
+        with _lock:
+            api = _messaging_apis.get(key)
+            if api is None:
+                configuration.connection_pool_maxsize = pool_size
+                api = MessagingApi(ApiClient(configuration))
+                if base_path:
+                    api.line_base_path = base_path
+                _messaging_apis[key] = api
+    return api
+
+
+def _config_key(generation_config):
+    return tuple(sorted((generation_config or {}).items()))
+
+
+def get_model(model_name, generation_config=None):
+    """คืนค่า GenerativeModel ตัวเดียวต่อ (model_name, generation_config) ใช้ร่วมกันทุก user"""
+    key = (model_name, _config_key(generation_config))
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+                _models[key] = model
+    return model
+
+
+def close_all():
+    """ปิด connection pool ทั้งหมด (ตอนปิดโปรแกรม / ใน benchmark)"""
+    with _lock:
+        for api in _messaging_apis.values():
+            api.api_client.close()
+        _messaging_apis.clear()
+        _models.clear()
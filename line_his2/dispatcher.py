@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import log, metrics
+
+
+class AsyncDispatcher:
+    """
+    คิวงาน webhook แบบ non-blocking: /callback แค่ตรวจ signature แล้วโยน event มาที่นี่ก็ตอบ 200 ได้เลย
+
+    - รัน asyncio event loop ใน background thread ของตัวเอง
+    - event ของ user เดียวกันถูกประมวลผลตามลำดับที่เข้ามา (ต่อคิวกันเป็นสาย)
+    - งานที่บล็อก (Gemini, LINE reply) รันบน thread pool ขนาด concurrency
+    - ถ้างานค้างเกิน max_pending จะปฏิเสธ (backpressure) ให้ฝั่ง webhook ตอบ 503 แล้ว LINE ส่งซ้ำทีหลัง
+    - micro-batching (batch_window ไม่ใช่ None): event ของ key เดียวกันที่เข้ามาภายใน batch_window วินาที
+      หรือระหว่างที่งานก่อนหน้าของ key นั้นยังไม่เสร็จ จะถูกรวมแล้วส่งให้ handle_func เป็น list ทีเดียว
+      (ไม่เกิน max_batch_size ต่อ batch)
+    """
+
+    def __init__(self, handle_func, concurrency=8, max_pending=256, batch_window=None, max_batch_size=10):
+        self.handle_func = handle_func
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._tails = {}
+        self._open_batches = {}  # key -> list ของ event ที่ยังรับเพิ่มได้
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="line-worker")
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._run_loop, name="line-dispatcher", daemon=True)
+        self._ready = threading.Event()
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def submit_many(self, keyed_events):
+        """
+        รับ [(key, event), ...] แบบทั้งหมดหรือไม่รับเลย (กัน LINE ส่งซ้ำแล้วได้ event ซ้ำบางส่วน)
+        คืนค่า False เมื่อคิวเต็ม
+        """
+        with self._lock:
+            if self.pending + len(keyed_events) > self.max_pending:
+                self.rejected += len(keyed_events)
+                return False
+            self.pending += len(keyed_events)
+        for key, event in keyed_events:
+            self._loop.call_soon_threadsafe(self._schedule, key, event)
+        return True
+
+    def submit(self, key, event):
+        return self.submit_many([(key, event)])
+
+    def _schedule(self, key, event):
+        if self.batch_window is not None:
+            batch = self._open_batches.get(key)
+            if batch is not None and len(batch) < self.max_batch_size:
+                batch.append(event)
+                return
+            batch = [event]
+            self._open_batches[key] = batch
+        else:
+            batch = None
+        previous = self._tails.get(key)
+        task = self._loop.create_task(self._process(key, previous, event, batch))
+        self._tails[key] = task
+        task.add_done_callback(lambda t, k=key: self._tails.pop(k, None) if self._tails.get(k) is t else None)
+
+    async def _process(self, key, previous, event, batch):
+        size = 1
+        try:
+            if batch is not None and self.batch_window > 0:
+                # เปิด batch ค้างไว้ให้ข้อความที่ตามมาติดๆ เข้ามารวม
+                await asyncio.sleep(self.batch_window)
+            if previous is not None:
+                # รอ event ก่อนหน้าของ user คนเดียวกันให้เสร็จก่อน (ไม่สนว่าสำเร็จหรือพัง)
+                await asyncio.wait([previous])
+            if batch is not None:
+                # ปิด batch: ข้อความที่มาหลังจากนี้จะไปอยู่ batch ถัดไป
+                if self._open_batches.get(key) is batch:
+                    del self._open_batches[key]
+                size = len(batch)
+            async with self._semaphore:
+                await self._loop.run_in_executor(self._executor, self.handle_func, batch if batch is not None else event)
+            with self._lock:
+                self.processed += size
+                self.batches += 1
+        except Exception as e:
+            metrics.inc("errors_total", app="line", stage="dispatcher")
+            log.error("dispatcher_error", key=key, events=size, error=repr(e))
+            with self._lock:
+                self.failed += size
+        finally:
+            with self._lock:
+                self.pending -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "concurrency": self.concurrency,
+                "batch_window": self.batch_window,
+                "max_pending": self.max_pending,
+            }
+
+    def join(self, timeout=None):
+        """รอจนคิวว่าง (ใช้ตอน benchmark / ปิดระบบ)"""
+        done = threading.Event()
+
+        def check():
+            if self.pending == 0:
+                done.set()
+            else:
+                self._loop.call_later(0.01, check)
+
+        self._loop.call_soon_threadsafe(check)
+        return done.wait(timeout)
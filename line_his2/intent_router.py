@@ -0,0 +1,268 @@
+import difflib
+import json
+import os
+import re
+import threading
+from collections import Counter, deque
+
+from instrumentation import log, metrics
+
+# คำลงท้าย/คำถามทั่วไปที่ไม่ใช่เนื้อหา ตัดออกก่อนคิดว่า keyword ครอบคลุมข้อความแค่ไหน
+FILLER_PATTERN = re.compile(
+    r"(ครับผม|ครับ|คับ|ค่ะ|คะ|นะคะ|นะครับ|จ้า|จ้ะ|ฮะ|หน่อย|ด้วย|บ้าง|คืออะไร|อะไร|ยังไง|อย่างไร|ไหม|มั้ย|เหรอ|หรอ)"
+)
+PUNCTUATION_PATTERN = re.compile(r"[\s\?\!\.\,\"'ๆ:;()\-]+")
+
+
+def normalize(text):
+    """ตัดช่องว่าง/เครื่องหมาย (ภาษาไทยไม่เว้นวรรคระหว่างคำ จึงเทียบกันแบบไม่มีช่องว่าง)"""
+    return PUNCTUATION_PATTERN.sub("", text.strip().lower())
+
+
+def char_ngrams(text, n=3):
+    if len(text) < n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class Rule:
+    """
+    intent หนึ่งตัว: keywords (substring), patterns (regex) และ answer ที่ตอบได้ทันทีโดยไม่ต้องถาม Gemini
+    """
+
+    def __init__(self, intent, answer, keywords=(), patterns=(), fuzzy=True):
+        self.intent = intent
+        self.answer = answer
+        self.keywords = [k for k in keywords if normalize(k)]
+        self.patterns = [re.compile(p) for p in patterns]
+        self.fuzzy = fuzzy
+
+
+class RouteResult:
+    def __init__(self, rule, method, score, matched=""):
+        self.rule = rule
+        self.intent = rule.intent
+        self.answer = rule.answer
+        self.method = method  # exact | pattern | keyword | fuzzy
+        self.score = score
+        self.matched = matched
+
+
+# --- 🔎 Aho-Corasick: หา keyword ทุกตัวในข้อความด้วยการสแกนครั้งเดียว ---
+class AhoCorasick:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, word, value):
+        node = 0
+        for ch in word:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((word, value))
+        self._built = False
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, text):
+        """yield (end_index, word, value) ของทุก keyword ที่อยู่ใน text"""
+        if not self._built:
+            self.build()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for word, value in self._output[node]:
+                yield i, word, value
+
+    def __len__(self):
+        return len(self._goto)
+
+
+# --- 🚏 Intent Router ---
+class IntentRouter:
+    """
+    ตอบข้อความที่มีคำตอบตายตัว (ทักทาย, FAQ) ในเครื่องโดยไม่เรียก Gemini
+
+    ลำดับการจับคู่:
+    1. exact: ข้อความ (normalize แล้ว) ตรงกับ keyword
+    2. pattern: regex ของ rule
+    3. keyword: keyword ที่เจอในข้อความผ่าน Aho-Corasick โดยต้องครอบคลุมเนื้อหาอย่างน้อย min_coverage
+       (กันคำถามยาวๆ ที่แค่บังเอิญมีชื่อหัวข้ออยู่ ไม่ให้ถูกตอบด้วยคำตอบสำเร็จรูป)
+    4. fuzzy: ข้อความสั้นที่พิมพ์ผิดเล็กน้อย เทียบกับ keyword ที่มี trigram ร่วมกัน (ratio >= fuzzy_threshold)
+       trigram ที่มีใน keyword เกิน fuzzy_max_postings ตัวถือว่าแยกอะไรไม่ได้ จึงข้ามไป (กัน latency ตอน rule เยอะ)
+    """
+
+    def __init__(self, rules, min_coverage=0.6, fuzzy_threshold=0.8, fuzzy_max_length=40, fuzzy_candidates=5,
+                 fuzzy_max_postings=256):
+        self.rules = list(rules)
+        self.min_coverage = min_coverage
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_max_length = fuzzy_max_length
+        self.fuzzy_candidates = fuzzy_candidates
+        self.fuzzy_max_postings = fuzzy_max_postings
+        self._exact = {}
+        self._patterns = []
+        self._automaton = AhoCorasick()
+        self._ngram_index = {}  # trigram -> [keyword, ...]
+        self._fuzzy_rules = {}  # keyword -> rule
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+        self._compile()
+
+    def _compile(self):
+        for rule in self.rules:
+            for keyword in rule.keywords:
+                key = normalize(keyword)
+                self._exact.setdefault(key, rule)
+                self._automaton.add(key, rule)
+                if rule.fuzzy and key not in self._fuzzy_rules:
+                    self._fuzzy_rules[key] = rule
+                    for gram in char_ngrams(key):
+                        self._ngram_index.setdefault(gram, []).append(key)
+            for pattern in rule.patterns:
+                self._patterns.append((pattern, rule))
+        self._automaton.build()
+
+    def match(self, text):
+        """คืน RouteResult หรือ None (ไม่นับสถิติ)"""
+        key = normalize(text)
+        if not key:
+            return None
+
+        rule = self._exact.get(key)
+        if rule is not None:
+            return RouteResult(rule, "exact", 1.0, key)
+
+        for pattern, rule in self._patterns:
+            if pattern.search(text):
+                return RouteResult(rule, "pattern", 1.0, pattern.pattern)
+
+        content_length = len(FILLER_PATTERN.sub("", key)) or len(key)
+        best = None
+        for _, word, rule in self._automaton.iter_matches(key):
+            if best is None or len(word) > len(best[0]):
+                best = (word, rule)
+        if best is not None:
+            coverage = min(1.0, len(best[0]) / content_length)
+            if coverage >= self.min_coverage:
+                return RouteResult(best[1], "keyword", coverage, best[0])
+
+        if len(key) <= self.fuzzy_max_length and self._fuzzy_rules:
+            # ratio = 2 * ส่วนที่ตรงกัน / (ความยาวรวม) จึงตัด keyword ที่ยาวต่างกันเกินไปทิ้งได้เลย
+            min_len = len(key) * self.fuzzy_threshold / (2 - self.fuzzy_threshold)
+            max_len = len(key) * (2 - self.fuzzy_threshold) / self.fuzzy_threshold
+            shared = Counter()
+            for gram in char_ngrams(key):
+                postings = self._ngram_index.get(gram, ())
+                if len(postings) > self.fuzzy_max_postings:
+                    continue
+                for keyword in postings:
+                    if min_len <= len(keyword) <= max_len:
+                        shared[keyword] += 1
+            best_keyword, best_score = None, 0.0
+            for keyword, _ in shared.most_common(self.fuzzy_candidates):
+                score = difflib.SequenceMatcher(None, key, keyword).ratio()
+                if score > best_score:
+                    best_keyword, best_score = keyword, score
+            if best_keyword is not None and best_score >= self.fuzzy_threshold:
+                return RouteResult(self._fuzzy_rules[best_keyword], "fuzzy", best_score, best_keyword)
+        return None
+
+    def route(self, text):
+        """เหมือน match() แต่นับสถิติว่าตอบในเครื่องกี่ข้อความ ส่งต่อให้ LLM กี่ข้อความ"""
+        result = self.match(text)
+        with self._lock:
+            self.decisions[result.method if result else "llm"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.decisions.values())
+            local = total - self.decisions["llm"]
+            return {
+                "rules": len(self.rules),
+                "total": total,
+                "local": local,
+                "llm": self.decisions["llm"],
+                "local_share": (local / total) if total else 0.0,
+                "by_method": dict(self.decisions),
+            }
+
+
+# --- 📋 โหลดตาราง intent ---
+def default_rules():
+    """คำทักทายเดิมที่เคย hard-code ไว้ใน handle_message"""
+    return [
+        Rule("greeting", "สวัสดี นี่ต้นเองนะ", keywords=["สวัสดี", "นี่ใคร"], patterns=[r"^\s*สวัสดี"], fuzzy=False),
+    ]
+
+
+def rule_from_row(row, index):
+    """
+    แถวของตาราง: ถ้ามีแค่คอลัมน์ context (แบบ workaw_data.xlsx) ใช้บรรทัดแรกเป็นหัวข้อ/keyword และทั้งก้อนเป็นคำตอบ
+    คอลัมน์เสริม: intent, keywords (คั่นด้วย , หรือ |), pattern, answer
+    """
+    context = str(row.get("context") or "").strip()
+    answer = str(row.get("answer") or "").strip() or context
+    if not answer:
+        return None
+    title = " ".join(context.splitlines()[0].split()) if context else ""
+    keywords = [title] if title else []
+    keywords += [k.strip() for k in re.split(r"[,|]", str(row.get("keywords") or "")) if k.strip()]
+    patterns = [p for p in [str(row.get("pattern") or "").strip()] if p]
+    intent = str(row.get("intent") or "").strip() or title or f"row-{index}"
+    if not keywords and not patterns:
+        return None
+    return Rule(intent, answer, keywords=keywords, patterns=patterns)
+
+
+def load_rules(path):
+    """โหลด rule จาก .xlsx / .csv (ผ่าน pandas) หรือ .json (list ของ dict)"""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        import pandas as pd
+        frame = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
+        rows = frame.where(frame.notna(), None).to_dict("records")
+    rules = [rule_from_row(row, i) for i, row in enumerate(rows)]
+    return [rule for rule in rules if rule is not None]
+
+
+def create_intent_router(path=None):
+    """สร้าง router จาก default_rules() + ตารางใน path (ถ้ามีไฟล์) ตั้งค่าผ่าน env LINE_INTENT_*"""
+    rules = default_rules()
+    if path and os.path.exists(path):
+        try:
+            rules += load_rules(path)
+        except Exception as e:
+            metrics.inc("errors_total", app="line", stage="intent_table")
+            log.error("intent_table_error", path=path, error=repr(e))
+    return IntentRouter(
+        rules,
+        min_coverage=float(os.getenv("LINE_INTENT_MIN_COVERAGE", "0.6")),
+        fuzzy_threshold=float(os.getenv("LINE_INTENT_FUZZY_THRESHOLD", "0.8")),
+    )
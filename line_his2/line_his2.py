@@ -1,18 +1,28 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     Configuration,
-    ApiClient,
-    MessagingApi,
     ReplyMessageRequest,
     TextMessage
 )
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
 import google.generativeai as genai
+from google.api_core import exceptions
+import json
 import os
+import random
+import sys
+import time
 from dotenv import load_dotenv
+# instrumentation.py / chat_history.py อยู่ที่ root ของ repo (ใช้ร่วมกับ workaw_chatbot)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import log, metrics, record_usage
+from dispatcher import AsyncDispatcher
+from session_store import create_session_store
+from clients import get_messaging_api, get_model
+from intent_router import create_intent_router
 load_dotenv()
 
 app = Flask(__name__)
@@ -23,7 +33,12 @@ handler = WebhookHandler('')
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Gemini Config
-genai.configure(api_key=GEMINI_API_KEY)
+# GEMINI_API_ENDPOINT: ชี้ไป server อื่นแทน API จริง (เช่น benchmarks/fake_gemini.py) ผ่าน transport แบบ rest
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 generation_config = {
     "temperature": 1,
     "top_p": 0.95,
@@ -32,58 +47,244 @@ generation_config = {
     "response_mime_type": "text/plain",
 }
 
+# Webhook Mode: 1 = ตอบ 200 ทันทีแล้วค่อยคุยกับ Gemini เบื้องหลัง, 0 = ทำทุกอย่างใน request แบบเดิม
+ASYNC_WEBHOOK = os.getenv("LINE_ASYNC_WEBHOOK", "1") == "1"
+WORKER_CONCURRENCY = int(os.getenv("LINE_WORKER_CONCURRENCY", "8"))
+MAX_PENDING_EVENTS = int(os.getenv("LINE_MAX_PENDING_EVENTS", "256"))
+LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", str(WORKER_CONCURRENCY * 2)))
+# Micro-batching: ข้อความของ user เดียวกันที่มาติดๆ กันภายใน window จะรวมเป็น Gemini turn เดียว
+MICRO_BATCH = os.getenv("LINE_MICRO_BATCH", "1") == "1"
+BATCH_WINDOW_MS = int(os.getenv("LINE_BATCH_WINDOW_MS", "300"))
+# ชี้ reply ไป server อื่นแทน https://api.line.me (เช่น StubLineServer ใน benchmark)
+LINE_API_BASE_PATH = os.getenv("LINE_API_BASE_PATH", "")
+# บันทึก webhook ที่เข้ามา (jsonl) ไว้ใช้กับ bench_replay.py
+RECORD_WEBHOOKS = os.getenv("LINE_RECORD_WEBHOOKS", "")
+# ข้อจำกัดของ LINE: reply ได้ไม่เกิน 5 ข้อความ, ข้อความละไม่เกิน 5000 ตัวอักษร
+MAX_REPLY_MESSAGES = 5
+MAX_TEXT_LENGTH = 5000
+# batch หนึ่งตอบด้วย reply เดียว: ไม่เกิน 5 ข้อความต่อ batch = คำตอบในเครื่อง/คำตอบ Gemini ไม่ล้น 5 ข้อความ
+# (ข้อความที่เกินจะไปอยู่ batch ถัดไปซึ่งมี reply token ของตัวเอง)
+MAX_BATCH_SIZE = min(int(os.getenv("LINE_MAX_BATCH_SIZE", "5")), MAX_REPLY_MESSAGES)
+# Intent Router: ตาราง FAQ/small talk ที่ตอบได้ทันทีโดยไม่เรียก Gemini (.xlsx/.csv/.json, คอลัมน์ context)
+INTENT_TABLE = os.getenv(
+    "LINE_INTENT_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workaw_chatbot", "workaw", "workaw_data.xlsx"),
+)
+intent_router = create_intent_router(INTENT_TABLE)
+# Gemini โดน 429 / 5xx: ลองใหม่แบบ exponential backoff ไม่เกิน GEMINI_RETRIES ครั้ง
+# (webhook ตอบ 200 ไปแล้ว LINE จะไม่ส่งซ้ำ ถ้ายังไม่ได้ก็ตอบ FALLBACK_REPLY แทนการเงียบ)
+GEMINI_RETRIES = int(os.getenv("LINE_GEMINI_RETRIES", "3"))
+GEMINI_RETRY_BASE = float(os.getenv("LINE_GEMINI_RETRY_BASE", "1.0"))
+GEMINI_RETRY_CAP = float(os.getenv("LINE_GEMINI_RETRY_CAP", "8.0"))
+RETRYABLE_ERRORS = (exceptions.TooManyRequests, exceptions.ServerError)
+FALLBACK_REPLY = "ขออภัย ตอนนี้ระบบตอบไม่ได้ชั่วคราว กรุณาลองถามใหม่อีกครั้งนะ"
+
 @app.route("/callback", methods=['POST'])
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    # ไม่ log body ทั้งก้อน (ช้าและมีข้อความของผู้ใช้) เก็บแค่ขนาดแบบ sampled
+    log.info("webhook_received", bytes=len(body))
+    if RECORD_WEBHOOKS:
+        record_webhook(body, signature)
+
+    if dispatcher is not None:
+        try:
+            with metrics.timer("stage_seconds", app="line", stage="signature_verify"):
+                events = handler.parser.parse(body, signature)
+        except InvalidSignatureError:
+            metrics.inc("webhooks_total", app="line", status="invalid_signature")
+            log.warning("invalid_signature")
+            abort(400)
+        if not dispatcher.submit_many([(event_key(event), event) for event in events]):
+            # คิวเต็ม: ให้ LINE ส่ง webhook ซ้ำทีหลัง
+            metrics.inc("webhooks_total", app="line", status="rejected")
+            log.warning("dispatcher_full", events=len(events))
+            abort(503)
+        metrics.inc("webhooks_total", app="line", status="accepted")
+        return 'OK'
 
     try:
-        handler.handle(body, signature)
+        with metrics.timer("stage_seconds", app="line", stage="webhook_sync"):
+            handler.handle(body, signature)
     except InvalidSignatureError:
-        app.logger.info("Invalid signature.")
+        metrics.inc("webhooks_total", app="line", status="invalid_signature")
+        log.warning("invalid_signature")
         abort(400)
 
+    metrics.inc("webhooks_total", app="line", status="accepted")
     return 'OK'
 
-user_sessions = {}
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    user_id = event.source.user_id
-    user_message = event.message.text
-    reply_text = ""
+def record_webhook(body, signature):
+    with open(RECORD_WEBHOOKS, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": time.time(), "signature": signature, "body": body}, ensure_ascii=False) + "\n")
+
+def event_key(event):
+    """event ของ user เดียวกันต้องทำตามลำดับ จึงใช้ user_id เป็น key ของคิว"""
+    source = getattr(event, "source", None)
+    return getattr(source, "user_id", None) or "anonymous"
+
+def is_text_message(event):
+    return isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent)
 
-    if user_message in ['สวัสดี', 'นี่ใคร'] or user_message.startswith('สวัสดี'):
-        reply_text = "สวัสดี นี่ต้นเองนะ"
-    else:
-        reply_text = chat_with_gemini(user_id, user_message)
+def dispatch_event(event):
+    """รันใน worker ของ dispatcher: ส่ง event ไปยัง handler ตามชนิดเหมือน WebhookHandler"""
+    if is_text_message(event):
+        handle_message(event)
 
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
+def dispatch_batch(events):
+    """รันใน worker ของ dispatcher (โหมด micro-batching): events คือข้อความของ user เดียวกันที่มาติดๆ กัน"""
+    messages = [event for event in events if is_text_message(event)]
+    if messages:
+        handle_message_batch(messages)
+
+if not ASYNC_WEBHOOK:
+    dispatcher = None
+elif MICRO_BATCH:
+    dispatcher = AsyncDispatcher(dispatch_batch, concurrency=WORKER_CONCURRENCY, max_pending=MAX_PENDING_EVENTS,
+                                 batch_window=BATCH_WINDOW_MS / 1000.0, max_batch_size=MAX_BATCH_SIZE)
+else:
+    dispatcher = AsyncDispatcher(dispatch_event, concurrency=WORKER_CONCURRENCY, max_pending=MAX_PENDING_EVENTS)
+
+def split_reply(text, limit=MAX_TEXT_LENGTH):
+    """ตัดคำตอบยาวเป็นหลายข้อความ (ตัดที่บรรทัดใหม่ถ้าทำได้)"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        parts.append(text)
+    return parts
+
+def reply_texts(reply_token, texts):
+    """
+    ส่งหลายข้อความใน reply_message ครั้งเดียว (ไม่เกิน 5 ข้อความ ส่วนเกินต่อท้ายข้อความสุดท้าย)
+    ถ้ายังยาวเกิน MAX_TEXT_LENGTH จะตัดแล้วปิดท้ายด้วย "…" และ log ไว้ (ปกติไม่เกิดเพราะจำกัดขนาด batch แล้ว)
+    """
+    if len(texts) > MAX_REPLY_MESSAGES:
+        tail = "\n".join(texts[MAX_REPLY_MESSAGES - 1:])
+        if len(tail) > MAX_TEXT_LENGTH:
+            metrics.inc("reply_truncated_total", app="line")
+            log.warning("reply_truncated", messages=len(texts), dropped_chars=len(tail) - (MAX_TEXT_LENGTH - 1))
+            tail = tail[:MAX_TEXT_LENGTH - 1] + "…"
+        texts = texts[:MAX_REPLY_MESSAGES - 1] + [tail]
+    line_bot_api = get_messaging_api(configuration, pool_size=LINE_POOL_SIZE, base_path=LINE_API_BASE_PATH or None)
+    with metrics.timer("stage_seconds", app="line", stage="reply_send"):
         line_bot_api.reply_message(
             ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[TextMessage(text=reply_text)]
+                reply_token=reply_token,
+                messages=[TextMessage(text=text) for text in texts]
             )
         )
 
-user_gemini_sessions = {}
+@handler.add(MessageEvent, message=TextMessageContent)
+def handle_message(event):
+    handle_message_batch([event])
+
+def handle_message_batch(events):
+    """
+    ตอบข้อความของ user เดียวกันทั้งชุด: ข้อความที่ intent router ตอบได้จะตอบในเครื่อง
+    ที่เหลือรวมเป็น Gemini turn เดียว แล้วตอบกลับด้วย reply_message ครั้งเดียวผ่าน reply token ของข้อความล่าสุด
+    """
+    user_id = events[0].source.user_id
+    reply_list = []
+    questions = []
+    answered_intents = set()
+
+    for event in events:
+        user_message = event.message.text
+        route = intent_router.route(user_message)
+        if route is not None:
+            metrics.inc("messages_total", app="line", route="local")
+            log.info("route", user=user_id, target="local", intent=route.intent, method=route.method,
+                     score=round(route.score, 2))
+            if route.intent not in answered_intents:
+                answered_intents.add(route.intent)
+                reply_list.extend(split_reply(route.answer))
+        else:
+            metrics.inc("messages_total", app="line", route="llm")
+            log.info("route", user=user_id, target="llm")
+            questions.append(user_message)
+
+    if questions:
+        try:
+            reply_list.extend(split_reply(chat_with_gemini(user_id, "\n".join(questions))))
+        except Exception as e:
+            # reply token ใช้ได้ครั้งเดียวและ LINE จะไม่ส่ง webhook ซ้ำแล้ว จึงตอบขอโทษแทนการเงียบหาย
+            metrics.inc("errors_total", app="line", stage="gemini")
+            log.error("gemini_error", user=user_id, questions=len(questions), error=repr(e))
+            reply_list.append(FALLBACK_REPLY)
+
+    # LINE ไม่รับ reply ที่ไม่มีข้อความ (เช่น Gemini ตอบว่างเปล่า)
+    if reply_list:
+        reply_texts(events[-1].reply_token, reply_list)
+
+def summarize_turns(old_summary, dropped_turns):
+    """สรุป turn เก่าที่ถูกตัดออกจาก history ให้เหลือสั้นๆ (ใช้เมื่อ LINE_SESSION_SUMMARIZE=1)"""
+    transcript = "\n".join(f"ผู้ใช้: {t['user']}\nบอท: {t['model']}" for t in dropped_turns)
+    model = get_model("gemini-2.5-flash")
+    response = model.generate_content(
+        "สรุปบทสนทนาต่อไปนี้ให้สั้นที่สุด เก็บเฉพาะข้อเท็จจริงที่ต้องใช้คุยต่อ\n"
+        f"สรุปเดิม: {old_summary or '-'}\n{transcript}"
+    )
+    return response.text.strip()
+
+# ประวัติแชทของแต่ละ user (มี TTL/LRU และจำกัดความยาว ดู session_store.py)
+session_store = create_session_store(
+    summarizer=summarize_turns if os.getenv("LINE_SESSION_SUMMARIZE", "0") == "1" else None
+)
 
 def get_or_create_chat_session(user_id):
-    if user_id not in user_gemini_sessions:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            generation_config=generation_config,
-        )
-        user_gemini_sessions[user_id] = model.start_chat(history=[])
-    return user_gemini_sessions[user_id]
+    model = get_model("gemini-2.5-flash", generation_config)
+    with metrics.timer("stage_seconds", app="line", stage="session_lookup"):
+        history = session_store.get_history(user_id)
+    return model.start_chat(history=history)
+
 
+def send_with_retry(user_id, user_message):
+    """ส่งข้อความหา Gemini ถ้าโดน 429 / 5xx จะรอแบบ jittered backoff แล้วเริ่ม session ใหม่ (ไม่เกิน GEMINI_RETRIES ครั้ง)"""
+    for attempt in range(GEMINI_RETRIES + 1):
+        chat_session = get_or_create_chat_session(user_id)
+        try:
+            with metrics.timer("stage_seconds", app="line", stage="gemini_call"):
+                return chat_session.send_message(user_message)
+        except RETRYABLE_ERRORS as e:
+            if attempt == GEMINI_RETRIES:
+                raise
+            reason = "rate_limited" if isinstance(e, exceptions.TooManyRequests) else "server_error"
+            metrics.inc("retries_total", app="line", reason=reason)
+            log.warning("gemini_retry", user=user_id, attempt=attempt, reason=reason)
+            time.sleep(random.uniform(0, min(GEMINI_RETRY_CAP, GEMINI_RETRY_BASE * 2 ** attempt)))
 
 def chat_with_gemini(user_id, user_message):
-    chat_session = get_or_create_chat_session(user_id)
-    response = chat_session.send_message(user_message)
-    print('Gemini Response:', response.text)
+    response = send_with_retry(user_id, user_message)
+    record_usage("line", getattr(response, "usage_metadata", None))
+    log.info("gemini_response", user=user_id, chars=len(response.text))
+    session_store.append_turn(user_id, user_message, response.text)
     return response.text
 
+def collect_line_metrics():
+    """สถิติที่แต่ละส่วนนับไว้อยู่แล้ว ดึงมาเป็น gauge ตอน scrape /metrics"""
+    samples = [("sessions", {"app": "line", "kind": k}, v) for k, v in session_store.metrics().items()]
+    router_stats = intent_router.stats()
+    samples.append(("cache_hit_ratio", {"app": "line", "cache": "intent_router"}, router_stats["local_share"]))
+    if dispatcher is not None:
+        samples += [("dispatcher", {"app": "line", "kind": k}, v)
+                    for k, v in dispatcher.stats().items() if isinstance(v, (int, float))]
+    return samples
+
+metrics.register_collector("line", collect_line_metrics)
+
+@app.route("/metrics", methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics/sessions", methods=['GET'])
+def session_metrics():
+    return session_store.metrics()
+
 if __name__ == "__main__":
     app.run(port=5000)
@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from chat_history import SUMMARY_ACK, SUMMARY_PREFIX, estimate_tokens
+from instrumentation import log, metrics
+
+
+def turn_tokens(turn):
+    return estimate_tokens(turn["user"]) + estimate_tokens(turn["model"])
+
+
+# --- Backend: เก็บ record ของแต่ละ user = {"turns": [...], "summary": str, "last_access": float} ---
+class MemoryBackend:
+    def __init__(self):
+        self._records = OrderedDict()
+
+    def load(self, user_id):
+        record = self._records.get(user_id)
+        if record is not None:
+            self._records.move_to_end(user_id)
+        return record
+
+    def save(self, user_id, record):
+        self._records[user_id] = record
+        self._records.move_to_end(user_id)
+
+    def delete(self, user_id):
+        self._records.pop(user_id, None)
+
+    def count(self):
+        return len(self._records)
+
+    def expire(self, older_than):
+        expired = [uid for uid, r in self._records.items() if r["last_access"] < older_than]
+        for uid in expired:
+            del self._records[uid]
+        return len(expired)
+
+    def evict_lru(self, keep):
+        evicted = 0
+        while len(self._records) > keep:
+            self._records.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def history_sizes(self):
+        return [len(r["turns"]) for r in self._records.values()]
+
+
+class SQLiteBackend:
+    """เก็บ session ลงไฟล์ SQLite: อยู่รอดหลัง restart และใช้ร่วมกันได้หลาย gunicorn worker"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id TEXT PRIMARY KEY, turns TEXT NOT NULL, summary TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+    def load(self, user_id):
+        row = self._conn.execute(
+            "SELECT turns, summary, last_access FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"turns": json.loads(row[0]), "summary": row[1], "last_access": row[2]}
+
+    def save(self, user_id, record):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, turns, summary, last_access) VALUES (?, ?, ?, ?)",
+            (user_id, json.dumps(record["turns"], ensure_ascii=False), record["summary"], record["last_access"]),
+        )
+
+    def delete(self, user_id):
+        self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def expire(self, older_than):
+        return self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (older_than,)).rowcount
+
+    def evict_lru(self, keep):
+        return self._conn.execute(
+            "DELETE FROM sessions WHERE user_id IN ("
+            " SELECT user_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (keep,),
+        ).rowcount
+
+    def history_sizes(self):
+        return [row[0] for row in self._conn.execute("SELECT json_array_length(turns) FROM sessions")]
+
+
+# --- 🗂️ Session Store ---
+class SessionStore:
+    """
+    เก็บประวัติแชทของแต่ละ user แทน dict ที่โตไม่หยุด
+
+    - TTL: session ที่ไม่ถูกใช้เกิน ttl_seconds จะถูกลบ
+    - LRU: เก็บได้ไม่เกิน max_sessions คน เกินแล้วลบคนที่ไม่ได้คุยนานที่สุด
+    - จำกัดประวัติต่อ session ด้วย max_turns และ max_history_tokens
+      turn ที่ถูกตัดออกจะถูกสรุปรวมเป็น summary ถ้ามี summarizer(old_summary, dropped_turns) -> str
+    """
+
+    def __init__(self, backend=None, ttl_seconds=3600, max_sessions=1000, max_turns=20,
+                 max_history_tokens=4000, summarizer=None, purge_interval=60, clock=time.time):
+        self.backend = backend or MemoryBackend()
+        self.clock = clock
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_history_tokens = max_history_tokens
+        self.summarizer = summarizer
+        self.purge_interval = purge_interval
+        self.ttl_evictions = 0
+        self.lru_evictions = 0
+        self.trimmed_turns = 0
+        self.summaries = 0
+        self._last_purge = 0.0
+        self._lock = threading.RLock()
+
+    def get_history(self, user_id):
+        """คืนค่า history ในรูปแบบที่ model.start_chat(history=...) รับได้"""
+        with self._lock:
+            record = self._load(user_id)
+        history = []
+        if record["summary"]:
+            history.append({"role": "user", "parts": [f"{SUMMARY_PREFIX} {record['summary']}"]})
+            history.append({"role": "model", "parts": [SUMMARY_ACK]})
+        for turn in record["turns"]:
+            history.append({"role": "user", "parts": [turn["user"]]})
+            history.append({"role": "model", "parts": [turn["model"]]})
+        return history
+
+    def append_turn(self, user_id, user_text, model_text):
+        with self._lock:
+            record = self._load(user_id)
+            record["turns"].append({"user": user_text, "model": model_text})
+            dropped = self._trim(record)
+        # สรุปอยู่นอก lock เพราะอาจต้องเรียก Gemini (event ของ user เดียวกันถูกเรียงลำดับโดย dispatcher อยู่แล้ว)
+        if dropped and self.summarizer is not None:
+            try:
+                record["summary"] = self.summarizer(record["summary"], dropped)
+                self.summaries += 1
+            except Exception as e:
+                metrics.inc("errors_total", app="line", stage="summarize")
+                log.error("summarize_error", user=user_id, turns=len(dropped), error=repr(e))
+        with self._lock:
+            record["last_access"] = self.clock()
+            self.backend.save(user_id, record)
+            self._purge()
+
+    def reset(self, user_id):
+        with self._lock:
+            self.backend.delete(user_id)
+
+    def metrics(self):
+        with self._lock:
+            sizes = self.backend.history_sizes()
+            return {
+                "sessions": len(sizes),
+                "ttl_evictions": self.ttl_evictions,
+                "lru_evictions": self.lru_evictions,
+                "trimmed_turns": self.trimmed_turns,
+                "summaries": self.summaries,
+                "history_turns_total": sum(sizes),
+                "history_turns_max": max(sizes, default=0),
+            }
+
+    def _load(self, user_id):
+        record = self.backend.load(user_id)
+        if record is not None and self.clock() - record["last_access"] > self.ttl_seconds:
+            self.backend.delete(user_id)
+            self.ttl_evictions += 1
+            record = None
+        return record or {"turns": [], "summary": "", "last_access": self.clock()}
+
+    def _trim(self, record):
+        """ตัด turn เก่าออกจนไม่เกิน max_turns / max_history_tokens คืนค่า turn ที่ถูกตัด"""
+        turns = record["turns"]
+        dropped = []
+        while len(turns) > 1 and (len(turns) > self.max_turns
+                                  or sum(turn_tokens(t) for t in turns) > self.max_history_tokens):
+            dropped.append(turns.pop(0))  # เก็บ turn ล่าสุดไว้เสมอ
+        self.trimmed_turns += len(dropped)
+        return dropped
+
+    def _purge(self):
+        now = self.clock()
+        if now - self._last_purge < self.purge_interval and self.backend.count() <= self.max_sessions:
+            return
+        self._last_purge = now
+        self.ttl_evictions += self.backend.expire(now - self.ttl_seconds)
+        self.lru_evictions += self.backend.evict_lru(self.max_sessions)
+
+
+def create_session_store(summarizer=None):
+    """สร้าง SessionStore จาก environment variables"""
+    backend_name = os.getenv("LINE_SESSION_BACKEND", "memory")
+    if backend_name == "sqlite":
+        backend = SQLiteBackend(os.getenv("LINE_SESSION_DB", "line_sessions.sqlite3"))
+    else:
+        backend = MemoryBackend()
+    return SessionStore(
+        backend=backend,
+        ttl_seconds=int(os.getenv("LINE_SESSION_TTL", "3600")),
+        max_sessions=int(os.getenv("LINE_SESSION_MAX", "1000")),
+        max_turns=int(os.getenv("LINE_SESSION_MAX_TURNS", "20")),
+        max_history_tokens=int(os.getenv("LINE_SESSION_MAX_TOKENS", "4000")),
+        summarizer=summarizer,
+    )
@@ -0,0 +1,122 @@
+"""
+ตัวจำลองสำหรับ benchmark/load test แบบไม่ต้องต่อ API จริง
+
+- StubLineServer: HTTP server ที่ทำตัวเป็น LINE Messaging API (รับ /v2/bot/message/reply)
+- FakeChatSession: แทน ChatSession ของ Gemini โดยหน่วงเวลาตาม latency ที่กำหนด
+- make_webhook_body / sign_body: สร้าง payload และ X-Line-Signature ให้เหมือน LINE ส่งมาจริง
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# percentile อยู่ใน instrumentation.py ที่ root ของ repo (bench_* ใช้ผ่าน stubs.percentile)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import percentile  # noqa: E402,F401
+
+
+class StubLineServer:
+    """latency: วินาทีที่หน่วงก่อนตอบแต่ละ reply (จำลองเวลา round trip ไป LINE)"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.replies = []  # [(timestamp, payload), ...]
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # header กับ body ถูกเขียนแยกกัน 2 ครั้ง ถ้าไม่ปิด Nagle การเขียนครั้งที่ 2 บน connection
+            # keep-alive จะรอ delayed ACK ของฝั่ง client (~40ms) ทำให้ client ที่ reuse connection ดูช้ากว่าจริง
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub._lock:
+                    stub.replies.append((time.perf_counter(), payload))
+                # ReplyMessageResponse ของ SDK รุ่นใหม่ต้องมี sentMessages
+                sent = [{"id": str(random.randint(10**15, 10**16)), "quoteToken": uuid.uuid4().hex}
+                        for _ in payload.get("messages", [])]
+                body = json.dumps({"sentMessages": sent}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reply_count(self):
+        with self._lock:
+            return len(self.replies)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeChatSession:
+    """ตอบกลับหลังหน่วงเวลา latency ± jitter วินาที (จำลองเวลาที่ Gemini ใช้)"""
+
+    def __init__(self, latency=0.8, jitter=0.2, history=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.history = list(history or [])
+
+    def send_message(self, message):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        reply = f"ตอบ: {message}"
+        self.history.append({"role": "user", "parts": [message]})
+        self.history.append({"role": "model", "parts": [reply]})
+        return FakeResponse(reply)
+
+
+def make_message_event(user_id, text):
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": str(random.randint(10**15, 10**16)), "type": "text", "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+
+
+def make_webhook_body(events, destination="Ubench"):
+    return json.dumps({"destination": destination, "events": events}, ensure_ascii=False)
+
+
+def sign_body(body, channel_secret=""):
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
@@ -0,0 +1,18 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# โมดูลของแต่ละบอทเป็นไฟล์ flat ในโฟลเดอร์ของตัวเอง import ได้เหมือนตอนรันจากโฟลเดอร์นั้น
+for path in ("benchmarks", "line_his2", os.path.join("workaw_chatbot", "workaw"), ""):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+
+class FakeClock:
+    """นาฬิกาที่เลื่อนเวลาเองได้ (ส่งเป็น clock= ให้คลาสที่รับ)"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
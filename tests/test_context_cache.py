@@ -0,0 +1,86 @@
+import unittest
+
+import google.generativeai as genai
+
+import fake_gemini
+from conftest import FakeClock
+from context_cache import ContextCacheManager
+
+MODEL = "gemini-2.5-flash"
+DOCUMENT = [{"role": "user", "parts": [{"text": "[CONTEXT]:\n" + "เนื้อหาในเอกสาร " * 400}]}]
+
+
+class ContextCacheTest(unittest.TestCase):
+    """ใช้ SDK ตัวจริงคุยกับ Gemini ปลอม (benchmarks/fake_gemini.py) ผ่าน transport แบบ rest"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fake = fake_gemini.FakeGeminiServer(latency=0.0, jitter=0.0, tokens_per_second=1e6, output_tokens=10).start()
+        genai.configure(api_key="test", transport="rest", client_options={"api_endpoint": cls.fake.url})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+
+    def setUp(self):
+        self.fake.reset()
+        self.fake.cache_min_tokens = 0
+        self.clock = FakeClock()
+        self.fallback = genai.GenerativeModel(model_name=MODEL, system_instruction="rules")
+        self.manager = ContextCacheManager(
+            MODEL, "rules", DOCUMENT, self.fallback, ttl_seconds=600, refresh_margin_seconds=60,
+            clock=self.clock, retry_base_seconds=30, retry_max_seconds=120,
+        )
+
+    def tearDown(self):
+        self.manager.delete()
+
+    def cache_requests(self, verb):
+        return self.fake.stats()["requests"].get(f"cachedContents.{verb}", 0)
+
+    def test_create_then_reuse(self):
+        model = self.manager.get_model()
+        self.assertIsNot(model, self.fallback)
+        self.assertIs(self.manager.get_model(), model)
+        self.assertEqual(self.cache_requests("POST"), 1)
+
+        response = model.start_chat(history=[]).send_message("ถามอะไรก็ได้")
+        self.manager.record_usage(response.usage_metadata)
+        stats = self.manager.stats()
+        self.assertTrue(stats["active"])
+        self.assertGreater(stats["cached_tokens"], 0)
+        self.assertLess(stats["last_usage"]["uncached_tokens"], stats["last_usage"]["cached_tokens"])
+
+    def test_refresh_before_ttl_and_recreate_after_expiry(self):
+        model = self.manager.get_model()
+        self.clock.now += 550  # อยู่ใน refresh margin: ต่ออายุ ไม่สร้างใหม่
+        self.assertIs(self.manager.get_model(), model)
+        self.assertEqual(self.cache_requests("PATCH"), 1)
+        self.assertEqual(self.manager.stats()["refreshes"], 1)
+
+        self.clock.now += 601  # หมดอายุแล้ว: สร้างใหม่
+        self.assertIsNot(self.manager.get_model(), model)
+        self.assertEqual(self.cache_requests("POST"), 2)
+
+    def test_fallback_then_retry_with_backoff(self):
+        self.fake.cache_min_tokens = 10 ** 6  # เอกสารสั้นกว่าขั้นต่ำ: API ตอบ 400
+        self.assertIs(self.manager.get_model(), self.fallback)
+        self.assertEqual(self.manager.stats()["failures"], 1)
+
+        self.clock.now += 10  # ยังไม่ถึงรอบลองใหม่: ไม่เรียก API
+        self.assertIs(self.manager.get_model(), self.fallback)
+        self.assertEqual(self.cache_requests("POST"), 1)
+
+        self.clock.now += 21  # ล้มเหลวรอบสอง: backoff 60 วินาที
+        self.assertIs(self.manager.get_model(), self.fallback)
+        self.assertEqual(self.manager.stats()["retry_in"], 60)
+
+        self.fake.cache_min_tokens = 0
+        self.clock.now += 61
+        self.assertIsNot(self.manager.get_model(), self.fallback)
+        self.assertEqual(self.manager.stats()["failures"], 0)
+        self.assertTrue(self.manager.enabled)
+
+
+if __name__ == "__main__":
+    unittest.main()
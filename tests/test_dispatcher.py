@@ -0,0 +1,139 @@
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+
+import stubs
+from dispatcher import AsyncDispatcher
+
+
+class Recorder:
+    """handle_func ที่จดว่าได้อะไรมา (หน่วงสุ่มเล็กน้อยให้งานของหลาย user สลับกันจริง)"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        with self._lock:
+            self.calls.append(item)
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_events_of_one_key_run_in_order(self):
+        recorder = Recorder(delay=0.01)
+        dispatcher = AsyncDispatcher(recorder, concurrency=4)
+        for i in range(20):
+            for user in ("U1", "U2", "U3"):
+                self.assertTrue(dispatcher.submit(user, (user, i)))
+        self.assertTrue(dispatcher.join(timeout=10))
+        for user in ("U1", "U2", "U3"):
+            self.assertEqual([i for key, i in recorder.calls if key == user], list(range(20)))
+        self.assertEqual(dispatcher.stats()["processed"], 60)
+
+    def test_failure_does_not_block_later_events(self):
+        seen = []
+
+        def handle(event):
+            if event == "bad":
+                raise RuntimeError("boom")
+            seen.append(event)
+
+        dispatcher = AsyncDispatcher(handle)
+        dispatcher.submit_many([("U1", "bad"), ("U1", "good")])
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(seen, ["good"])
+        self.assertEqual((dispatcher.stats()["failed"], dispatcher.stats()["processed"]), (1, 1))
+
+    def test_micro_batch_groups_events_within_window(self):
+        recorder = Recorder()
+        dispatcher = AsyncDispatcher(recorder, batch_window=0.2, max_batch_size=10)
+        dispatcher.submit_many([("U1", "a1"), ("U2", "b1"), ("U1", "a2"), ("U1", "a3")])
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(sorted(recorder.calls), [["a1", "a2", "a3"], ["b1"]])
+        self.assertEqual(dispatcher.stats()["batches"], 2)
+
+    def test_micro_batch_respects_max_batch_size_and_order(self):
+        recorder = Recorder()
+        dispatcher = AsyncDispatcher(recorder, batch_window=0.2, max_batch_size=2)
+        dispatcher.submit_many([("U1", i) for i in range(5)])
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(recorder.calls, [[0, 1], [2, 3], [4]])
+
+    def test_events_arriving_after_window_start_next_batch(self):
+        recorder = Recorder()
+        dispatcher = AsyncDispatcher(recorder, batch_window=0.05)
+        dispatcher.submit("U1", 1)
+        self.assertTrue(dispatcher.join(timeout=5))
+        dispatcher.submit("U1", 2)
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(recorder.calls, [[1], [2]])
+
+    def test_rejects_when_queue_is_full(self):
+        release = threading.Event()
+        dispatcher = AsyncDispatcher(lambda event: release.wait(5), concurrency=1, max_pending=3)
+        self.assertTrue(dispatcher.submit_many([("U1", 1), ("U2", 2)]))
+        # รับทั้งหมดหรือไม่รับเลย: เหลือที่ว่าง 1 แต่ส่งมา 2
+        self.assertFalse(dispatcher.submit_many([("U3", 3), ("U4", 4)]))
+        self.assertTrue(dispatcher.submit("U3", 3))
+        self.assertFalse(dispatcher.submit("U4", 4))
+        self.assertEqual(dispatcher.stats()["rejected"], 3)
+
+        release.set()
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(dispatcher.stats()["processed"], 3)
+        self.assertTrue(dispatcher.submit("U4", 4))
+        self.assertTrue(dispatcher.join(timeout=5))
+
+
+class CallbackBackpressureTest(unittest.TestCase):
+    """/callback ตอบ 503 เมื่อคิวเต็ม (LINE จะส่ง webhook ซ้ำทีหลัง) และไม่รับ event บางส่วน"""
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.update({"GEMINI_API_KEY": "test", "LINE_ASYNC_WEBHOOK": "1", "OBS_LOG_FILE": os.devnull})
+        os.environ.pop("LINE_RECORD_WEBHOOKS", None)
+        sys.modules.pop("line_his2", None)
+        import line_his2
+        cls.bot = line_his2
+        cls.bot.app.logger.disabled = True
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.handled = []
+
+        def handle(event):
+            self.release.wait(5)
+            self.handled.append(event.message.text)
+
+        self.original = self.bot.dispatcher
+        self.bot.dispatcher = AsyncDispatcher(handle, concurrency=1, max_pending=2)
+
+    def tearDown(self):
+        self.release.set()
+        self.bot.dispatcher.join(timeout=5)
+        self.bot.dispatcher = self.original
+
+    def post(self, *texts):
+        body = stubs.make_webhook_body([stubs.make_message_event("U1", text) for text in texts])
+        return self.bot.app.test_client().post(
+            "/callback", data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Line-Signature": stubs.sign_body(body)},
+        )
+
+    def test_full_queue_returns_503(self):
+        self.assertEqual(self.post("หนึ่ง").status_code, 200)
+        self.assertEqual(self.post("สอง", "สาม").status_code, 503)
+        self.assertEqual(self.post("สี่").status_code, 200)
+        self.release.set()
+        self.assertTrue(self.bot.dispatcher.join(timeout=5))
+        self.assertEqual(self.handled, ["หนึ่ง", "สี่"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from conftest import FakeClock
+from model_registry import ModelRegistry
+
+
+class ModelRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.broken = set()
+        self.probed = []
+        self.registry = ModelRegistry(
+            ["preferred", "fallback"], failure_ttl_seconds=300, cooldown_seconds=60,
+            probe_func=self.probe, clock=self.clock,
+        )
+
+    def probe(self, model_name, timeout):
+        self.probed.append(model_name)
+        if model_name in self.broken:
+            raise RuntimeError("model unavailable")
+
+    def test_select_prefers_first_candidate(self):
+        self.assertEqual(self.registry.select(), "preferred")
+
+    def test_rate_limited_model_returns_after_cooldown(self):
+        self.registry.select()
+        self.assertEqual(self.registry.report_failure("preferred", rate_limited=True), "fallback")
+        self.assertEqual(self.registry.current(), "fallback")
+        self.clock.now += 61
+        self.assertEqual(self.registry.current(), "preferred")
+
+    def test_runtime_failure_is_reprobed_after_failure_ttl(self):
+        self.registry.select()
+        self.assertEqual(self.registry.report_failure("preferred", error="500"), "fallback")
+
+        # พ้น cooldown แล้วแต่ผลยังไม่หมดอายุ: ไม่ probe และยังใช้ตัวสำรอง
+        self.clock.now += 120
+        self.probed.clear()
+        self.assertEqual(self.registry.current(), "fallback")
+        self.assertEqual(self.probed, [])
+
+        # ผลหมดอายุ แต่ model ยังพังอยู่: probe แล้วยังใช้ตัวสำรอง
+        self.broken.add("preferred")
+        self.clock.now += 200
+        self.assertEqual(self.registry.current(), "fallback")
+        self.assertEqual(self.probed, ["preferred"])
+
+        # model กลับมาใช้ได้: probe รอบถัดไปผ่าน แล้วกลับไปใช้ตัวที่ต้องการ
+        self.broken.clear()
+        self.clock.now += 301
+        self.assertEqual(self.registry.current(), "preferred")
+        self.assertEqual(self.registry.stats()["healthy"], ["preferred", "fallback"])
+
+
+if __name__ == "__main__":
+    unittest.main()
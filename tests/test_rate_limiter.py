@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from conftest import FakeClock
+from rate_limiter import DeadlineExceeded, MemoryBackend, RateLimiter, SQLiteBackend
+
+# bucket ขนาด 10 เติม 1 ต่อวินาที
+BUCKET = ("model:requests", 10, 1.0)
+
+
+def take(backend, now, amount=1, scope="model"):
+    return backend.try_acquire(scope, [BUCKET + (amount,)], now)
+
+
+class MemoryBackendTest(unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend()
+
+    def setUp(self):
+        self.backend = self.make_backend()
+
+    def test_bucket_starts_full_then_refills_over_time(self):
+        for _ in range(10):
+            self.assertEqual(take(self.backend, 0.0), 0.0)
+        self.assertAlmostEqual(take(self.backend, 0.0), 1.0)
+        self.assertAlmostEqual(take(self.backend, 0.5), 0.5)
+        self.assertEqual(take(self.backend, 1.0), 0.0)
+
+    def test_refill_is_capped_at_capacity(self):
+        self.assertEqual(take(self.backend, 0.0, amount=10), 0.0)
+        self.assertEqual(take(self.backend, 1000.0, amount=10), 0.0)
+        self.assertAlmostEqual(take(self.backend, 1000.0), 1.0)
+
+    def test_request_larger_than_bucket_waits_for_full_bucket(self):
+        take(self.backend, 0.0, amount=4)
+        self.assertAlmostEqual(take(self.backend, 0.0, amount=50), 4.0)
+        self.assertEqual(take(self.backend, 4.0, amount=50), 0.0)
+
+    def test_denied_request_does_not_consume_tokens(self):
+        take(self.backend, 0.0, amount=10)
+        take(self.backend, 0.0, amount=5)
+        self.assertEqual(take(self.backend, 5.0, amount=5), 0.0)
+
+    def test_cooldown_blocks_scope_and_keeps_the_longest(self):
+        self.backend.set_cooldown("model", 30.0)
+        self.backend.set_cooldown("model", 20.0)
+        self.assertAlmostEqual(take(self.backend, 10.0), 20.0)
+        self.assertEqual(take(self.backend, 10.0, scope="other"), 0.0)
+        self.assertEqual(take(self.backend, 30.0), 0.0)
+
+
+class SQLiteBackendTest(MemoryBackendTest):
+    def make_backend(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "limiter.sqlite3")
+        return SQLiteBackend(self.path)
+
+    def tearDown(self):
+        self.backend._conn.close()
+        self.tmp.cleanup()
+
+    def test_state_is_shared_between_connections(self):
+        other = SQLiteBackend(self.path)  # เหมือนอีก process ที่เปิดไฟล์เดียวกัน
+        try:
+            self.assertEqual(take(self.backend, 0.0, amount=10), 0.0)
+            self.assertAlmostEqual(take(other, 0.0), 1.0)
+            other.set_cooldown("model", 50.0)
+            self.assertAlmostEqual(take(self.backend, 20.0), 30.0)
+        finally:
+            other._conn.close()
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # burst 10 วินาที: 10 request (เติม 1 ต่อวินาที) และ 1000 token (เติม 100 ต่อวินาที)
+        self.limiter = RateLimiter(rpm=60, tpm=6000, clock=self.clock, burst_seconds=10.0)
+
+    def test_burst_then_deadline_then_refill(self):
+        for _ in range(10):
+            self.assertEqual(self.limiter.acquire("model"), 0.0)
+        with self.assertRaises(DeadlineExceeded):
+            self.limiter.acquire("model", deadline=self.clock.now + 0.5)
+        self.clock.now += 1
+        self.assertEqual(self.limiter.acquire("model"), 0.0)
+        self.assertEqual(self.limiter.stats()["granted"], 11)
+        self.assertEqual(self.limiter.stats()["timeouts"], 1)
+
+    def test_token_bucket_limits_large_prompts(self):
+        self.assertEqual(self.limiter.acquire("model", tokens=800), 0.0)
+        with self.assertRaises(DeadlineExceeded):
+            self.limiter.acquire("model", tokens=800, deadline=self.clock.now + 5)
+        self.clock.now += 6
+        self.assertEqual(self.limiter.acquire("model", tokens=800), 0.0)
+
+    def test_buckets_are_per_model(self):
+        for _ in range(10):
+            self.limiter.acquire("model")
+        self.assertEqual(self.limiter.acquire("other", deadline=self.clock.now), 0.0)
+
+    def test_penalize_blocks_until_cooldown_ends(self):
+        self.limiter.penalize("model", 30)
+        with self.assertRaises(DeadlineExceeded):
+            self.limiter.acquire("model", deadline=self.clock.now + 29)
+        self.clock.now += 30
+        self.assertEqual(self.limiter.acquire("model"), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from conftest import FakeClock
+from session_store import MemoryBackend, SessionStore, SQLiteBackend
+
+
+class MemorySessionStoreTest(unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend()
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = SessionStore(
+            backend=self.make_backend(), ttl_seconds=60, max_sessions=2, max_turns=3,
+            max_history_tokens=10 ** 6, purge_interval=3600, clock=self.clock,
+        )
+
+    def say(self, user_id, text):
+        self.store.get_history(user_id)
+        self.store.append_turn(user_id, text, f"ตอบ {text}")
+        self.clock.now += 1
+
+    def users(self):
+        return [uid for uid in ("U1", "U2", "U3") if self.store.backend.load(uid) is not None]
+
+    def test_history_kept_within_ttl(self):
+        self.say("U1", "สวัสดี")
+        self.clock.now += 30
+        history = self.store.get_history("U1")
+        self.assertEqual([part["parts"][0] for part in history], ["สวัสดี", "ตอบ สวัสดี"])
+        self.assertEqual(self.store.ttl_evictions, 0)
+
+    def test_expired_session_starts_empty(self):
+        self.say("U1", "สวัสดี")
+        self.clock.now += 61
+        self.assertEqual(self.store.get_history("U1"), [])
+        self.assertEqual(self.store.ttl_evictions, 1)
+
+    def test_purge_expires_idle_sessions_of_other_users(self):
+        self.say("U1", "สวัสดี")
+        self.clock.now += 3600  # พ้นทั้ง TTL และ purge_interval
+        self.say("U2", "ถามหน่อย")
+        self.assertEqual(self.users(), ["U2"])
+        self.assertEqual(self.store.ttl_evictions, 1)
+
+    def test_lru_evicts_least_recently_used(self):
+        self.say("U1", "หนึ่ง")
+        self.say("U2", "สอง")
+        self.say("U1", "หนึ่งอีกที")  # U1 ใช้ล่าสุด: U2 กลายเป็นคนที่ไม่ได้คุยนานที่สุด
+        self.say("U3", "สาม")
+        self.assertEqual(self.users(), ["U1", "U3"])
+        self.assertEqual(self.store.lru_evictions, 1)
+
+    def test_history_trimmed_to_max_turns(self):
+        for i in range(5):
+            self.say("U1", f"ข้อ {i}")
+        history = self.store.get_history("U1")
+        self.assertEqual([part["parts"][0] for part in history[::2]], ["ข้อ 2", "ข้อ 3", "ข้อ 4"])
+        self.assertEqual(self.store.trimmed_turns, 2)
+
+
+class SQLiteSessionStoreTest(MemorySessionStoreTest):
+    def make_backend(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        return SQLiteBackend(os.path.join(self.tmp.name, "sessions.sqlite3"))
+
+    def tearDown(self):
+        self.store.backend._conn.close()
+        self.tmp.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from retrieval import tokenize
+
+# คำลงท้ายที่ไม่เปลี่ยนความหมายของคำถาม
+POLITE_SUFFIX_PATTERN = re.compile(r"(ครับผม|ครับ|ค่ะ|คะ|นะคะ|นะครับ|จ้า|จ้ะ|ฮะ|คับ)$")
+PUNCTUATION_PATTERN = re.compile(r"[\s\?\!\.\,\"'ๆ]+")
+
+
+def normalize_question(text):
+    text = text.strip().lower()
+    text = PUNCTUATION_PATTERN.sub(" ", text).strip()
+    while True:
+        stripped = POLITE_SUFFIX_PATTERN.sub("", text).strip()
+        if stripped == text:
+            return " ".join(text.split())
+        text = stripped
+
+
+def question_vector(question):
+    """
+    คำเดี่ยว + คู่คำที่ติดกัน (bigram) เพื่อให้ลำดับคำมีผล
+    เช่น "rgb to cmyk" กับ "cmyk to rgb" มีคำเดี่ยวชุดเดียวกันแต่ไม่มี bigram ร่วมกันเลย
+    """
+    tokens = tokenize(normalize_question(question))
+    return Counter(tokens) + Counter(zip(tokens, tokens[1:]))
+
+
+def cosine_similarity(a, b):
+    common = set(a) & set(b)
+    if not common:
+        return 0.0
+    dot = sum(a[t] * b[t] for t in common)
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class CachedAnswer:
+    def __init__(self, question, answer, doc_hash):
+        self.question = question
+        self.answer = answer
+        self.doc_hash = doc_hash
+        self.vector = question_vector(question)
+        self.created_at = time.time()
+        self.hits = 0
+
+
+# --- 💾 Answer Cache (ใช้ร่วมกันทุก session) ---
+class AnswerCache:
+    """
+    cache คำตอบของคำถามที่ถามซ้ำบ่อย วางไว้หน้า send_message_with_retry
+
+    - exact match: key = hash(คำถามที่ normalize แล้ว + hash ของเอกสาร) (ค่าเริ่มต้น)
+    - near-duplicate: เปิดเมื่อ similarity_threshold < 1.0 ใช้ cosine ของคำเดี่ยว + bigram (ดู question_vector)
+      คำถามที่ใช้คำเดียวกันแต่สลับลำดับ/เปลี่ยนคำสำคัญคำเดียวให้ความหมายต่างกันได้ จึงควรตั้งไว้สูง (>= 0.95)
+    - key ไม่รวมประวัติแชท ผู้เรียกต้องใช้ cache เฉพาะคำถามที่ไม่อ้างถึง turn ก่อนหน้า
+    - ลบด้วย TTL และ LRU (ไม่เกิน max_entries)
+    """
+
+    def __init__(self, max_entries=500, ttl_seconds=24 * 3600, similarity_threshold=1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question, doc_hash):
+        return hashlib.sha256(f"{doc_hash}\n{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, question, doc_hash):
+        """คืนค่า CachedAnswer หรือ None"""
+        key = self.make_key(question, doc_hash)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self.exact_hits += 1
+                return entry
+
+            if self.similarity_threshold < 1.0:
+                vector = question_vector(question)
+                best_key, best_score = None, 0.0
+                for candidate_key, candidate in self._entries.items():
+                    if candidate.doc_hash != doc_hash:
+                        continue
+                    score = cosine_similarity(vector, candidate.vector)
+                    if score > best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    entry = self._entries[best_key]
+                    self._entries.move_to_end(best_key)
+                    entry.hits += 1
+                    self.similar_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, question, doc_hash, answer):
+        key = self.make_key(question, doc_hash)
+        with self._lock:
+            self._entries[key] = CachedAnswer(question, answer, doc_hash)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / total) if total else 0.0,
+            }
+
+    def _expire(self, now):
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
@@ -1,13 +1,24 @@
 import os
-import re
+import sys
 import time
 import random
-import fitz  # PyMuPDF
 import google.generativeai as genai
 from google.api_core import exceptions # เพิ่ม library สำหรับจับ Error
 import streamlit as st
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import dotenv
+# instrumentation.py / chat_history.py อยู่ที่ root ของ repo (ใช้ร่วมกับ line_his2)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import log, metrics, record_usage
+import pdf_loader
+from retrieval import DocumentRetriever
+from answer_cache import AnswerCache
+from pdf_cache import file_sha256
+from context_cache import ContextCacheManager
+import rate_limiter
+from model_registry import ModelRegistry, list_generate_models
+from citations import CitationIndex
+from conversation import ConversationManager, estimate_tokens
 
 # --- พยายาม Import Prompt จากไฟล์ภายนอก ---
 try:
@@ -23,11 +34,64 @@ if not GOOGLE_API_KEY:
     st.error("❌ ไม่พบ API Key กรุณาตรวจสอบไฟล์ .env")
     st.stop()
 
-genai.configure(api_key=GOOGLE_API_KEY)
+# GEMINI_API_ENDPOINT: ชี้ไป server อื่นแทน API จริง (เช่น benchmarks/fake_gemini.py) ผ่าน transport แบบ rest
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GOOGLE_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GOOGLE_API_KEY)
 
 # --- Path Config ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
-pdf_filename = os.path.join(current_dir, "Graphic.pdf")
+pdf_filename = os.getenv("PDF_FILE", os.path.join(current_dir, "Graphic.pdf"))
+
+# --- Retrieval Config ---
+# "retrieval" = ส่งเฉพาะ top-k chunk ที่เกี่ยวข้อง, "full" = ยัดทั้งเอกสารลง system prompt แบบเดิม
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "retrieval")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+RETRIEVAL_USE_VECTOR = os.getenv("RETRIEVAL_USE_VECTOR", "0") == "1"
+
+# --- Citation Config ---
+CITATION_MAX_PAGES = int(os.getenv("CITATION_MAX_PAGES", "4"))  # แนบรูปได้ไม่เกินกี่หน้าต่อคำตอบ
+CITATION_THUMBNAIL_RECENT = int(os.getenv("CITATION_THUMBNAIL_RECENT", "4"))  # ข้อความล่าสุดกี่ข้อความที่แสดง thumbnail ทันที
+
+# --- Conversation Config (ประวัติแชทที่ส่งให้ Gemini) ---
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "3000"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "500"))
+CONVERSATION_SUMMARIZER = os.getenv("CONVERSATION_SUMMARIZER", "local")  # local = ย่อเองไม่เรียก model | gemini
+
+# --- Debug Panel (ตัวเลข latency/token/cache ใน sidebar) ---
+DEBUG_PANEL = os.getenv("DEBUG_PANEL", "1") == "1"
+
+# --- Context Caching Config (ใช้กับโหมด full เท่านั้น) ---
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+
+# --- Rate Limit Config (โควต้าของ Gemini ต่อ model) ---
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "10"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "250000"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | sqlite (ใช้ร่วมกันหลาย process)
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(current_dir, "rate_limit.sqlite3"))
+RATE_LIMIT_DEADLINE = float(os.getenv("RATE_LIMIT_DEADLINE", "90"))
+
+# --- Model Registry Config (เรียงตามลำดับที่อยากใช้ ตัวแรกพังจะสลับไปตัวถัดไป) ---
+CANDIDATE_MODELS = [
+    m.strip() for m in os.getenv(
+        "GEMINI_MODELS", "gemini-2.5-flash,gemini-2.0-flash,gemini-2.0-flash-lite,gemini-flash-latest"
+    ).split(",") if m.strip()
+]
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", os.path.join(current_dir, ".model_registry.json"))
+MODEL_REGISTRY_TTL = int(os.getenv("MODEL_REGISTRY_TTL", str(6 * 3600)))
+MODEL_PROBE_TIMEOUT = float(os.getenv("MODEL_PROBE_TIMEOUT", "5"))
+MODEL_COOLDOWN = float(os.getenv("MODEL_COOLDOWN", "60"))
+
+# error ที่แปลว่า model ตัวนี้ใช้ไม่ได้ (ไม่ใช่ความผิดของคำถาม) ให้สลับไปตัวถัดไป
+MODEL_FAILOVER_ERRORS = (
+    exceptions.NotFound,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
 
 # --- Model Config ---
 generation_config = {
@@ -127,42 +191,7 @@ st.markdown(animated_ocean_css, unsafe_allow_html=True)
 # --- ระบบอ่านไฟล์แบบ Hybrid ---
 @st.cache_resource(show_spinner="กำลังดำน้ำหาข้อมูลในไฟล์ PDF... 🤿")
 def load_pdf_data_hybrid(file_path):
-    text_content = ""
-    page_images_map = {} 
-    
-    if os.path.exists(file_path):
-        try:
-            doc = fitz.open(file_path)
-            for i, page in enumerate(doc):
-                page_num = i + 1
-                text = page.get_text()
-                text_content += f"\n[--- Page {page_num} START ---]\n{text}\n[--- Page {page_num} END ---]\n"
-                
-                # Crop Image Logic
-                image_blocks = [b for b in page.get_text("blocks") if b[6] == 1]
-                saved_images = []
-                if image_blocks:
-                    for img_block in image_blocks:
-                        rect = fitz.Rect(img_block[:4])
-                        if rect.width > 50 and rect.height > 50: 
-                            rect.x0 -= 5; rect.y0 -= 5; rect.x1 += 5; rect.y1 += 5
-                            try:
-                                pix_crop = page.get_pixmap(matrix=fitz.Matrix(3, 3), clip=rect)
-                                saved_images.append(pix_crop.tobytes("png"))
-                            except: pass
-                
-                if not saved_images:
-                    pix_full = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    saved_images.append(pix_full.tobytes("png"))
-
-                if saved_images:
-                    page_images_map[page_num] = saved_images
-            return text_content, page_images_map
-        except Exception as e:
-            print(f"Error: {e}")
-            return "", {}
-    else:
-        return "", {}
+    return pdf_loader.load_pdf_data_hybrid(file_path)
 
 pdf_text, pdf_hybrid_images = load_pdf_data_hybrid(pdf_filename)
 
@@ -170,91 +199,310 @@ if not pdf_text:
     st.warning(f"⚠️ ไม่พบไฟล์ {pdf_filename} กรุณาตรวจสอบว่ามีไฟล์ Graphic.pdf อยู่ในโฟลเดอร์เดียวกับโค้ด")
 
 # --- Prompt System ---
-FULL_SYSTEM_PROMPT = f"""
+SYSTEM_RULES = """
 คุณคือ AI ผู้ช่วยตอบคำถามจากเอกสาร (Document QA) ที่ละเอียดรอบคอบ
 **Strict Rules:**
-1. ตอบโดยใช้ข้อมูลใน [CONTEXT] ด้านล่างนี้เท่านั้น
+1. ตอบโดยใช้ข้อมูลใน [CONTEXT] เท่านั้น
 2. ห้ามใช้ความรู้นอกเหนือจากเอกสาร หรือความรู้ทั่วไป
 3. **หากเนื้อหาในเอกสารมีความยาว ให้ตอบออกมาให้ครบถ้วนทุกประเด็น "ห้ามย่อความ" และ "ห้ามตัดทอนเนื้อหา"** <--- เพิ่มตรงนี้
 4. หากข้อมูลกระจายอยู่หลายหน้า ให้นำมารวมกันให้ครบ
 5. ระบุเลขหน้าเสมอ เช่น [PAGE: 5]
+"""
 
+if RETRIEVAL_MODE == "full":
+    FULL_SYSTEM_PROMPT = f"""{SYSTEM_RULES}
 [CONTEXT]:
 {pdf_text}
 """
+else:
+    # Context จะถูกแนบไปกับแต่ละคำถามแทน (เฉพาะหน้าที่เกี่ยวข้อง)
+    FULL_SYSTEM_PROMPT = SYSTEM_RULES
+# system instruction ถูกส่งไปกับทุก request ที่ไม่ผ่าน context cache (โหมด full = เอกสารทั้งเล่ม)
+SYSTEM_PROMPT_TOKENS = estimate_tokens(FULL_SYSTEM_PROMPT)
+
+@st.cache_resource(show_spinner="กำลังทำดัชนีค้นหาเอกสาร... 🗂️")
+def build_retriever(text, use_vector):
+    return DocumentRetriever(text, use_vector=use_vector)
+
+retriever = build_retriever(pdf_text, RETRIEVAL_USE_VECTOR) if RETRIEVAL_MODE != "full" else None
 
-# --- 🔥 ฟังก์ชันเช็ค Error (Debug Mode) 🔥 ---
+@st.cache_resource
+def build_full_citation_index(text):
+    return CitationIndex.from_context(text)
+
+def build_question_prompt(question):
+    """
+    แนบ [CONTEXT] เฉพาะ top-k chunk (พร้อมป้าย [--- Page N ---]) ไปกับคำถาม
+    คืน (prompt, CitationIndex ของหน้าที่อยู่ใน context) ไว้ตรวจเลขหน้าที่ model อ้าง
+    """
+    if retriever is None:
+        return question, build_full_citation_index(pdf_text)
+    with metrics.timer("stage_seconds", app="workaw", stage="retrieval"):
+        context = retriever.build_context(question, k=RETRIEVAL_TOP_K)
+    return f"[CONTEXT]:\n{context}\n\n[QUESTION]:\n{question}", CitationIndex.from_context(context)
+
+# --- 🧭 เลือก Model: probe พร้อมกันแล้วจำผลไว้ในไฟล์ ไม่ต้อง ping ทีละตัวทุกครั้งที่เปิดแอป ---
 @st.cache_resource(show_spinner="กำลังเชื่อมต่อสมอง AI...")
-def setup_gemini_model():
-    candidate_models = [
-        "gemini-2.5-flash",
-        "gemini-2.0-flash",
-        "gemini-2.0-flash-lite",
-        "gemini-flash-latest"
-    ]  
-    error_logs = [] 
-    for model_name in candidate_models:
-        try:
-            # Test ping
-            test_model = genai.GenerativeModel(
-                model_name=model_name,
-                safety_settings=SAFETY_SETTINGS,
-                generation_config=generation_config
-            )
-            test_model.generate_content("Hi")           
-            
-            # Create Real Model
-            real_model = genai.GenerativeModel(
-                model_name=model_name,
-                safety_settings=SAFETY_SETTINGS,
-                generation_config=generation_config,
-                system_instruction=FULL_SYSTEM_PROMPT
-            )           
-            return real_model, model_name  
-        except Exception as e:
-            error_msg = f"❌ {model_name}: {str(e)}"
-            print(error_msg)
-            error_logs.append(error_msg)
-            continue 
-    
-    st.error("⚠️ เชื่อมต่อไม่ได้ ดูรายละเอียดด้านล่าง:")
-    for err in error_logs:
-        st.code(err, language='text')    
-    return None, None
+def get_model_registry():
+    registry = ModelRegistry(
+        CANDIDATE_MODELS,
+        state_path=MODEL_REGISTRY_PATH,
+        ttl_seconds=MODEL_REGISTRY_TTL,
+        probe_timeout=MODEL_PROBE_TIMEOUT,
+        cooldown_seconds=MODEL_COOLDOWN,
+        list_models_func=list_generate_models,
+    )
+    registry.select()
+    return registry
+
+@st.cache_resource
+def build_model(model_name):
+    return genai.GenerativeModel(
+        model_name=model_name,
+        safety_settings=SAFETY_SETTINGS,
+        generation_config=generation_config,
+        system_instruction=FULL_SYSTEM_PROMPT
+    )
 
-model, active_model_name = setup_gemini_model()
+model_registry = get_model_registry()
+active_model_name = model_registry.current() or model_registry.select()
 
-if model is None:
+if active_model_name is None:
+    st.error("⚠️ เชื่อมต่อไม่ได้ ดูรายละเอียดด้านล่าง:")
+    for name, err in model_registry.errors().items():
+        st.code(f"❌ {name}: {err}", language='text')
     st.error("🚨 ไม่สามารถเชื่อมต่อกับ Gemini ได้เลย (กรุณาเช็ค API Key หรือลองใหม่อีกครั้งใน 1 นาที)")
     st.stop()
 
-# --- 🚀 ฟังก์ชันส่งข้อความแบบมี Retry (แก้ 429) ---
-def send_message_with_retry(chat_session, prompt_text, retries=3):
+# --- 🧊 Context Caching: เก็บ system instruction + เอกสารทั้งเล่มไว้ฝั่ง Gemini ---
+@st.cache_resource(show_spinner="กำลังฝากเอกสารไว้กับ Gemini... 🧊")
+def get_context_cache(model_name):
+    return ContextCacheManager(
+        model_name=model_name,
+        system_instruction=SYSTEM_RULES,
+        contents=[{"role": "user", "parts": [{"text": f"[CONTEXT]:\n{pdf_text}"}]}],
+        fallback_model=build_model(model_name),
+        enabled=RETRIEVAL_MODE == "full" and CONTEXT_CACHE_ENABLED,
+        ttl_seconds=CONTEXT_CACHE_TTL,
+        generation_config=generation_config,
+        safety_settings=SAFETY_SETTINGS,
+    )
+
+context_cache = get_context_cache(active_model_name)
+
+# --- 💾 Answer Cache (ใช้ร่วมกันทุก session ไม่ได้อยู่ใน st.session_state) ---
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500")),
+        ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+        # 1.0 = exact match เท่านั้น (หลัง normalize) ถ้าจะเปิด near-duplicate ควรตั้ง >= 0.95
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "1.0")),
+    )
+
+@st.cache_resource
+def get_document_hash(file_path):
+    return file_sha256(file_path) if os.path.exists(file_path) else ""
+
+answer_cache = get_answer_cache()
+# คำตอบขึ้นกับทั้งเนื้อเอกสารและวิธีเลือก context จึงรวมไว้ใน key
+answer_cache_doc_key = f"{get_document_hash(pdf_filename)}:{RETRIEVAL_MODE}:{RETRIEVAL_TOP_K}"
+
+# --- 🚦 Rate Limiter (ใช้ร่วมกันทุก session / ทุก process ถ้าใช้ sqlite) ---
+@st.cache_resource
+def get_rate_limiter():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        backend = rate_limiter.SQLiteBackend(RATE_LIMIT_DB)
+    else:
+        backend = rate_limiter.MemoryBackend()
+    return rate_limiter.RateLimiter(rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM, backend=backend)
+
+limiter = get_rate_limiter()
+
+# --- 🧵 ประวัติแชท: หน้าต่างนับ token + running summary (หนึ่งตัวต่อ session) ---
+@st.cache_resource
+def build_summary_model(model_name):
+    # ไม่ใส่ system instruction (โหมด full มีเอกสารทั้งเล่มอยู่ในนั้น)
+    return genai.GenerativeModel(model_name=model_name, safety_settings=SAFETY_SETTINGS)
+
+def summarize_with_gemini(old_summary, dropped_turns):
+    transcript = "\n".join(f"ผู้ใช้: {t['user']}\nบอท: {t['model']}" for t in dropped_turns)
+    prompt_text = (
+        "สรุปบทสนทนาต่อไปนี้ให้สั้นที่สุด เก็บเฉพาะหัวข้อที่ถามและข้อเท็จจริงที่ต้องใช้คุยต่อ พร้อมเลขหน้า\n"
+        f"สรุปเดิม: {old_summary or '-'}\n{transcript}"
+    )
+    model_name = model_registry.current()
+    limiter.acquire(model_name, tokens=estimate_tokens(prompt_text), priority=1,
+                    deadline=time.time() + RATE_LIMIT_DEADLINE)
+    return build_summary_model(model_name).generate_content(prompt_text).text
+
+def get_conversation():
+    with metrics.timer("stage_seconds", app="workaw", stage="session_lookup"):
+        if "conversation" not in st.session_state:
+            st.session_state["conversation"] = ConversationManager(
+                max_history_tokens=CONVERSATION_MAX_TOKENS,
+                summary_max_tokens=CONVERSATION_SUMMARY_TOKENS,
+                summarizer=summarize_with_gemini if CONVERSATION_SUMMARIZER == "gemini" else None,
+            )
+        return st.session_state["conversation"]
+
+# --- 🚀 ฟังก์ชันส่งข้อความแบบ Streaming + Retry (แก้ 429) ---
+def stream_message_with_retry(conversation, prompt_text, retries=4, timing=None, prompt_tokens=None, priority=0):
     """
-    พยายามส่งข้อความ และถ้าระบบแจ้งว่า Quota เต็ม (429) จะรอแล้วส่งใหม่
+    ส่งข้อความแบบ streaming แล้ว yield ข้อความทั้งหมดที่ได้แล้วของรอบนี้ทุกครั้งที่ Gemini ส่งท่อนใหม่มา (ผู้เรียกแสดงแทนของเดิม)
+    ก่อนส่งจะต่อคิวใน rate limiter (โควต้าร่วมกันทุก session) ถ้ายังโดน 429 จะ penalize แบบ jittered backoff
+    แล้วเริ่มใหม่ด้วย session ใหม่ (history จาก conversation) ถ้ารอบที่ล้มเหลวแสดงไปบ้างแล้วจะ yield "" ให้ล้างก่อน
+    (รอบใหม่ไม่รับประกันว่าได้ข้อความเดิม โดยเฉพาะเมื่อสลับ model)
+    ถ้า model ที่ใช้อยู่โดน 429 หรือพัง จะสลับไป model ถัดไปใน registry ทันที
+    timing: dict ที่จะถูกใส่ "ttft" (วินาทีจนได้ท่อนแรก), "usage" (usage_metadata ของ response), "model"
+    และ "complete" = True เมื่อได้คำตอบครบ (ถ้าไม่มี key นี้ แปลว่าข้อความที่ได้ไม่ครบ ห้ามเก็บลง cache/ประวัติ)
+    prompt_tokens: token ของ history + คำถาม (system prompt นับเพิ่มให้เองเมื่อ request นั้นไม่ได้ใช้ context cache)
     """
+    started = time.perf_counter()
+    deadline = time.time() + RATE_LIMIT_DEADLINE
+    tokens = prompt_tokens or estimate_tokens(prompt_text)
     for attempt in range(retries):
+        produced = ""
+        model_name = model_registry.current()
         try:
-            response = chat_session.send_message(prompt_text)
-            return response
-        except exceptions.ResourceExhausted as e:
-            wait_time = 10 * (attempt + 1) # รอ 10s, 20s, 30s...
-            st.toast(f"⏳ ระบบกำลังยุ่ง (429) รอสักครู่ {wait_time} วินาที...", icon="🐢")
-            time.sleep(wait_time)
+            # ไม่มี context cache = system prompt (โหมด full คือเอกสารทั้งเล่ม) ไปกับ request นี้ด้วย ต้องนับเข้า TPM
+            cache = get_context_cache(model_name)
+            request_tokens = tokens if cache.active else tokens + SYSTEM_PROMPT_TOKENS
+            waited = limiter.acquire(model_name, tokens=request_tokens, priority=priority, deadline=deadline)
+            metrics.observe("stage_seconds", waited, app="workaw", stage="rate_limit_wait")
+            if waited > 1:
+                st.toast(f"⏳ รอคิวโควต้า {waited:.0f} วินาที", icon="🐢")
+            chat_session = conversation.session(cache.get_model())
+            call_started = time.perf_counter()
+            response = chat_session.send_message(prompt_text, stream=True)
+            for chunk in response:
+                try:
+                    produced += chunk.text
+                except ValueError:
+                    continue  # chunk ที่ไม่มีข้อความ (เช่น finish_reason)
+                if not produced:
+                    continue
+                if timing is not None and "ttft" not in timing:
+                    timing["ttft"] = time.perf_counter() - started
+                    metrics.observe("stage_seconds", timing["ttft"], app="workaw", stage="ttft")
+                yield produced
+            metrics.observe("stage_seconds", time.perf_counter() - call_started, app="workaw", stage="gemini_call")
+            record_usage("workaw", getattr(response, "usage_metadata", None))
+            log.info("gemini_response", model=model_name, attempt=attempt, chars=len(produced))
+            if timing is not None:
+                timing["usage"] = getattr(response, "usage_metadata", None)
+                timing["model"] = model_name
+                timing["complete"] = True
+            return
+        except exceptions.TooManyRequests as e:  # grpc ได้ ResourceExhausted (subclass), rest ได้ TooManyRequests
+            conversation.discard_session()
+            metrics.inc("retries_total", app="workaw", reason="rate_limited")
+            log.warning("gemini_rate_limited", model=model_name, attempt=attempt)
+            cooldown = rate_limiter.backoff_delay(attempt, base=5.0, cap=60.0)
+            limiter.penalize(model_name, cooldown)
+            next_model = model_registry.report_failure(model_name, rate_limited=True)
+            if next_model is not None and next_model != model_name:
+                st.toast(f"🔀 {model_name} โควต้าเต็ม (429) สลับไปใช้ {next_model}", icon="🐬")
+            else:
+                st.toast(f"⏳ ระบบกำลังยุ่ง (429) ต่อคิวใหม่อีกราว {cooldown:.0f} วินาที...", icon="🐢")
+        except MODEL_FAILOVER_ERRORS as e:
+            conversation.discard_session()
+            metrics.inc("retries_total", app="workaw", reason="failover")
+            log.warning("gemini_failover", model=model_name, attempt=attempt, error=str(e))
+            next_model = model_registry.report_failure(model_name, error=str(e))
+            if next_model is None:
+                st.error(f"เกิดข้อผิดพลาด: {e}")
+                return
+            st.toast(f"🔀 {model_name} ใช้งานไม่ได้ สลับไปใช้ {next_model}", icon="🐬")
+        except rate_limiter.DeadlineExceeded:
+            log.warning("rate_limit_deadline", model=model_name)
+            st.error("❌ คิวยาวเกินไป กรุณาลองใหม่ภายหลัง")
+            return
         except Exception as e:
+            log.error("gemini_error", model=model_name, error=str(e))
             st.error(f"เกิดข้อผิดพลาด: {e}")
-            return None
-    
+            return
+        if produced:
+            yield ""  # ล้างข้อความครึ่งๆ กลางๆ ของรอบที่ล้มเหลว
+
     st.error("❌ หมดเวลาเชื่อมต่อ กรุณาลองใหม่ภายหลัง")
-    return None
+
+def collect_workaw_metrics():
+    """สถิติของ cache แต่ละตัว (ใช้ร่วมกันทุก session) ดึงมาเป็น gauge ตอนดู debug panel"""
+    samples = [("cache_hit_ratio", {"app": "workaw", "cache": "answer"}, answer_cache.stats()["hit_rate"])]
+    if hasattr(pdf_hybrid_images, "stats"):
+        samples.append(("cache_hit_ratio", {"app": "workaw", "cache": "page_images"}, pdf_hybrid_images.stats()["hit_rate"]))
+        samples.append(("cache_hit_ratio", {"app": "workaw", "cache": "page_thumbnails"},
+                        pdf_hybrid_images.thumbnail_stats()["hit_rate"]))
+    ctx_stats = context_cache.stats()
+    samples.append(("context_cache_tokens", {"app": "workaw", "kind": "cached"}, ctx_stats["cached_tokens"]))
+    samples.append(("context_cache_tokens", {"app": "workaw", "kind": "uncached"}, ctx_stats["uncached_tokens"]))
+    return samples
+
+metrics.register_collector("workaw", collect_workaw_metrics)
 
 # --- UI & Chat Logic ---
+def show_page_images(pages, key):
+    """
+    แสดง thumbnail ของทุกหน้าที่อ้างถึง กดดูภาพเต็มได้ทีละหน้า
+    รูปดึงจาก cache ของ renderer ทุกครั้ง ใน session_state เก็บแค่เลขหน้า
+    """
+    if not pages or not hasattr(pdf_hybrid_images, "submit_thumbnails"):
+        return
+    futures = [(p, pdf_hybrid_images.submit_thumbnails(p)) for p in pages]
+    full_pages = []
+    for (p_num, future), col in zip(futures, st.columns(len(futures))):
+        with col:
+            try:
+                thumbs = future.result(timeout=30)
+            except Exception as e:
+                log.error("render_error", page=p_num, error=str(e))
+                continue
+            for img in thumbs: st.image(img, caption=f"🖼️ หน้า {p_num}", use_container_width=True)
+            if st.toggle("🔍 ภาพเต็ม", key=f"{key}-full-{p_num}"):
+                full_pages.append(p_num)
+    for p_num in full_pages:
+        for img in pdf_hybrid_images.get(p_num, timeout=30):
+            st.image(img, caption=f"หน้า {p_num}", use_container_width=True)
+
 def clear_history():
+    get_conversation().clear()
     st.session_state["messages"] = [{"role": "model", "content": "บุ๋งๆๆ 🫧 สวัสดีค่ะ น้องโลมา AI โปรแกรมคอมพิวเตอร์กราฟิกพร้อมให้บริการแล้วค่า 🐬"}]
     st.rerun()
 
 with st.sidebar:
     st.success(f"⚓ Connected: {active_model_name}")
+    registry_stats = model_registry.stats()
+    if registry_stats["failovers"] or registry_stats["cooling_down"]:
+        st.caption(f"🔀 สลับ model {registry_stats['failovers']} ครั้ง / พักอยู่: {', '.join(registry_stats['cooling_down']) or '-'}")
+    ttft_placeholder = st.empty()
+    if "last_ttft" in st.session_state:
+        ttft_placeholder.caption(f"⚡ Time to first token: {st.session_state['last_ttft']:.2f}s")
+    if hasattr(pdf_hybrid_images, "stats"):
+        img_stats = pdf_hybrid_images.stats()
+        st.caption(f"🖼️ Image cache: {img_stats['entries']} หน้า, {img_stats['bytes'] / 1024 / 1024:.1f} MB, hit {img_stats['hits']} / miss {img_stats['misses']}")
+        thumb_stats = pdf_hybrid_images.thumbnail_stats()
+        st.caption(f"🖼️ Thumbnail cache: {thumb_stats['entries']} หน้า, {thumb_stats['bytes'] / 1024 / 1024:.1f} MB, hit {thumb_stats['hits']} / miss {thumb_stats['misses']}")
+    cache_stats = answer_cache.stats()
+    st.caption(f"💾 Answer cache: {cache_stats['entries']} คำตอบ, hit rate {cache_stats['hit_rate']:.0%} (ตรงกัน {cache_stats['exact_hits']} / ใกล้เคียง {cache_stats['similar_hits']} / miss {cache_stats['misses']})")
+    ctx_stats = context_cache.stats()
+    if ctx_stats["last_usage"]:
+        usage = ctx_stats["last_usage"]
+        st.caption(f"🧊 Tokens ล่าสุด: cached {usage['cached_tokens']} / uncached {usage['uncached_tokens']} / output {usage['output_tokens']}")
+    if ctx_stats["enabled"]:
+        st.caption(f"🧊 Context cache: รวม cached {ctx_stats['cached_tokens']} / uncached {ctx_stats['uncached_tokens']} tokens")
+    conv_stats = get_conversation().stats()
+    st.caption(f"🧵 ประวัติที่ส่ง: {conv_stats['history_tokens']} tokens ({conv_stats['turns']} turn ล่าสุด + สรุป {conv_stats['summarized_turns']} turn)")
+    rl_stats = limiter.stats()
+    st.caption(f"🚦 Rate limit: รอคิว {rl_stats['waiting']} / เฉลี่ยรอ {rl_stats['avg_wait']:.1f}s / 429 {rl_stats['penalties']} ครั้ง")
+    if DEBUG_PANEL:
+        with st.expander("🛠️ Debug metrics"):
+            snapshot = metrics.snapshot()
+            st.table([
+                {"stage": name, "count": t["count"], "p50 (ms)": round(t["p50"] * 1000, 1), "p95 (ms)": round(t["p95"] * 1000, 1)}
+                for name, t in sorted(snapshot["timings"].items())
+            ])
+            st.json({"counters": snapshot["counters"], "gauges": snapshot["gauges"]})
     if st.button("🗑️ ล้างประวัติ"): clear_history()
 
 st.title("✨ น้องโลมา Graphic Bot 🐬🫧")
@@ -262,14 +510,17 @@ st.title("✨ น้องโลมา Graphic Bot 🐬🫧")
 if "messages" not in st.session_state:
     st.session_state["messages"] = [{"role": "model", "content": "บุ๋งๆๆ 🫧 สวัสดีค่ะ น้องโลมา AI โปรแกรมคอมพิวเตอร์กราฟิกพร้อมให้บริการแล้วค่า 🐬"}]
 
-# แสดงประวัติการแชท
-for msg in st.session_state["messages"]:
+# แสดงประวัติการแชท (ข้อความเก่าแสดงรูปเมื่อกดเท่านั้น เวลา rerun จึงไม่โตตามความยาวบทสนทนา)
+messages = st.session_state["messages"]
+for i, msg in enumerate(messages):
     avatar_icon = "🐠" if msg["role"] == "user" else "🐬"
     with st.chat_message(msg["role"], avatar=avatar_icon):
         st.write(msg["content"])
-        if "image_list" in msg:
-             for img_data in msg["image_list"]:
-                st.image(img_data, caption=f"🖼️ ภาพประกอบจากหน้า {msg.get('page_num_ref')}", use_container_width=True)
+        if msg.get("pages"):
+            recent = i >= len(messages) - CITATION_THUMBNAIL_RECENT
+            label = f"🖼️ ภาพประกอบจากหน้า {', '.join(str(p) for p in msg['pages'])}"
+            if recent or st.toggle(label, key=f"msg-{i}-show"):
+                show_page_images(msg["pages"], key=f"msg-{i}")
 
 # ช่องรับข้อความ
 if prompt := st.chat_input("พิมพ์คำถามที่นี่..."):
@@ -277,40 +528,68 @@ if prompt := st.chat_input("พิมพ์คำถามที่นี่..."
     st.chat_message("user", avatar="🐠").write(prompt)
 
     try:
-        # ✅ ตัดประวัติการแชท: เอาแค่ 10 ข้อความล่าสุดเพื่อประหยัด Token
-        recent_history = st.session_state["messages"][-10:] if len(st.session_state["messages"]) > 10 else st.session_state["messages"]
-        
-        history_api = [{"role": m["role"], "parts": [{"text": m["content"]}]} for m in recent_history if "content" in m]
-        
-        chat_session = model.start_chat(history=history_api)
-        strict_prompt = f"{prompt}\n(คำสั่งลับ: ค้นหาคำตอบจาก Context เท่านั้น และระบุเลขหน้า [PAGE: x])"
-        
-        # ✅ เรียกใช้ฟังก์ชัน Retry แทน send_message ปกติ
-        with st.spinner("น้องโลมาแอบไปอ่านหนังสือมาตอบ... 📖"):
-            response = send_message_with_retry(chat_session, strict_prompt)
-        
-        if response:
-            response_text = response.text
-            
-            # Extract Images
-            page_match = re.search(r"\[PAGE:\s*(\d+)\]", response_text)
-            images_to_show = []
-            p_num = None
-            if page_match:
-                try:
-                    p_num = int(page_match.group(1))
-                    if p_num in pdf_hybrid_images: images_to_show = pdf_hybrid_images[p_num]
-                except: pass
-
-            with st.chat_message("model", avatar="🐬"):
-                st.write(response_text)
-                if images_to_show:
-                    for img in images_to_show: st.image(img, caption=f"หน้า {p_num}", use_container_width=True)
-            
+        # ✅ ประวัติแชทถูกจำกัดด้วยจำนวน token (turn เก่าถูกย่อเป็น summary) ดู conversation.py
+        conversation = get_conversation()
+        question_prompt, citation_index = build_question_prompt(prompt)
+        strict_prompt = f"{question_prompt}\n(คำสั่งลับ: ค้นหาคำตอบจาก Context เท่านั้น และระบุเลขหน้า [PAGE: x])"
+
+        with st.chat_message("model", avatar="🐬"):
+            text_placeholder = st.empty()
+            response_text = ""
+            cited_pages = []
+
+            # ✅ ถามซ้ำ: ใช้คำตอบจาก cache ไม่ต้องเรียก Gemini
+            # key ไม่รวมประวัติแชท จึงใช้ cache เฉพาะคำถามแรกของบทสนทนา (คำถามต่อเนื่องอาจอ้างถึง turn ก่อนหน้า)
+            use_answer_cache = not conversation.turns and not conversation.summary
+            cached_answer = answer_cache.get(prompt, answer_cache_doc_key) if use_answer_cache else None
+            if cached_answer is not None:
+                chunks = [cached_answer.answer]
+                timing = {"ttft": 0.0, "complete": True}
+            else:
+                timing = {}
+                chunks = stream_message_with_retry(
+                    conversation,
+                    strict_prompt,
+                    timing=timing,
+                    prompt_tokens=conversation.history_tokens() + estimate_tokens(strict_prompt),
+                )
+
+            with st.spinner("น้องโลมาแอบไปอ่านหนังสือมาตอบ... 📖"):
+                for piece in chunks:
+                    response_text = piece
+                    text_placeholder.markdown(response_text + "▌")
+                    # เจอ [PAGE: x] ที่อยู่ใน context เมื่อไหร่ สั่ง render thumbnail บน thread pool ทันที ไม่ต้องรอตอบจบ
+                    pages, _ = citation_index.resolve(response_text, max_pages=CITATION_MAX_PAGES)
+                    for p_num in pages:
+                        if p_num not in cited_pages:
+                            cited_pages.append(p_num)
+                            if p_num in pdf_hybrid_images: pdf_hybrid_images.submit_thumbnails(p_num)
+            if not timing.get("complete"):
+                # สตรีมขาดกลางทาง (error/หมดเวลา/retry หมด) ไม่แสดงและไม่เก็บคำตอบที่ไม่ครบ
+                response_text = ""
+            text_placeholder.markdown(response_text)
+            cited_pages, rejected_pages = citation_index.resolve(response_text, max_pages=CITATION_MAX_PAGES)
+            if rejected_pages:
+                # ไม่อยู่ใน context หรือเกิน CITATION_MAX_PAGES หน้า
+                log.info("citation_dropped", pages=rejected_pages)
+            with st.spinner("กำลังเตรียมภาพประกอบ... 🖼️"):
+                show_page_images(cited_pages, key=f"msg-{len(st.session_state['messages'])}")
+
+        get_context_cache(timing.get("model", active_model_name)).record_usage(timing.get("usage"))
+        if "ttft" in timing:
+            st.session_state["last_ttft"] = timing["ttft"]
+            ttft_placeholder.caption(f"⚡ Time to first token: {timing['ttft']:.2f}s")
+
+        if response_text:
+            if use_answer_cache and cached_answer is None:
+                answer_cache.put(prompt, answer_cache_doc_key, response_text)
+            # เก็บเป็นประวัติเฉพาะคำถามจริง (ตัด [CONTEXT] และคำสั่งลับออก)
+            conversation.append_turn(strict_prompt, response_text)
+
+            # เก็บแค่เลขหน้า รูปดึงจาก cache ของ renderer ตอนแสดงผล
             msg_data = {"role": "model", "content": response_text}
-            if images_to_show:
-                msg_data["image_list"] = images_to_show
-                msg_data["page_num_ref"] = p_num
+            if cited_pages:
+                msg_data["pages"] = cited_pages
             st.session_state["messages"].append(msg_data)
 
     except Exception as e:
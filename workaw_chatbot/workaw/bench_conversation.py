@@ -0,0 +1,85 @@
+"""
+Benchmark: prompt tokens ต่อ turn ตลอดบทสนทนา 50 turn
+เทียบแบบเดิม (10 ข้อความล่าสุดเต็มๆ) กับ ConversationManager (หน้าต่างนับ token + running summary)
+
+    python bench_conversation.py --turns 50 --answer-chars 2400 --context-chars 6000
+    python bench_conversation.py --max-history-tokens 2000 --csv tokens.csv
+
+ไม่เรียก Gemini: คำตอบเป็นข้อความจำลองยาวตาม --answer-chars (แบบคำตอบที่ "ห้ามย่อความ")
+token นับด้วย estimate_tokens ตัวเดียวกับที่ app.py ใช้ส่งให้ rate limiter
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from conversation import ConversationManager, estimate_tokens
+
+SECRET_INSTRUCTION = "(คำสั่งลับ: ค้นหาคำตอบจาก Context เท่านั้น และระบุเลขหน้า [PAGE: x])"
+TOPICS = ["การตั้งค่าเลเยอร์", "โหมดสี RGB กับ CMYK", "การใช้ Pen Tool", "ความละเอียดของภาพ", "การบันทึกไฟล์ PNG",
+          "การปรับ Curves", "Smart Object", "การทำ Mask", "ตัวอักษรและฟอนต์", "การส่งออกไฟล์สำหรับพิมพ์"]
+
+
+def make_turn(i, rng, answer_chars, context_chars):
+    question = f"{rng.choice(TOPICS)} ทำอย่างไร (คำถามที่ {i + 1})"
+    context = "ข้อมูลในเอกสาร " * (context_chars // 15)
+    strict_prompt = f"[CONTEXT]:\n{context}\n\n[QUESTION]:\n{question}\n{SECRET_INSTRUCTION}"
+    answer = ("ขั้นตอนอย่างละเอียด [PAGE: 12] " * (answer_chars // 30))[:answer_chars]
+    return question, strict_prompt, answer
+
+
+def baseline_tokens(messages, strict_prompt):
+    """โค้ดเดิม: messages[-10:] (รวมคำถามปัจจุบันที่เพิ่ง append) + strict prompt"""
+    recent = messages[-10:] if len(messages) > 10 else messages
+    return sum(estimate_tokens(m["content"]) for m in recent) + estimate_tokens(strict_prompt)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    messages = [{"role": "model", "content": "บุ๋งๆๆ 🫧 สวัสดีค่ะ น้องโลมา AI โปรแกรมคอมพิวเตอร์กราฟิกพร้อมให้บริการแล้วค่า 🐬"}]
+    conversation = ConversationManager(
+        max_history_tokens=args.max_history_tokens, summary_max_tokens=args.summary_tokens
+    )
+    rows = []
+    for i in range(args.turns):
+        question, strict_prompt, answer = make_turn(i, rng, args.answer_chars, args.context_chars)
+        messages.append({"role": "user", "content": question})
+        before = baseline_tokens(messages, strict_prompt)
+        after = conversation.history_tokens() + estimate_tokens(strict_prompt)
+        messages.append({"role": "model", "content": answer})
+        conversation.append_turn(strict_prompt, answer)
+        rows.append((i + 1, before, after))
+
+    print(f"{'turn':>4} {'baseline':>9} {'manager':>9}")
+    for turn, before, after in rows:
+        if turn == 1 or turn % 5 == 0:
+            print(f"{turn:4d} {before:9d} {after:9d}")
+    total_before = sum(r[1] for r in rows)
+    total_after = sum(r[2] for r in rows)
+    print(f"\ntotal    {total_before:9d} {total_after:9d}  ({1 - total_after / total_before:.1%} less)")
+    print(f"mean     {statistics.mean(r[1] for r in rows):9.0f} {statistics.mean(r[2] for r in rows):9.0f}")
+    print(f"max      {max(r[1] for r in rows):9d} {max(r[2] for r in rows):9d}")
+    print(f"manager: {conversation.stats()}")
+    # history ที่เก็บไว้ต้องไม่มี context/คำสั่งลับติดมา
+    leaked = sum(1 for t in conversation.turns if "คำสั่งลับ" in t["user"] or "[CONTEXT]" in t["user"])
+    print(f"turns with leaked instructions: {leaked}")
+
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.write("turn,baseline,manager\n")
+            for turn, before, after in rows:
+                f.write(f"{turn},{before},{after}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt tokens per turn benchmark")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--answer-chars", type=int, default=2400, help="ความยาวคำตอบจำลอง (ตัวอักษร)")
+    parser.add_argument("--context-chars", type=int, default=6000, help="ความยาว [CONTEXT] ที่แนบต่อคำถาม")
+    parser.add_argument("--max-history-tokens", type=int, default=3000)
+    parser.add_argument("--summary-tokens", type=int, default=500)
+    parser.add_argument("--csv", help="บันทึกผลต่อ turn เป็น CSV")
+    parser.add_argument("--seed", type=int, default=7)
+    run(parser.parse_args())
@@ -0,0 +1,130 @@
+"""
+Simulation: throughput และ tail latency ตอนโควต้าเต็ม
+เทียบ retry แบบเดิม (sleep 10s, 20s, 30s หลังโดน 429) กับ RateLimiter + jittered backoff
+
+    python bench_rate_limit.py --clients 20 --requests 10 --quota 10 --window 2
+
+ย่อเวลาลง: โควต้า "ต่อนาที" ของ Gemini ถูกจำลองเป็น --quota request ต่อ --window วินาที
+และเวลารอของโค้ดเดิมถูกย่อด้วยอัตราส่วนเดียวกัน (10s -> 10 * window / 60)
+"""
+import argparse
+import collections
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import percentile
+from rate_limiter import DeadlineExceeded, RateLimiter, call_with_rate_limit
+
+
+class QuotaExceeded(Exception):
+    """แทน google.api_core.exceptions.ResourceExhausted (429)"""
+
+
+class FakeQuotaModel:
+    """จำลอง Gemini ที่ยอมให้ไม่เกิน quota request ต่อ window วินาที (sliding window)"""
+
+    def __init__(self, quota, window, latency):
+        self.quota = quota
+        self.window = window
+        self.latency = latency
+        self.calls = collections.deque()
+        self.rejections = 0
+        self._lock = threading.Lock()
+
+    def generate(self):
+        with self._lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] > self.window:
+                self.calls.popleft()
+            if len(self.calls) >= self.quota:
+                self.rejections += 1
+                raise QuotaExceeded()
+            self.calls.append(now)
+        time.sleep(self.latency)
+        return "ok"
+
+
+def baseline_call(model, scale):
+    """โค้ดเดิมใน app.py: ลอง 3 ครั้ง รอ 10 * (attempt + 1) วินาทีหลังโดน 429"""
+    for attempt in range(3):
+        try:
+            return model.generate()
+        except QuotaExceeded:
+            time.sleep(10 * (attempt + 1) * scale)
+    return None
+
+
+def limiter_call(model, limiter, scale, deadline_seconds):
+    try:
+        return call_with_rate_limit(
+            model.generate, limiter, "sim-model", tokens=1, retry_on=QuotaExceeded,
+            deadline=time.time() + deadline_seconds, base_delay=1.0 * scale * 6, max_delay=30 * scale,
+        )
+    except (QuotaExceeded, DeadlineExceeded):
+        return None
+
+
+def run_strategy(name, call, clients, requests_per_client):
+    latencies = []
+    all_latencies = []  # รวม request ที่ล้มเหลว (เวลาที่ผู้ใช้รอจนเห็น error)
+    failures = 0
+    lock = threading.Lock()
+
+    def client(_):
+        nonlocal failures
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            result = call()
+            elapsed = time.perf_counter() - started
+            with lock:
+                all_latencies.append(elapsed)
+                if result is None:
+                    failures += 1
+                else:
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    def pct(p, values=latencies):
+        return percentile(values, p)
+
+    print(f"{name:<10} ok={len(latencies):4d} failed={failures:4d} "
+          f"throughput={len(latencies) / elapsed:6.2f}/s "
+          f"p50={pct(50):6.2f}s p95={pct(95):6.2f}s p99={pct(99):6.2f}s "
+          f"mean={statistics.mean(latencies) if latencies else 0:6.2f}s "
+          f"p99(all)={pct(99, all_latencies):6.2f}s total={elapsed:6.2f}s")
+
+
+def run(args):
+    scale = args.window / 60.0
+    print(f"quota={args.quota} req / {args.window}s, clients={args.clients} x {args.requests} requests, "
+          f"latency={args.latency}s\n")
+
+    model = FakeQuotaModel(args.quota, args.window, args.latency)
+    run_strategy("baseline", lambda: baseline_call(model, scale), args.clients, args.requests)
+    print(f"{'':<10} 429 ที่ฝั่ง server: {model.rejections}")
+
+    time.sleep(args.window)  # ให้ window ของรอบแรกหมดก่อน
+    model = FakeQuotaModel(args.quota, args.window, args.latency)
+    limiter = RateLimiter(rpm=args.quota * 60.0 / args.window, tpm=10**9, burst_seconds=args.window / 6)
+    run_strategy("limiter", lambda: limiter_call(model, limiter, scale, args.deadline), args.clients, args.requests)
+    print(f"{'':<10} 429 ที่ฝั่ง server: {model.rejections}  limiter: {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rate limiter simulation")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--quota", type=int, default=10, help="จำนวน request ต่อ window")
+    parser.add_argument("--window", type=float, default=2.0, help="ความยาว window (วินาที) แทน 1 นาที")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--deadline", type=float, default=60.0, help="deadline ต่อ request (วินาที)")
+    run(parser.parse_args())
@@ -0,0 +1,94 @@
+"""
+Benchmark: เทียบจำนวน prompt tokens และ latency ระหว่างโหมด full-context (ยัดทั้งเอกสาร)
+กับโหมด retrieval (ส่งเฉพาะ top-k chunk) บนชุดคำถามคงที่
+
+    python bench_retrieval.py                 # เรียก Gemini จริง (ต้องมี GOOGLE_API_KEY)
+    python bench_retrieval.py --dry-run       # นับ token แบบประมาณการ ไม่เรียก API
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chat_history import estimate_tokens
+import pdf_loader
+from retrieval import DocumentRetriever
+
+QUESTIONS = [
+    "คอมพิวเตอร์กราฟิกคืออะไร",
+    "ภาพแบบ Raster กับ Vector ต่างกันอย่างไร",
+    "ระบบสี RGB และ CMYK ใช้งานต่างกันอย่างไร",
+    "ความละเอียดของภาพ (Resolution) หมายถึงอะไร",
+    "ไฟล์ภาพ JPEG PNG GIF มีข้อดีข้อเสียอย่างไร",
+    "หลักการออกแบบกราฟิกมีอะไรบ้าง",
+    "จิตวิทยาของสีคืออะไร",
+    "โปรแกรมที่ใช้สร้างงานกราฟิกมีอะไรบ้าง",
+]
+
+SYSTEM_RULES = "คุณคือ AI ผู้ช่วยตอบคำถามจากเอกสาร ตอบโดยใช้ข้อมูลใน [CONTEXT] เท่านั้น และระบุเลขหน้า [PAGE: x]"
+
+
+def build_prompts(pdf_text, retriever, question, top_k):
+    full_prompt = f"{SYSTEM_RULES}\n[CONTEXT]:\n{pdf_text}\n\n{question}"
+    context = retriever.build_context(question, k=top_k)
+    retrieval_prompt = f"{SYSTEM_RULES}\n[CONTEXT]:\n{context}\n\n[QUESTION]:\n{question}"
+    return {"full": full_prompt, "retrieval": retrieval_prompt}
+
+
+def run(args):
+    pdf_text, _ = pdf_loader.load_pdf_data_hybrid(args.pdf)
+    if not pdf_text:
+        print(f"ไม่พบไฟล์ {args.pdf}")
+        return
+
+    t0 = time.perf_counter()
+    retriever = DocumentRetriever(pdf_text, use_vector=args.vector)
+    print(f"สร้าง index {len(retriever.chunks)} chunks ใน {time.perf_counter() - t0:.2f}s")
+
+    model = None
+    if not args.dry_run:
+        import google.generativeai as genai
+        dotenv.load_dotenv()
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        model = genai.GenerativeModel(args.model, generation_config={"temperature": 0.0, "max_output_tokens": 512})
+
+    results = {"full": {"tokens": [], "latency": []}, "retrieval": {"tokens": [], "latency": []}}
+    for question in QUESTIONS:
+        prompts = build_prompts(pdf_text, retriever, question, args.top_k)
+        for mode, prompt in prompts.items():
+            if model is None:
+                results[mode]["tokens"].append(estimate_tokens(prompt))
+                continue
+            results[mode]["tokens"].append(model.count_tokens(prompt).total_tokens)
+            t0 = time.perf_counter()
+            model.generate_content(prompt)
+            results[mode]["latency"].append(time.perf_counter() - t0)
+
+    print(f"\n{'mode':<10} {'avg tokens':>12} {'avg latency':>12} {'p95 latency':>12}")
+    for mode, data in results.items():
+        avg_tokens = statistics.mean(data["tokens"])
+        if data["latency"]:
+            lat = sorted(data["latency"])
+            avg_lat = f"{statistics.mean(lat):.2f}s"
+            p95_lat = f"{lat[min(len(lat) - 1, int(len(lat) * 0.95))]:.2f}s"
+        else:
+            avg_lat = p95_lat = "-"
+        print(f"{mode:<10} {avg_tokens:>12.0f} {avg_lat:>12} {p95_lat:>12}")
+
+    saving = 1 - statistics.mean(results["retrieval"]["tokens"]) / statistics.mean(results["full"]["tokens"])
+    print(f"\nลด prompt tokens ได้ {saving:.1%}")
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark full-context vs retrieval")
+    parser.add_argument("--pdf", default=os.path.join(here, "Graphic.pdf"))
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--vector", action="store_true", help="เปิดใช้ TF-IDF vector index ร่วมกับ BM25")
+    parser.add_argument("--dry-run", action="store_true", help="ไม่เรียก API นับ token แบบประมาณการ")
+    run(parser.parse_args())
@@ -1,7 +1,11 @@
 import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from model_registry import ModelRegistry, list_generate_models
+
 load_dotenv()
 
 api_key = os.getenv('GOOGLE_API_KEY')
@@ -11,8 +15,13 @@ else:
     genai.configure(api_key=api_key)
     print("กำลังตรวจสอบรายชื่อโมเดลที่ใช้ได้... (กรุณารอสักครู่)")
     try:
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                print(f"- {m.name}")
+        for name in list_generate_models():
+            print(f"- models/{name}")
     except Exception as e:
-        print(f"เกิดข้อผิดพลาด: {e}")
\ No newline at end of file
+        print(f"เกิดข้อผิดพลาด: {e}")
+
+    # python check_models.py gemini-2.5-flash gemini-2.0-flash  -> probe พร้อมกันแล้วบอกผล
+    if len(sys.argv) > 1:
+        registry = ModelRegistry(sys.argv[1:], probe_timeout=float(os.getenv("MODEL_PROBE_TIMEOUT", "5")))
+        for name, result in registry.probe(sys.argv[1:]).items():
+            print(f"{'✅' if result['ok'] else '❌'} {name} {result['error']}")
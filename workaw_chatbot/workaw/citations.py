@@ -0,0 +1,51 @@
+import re
+
+# [PAGE: 5], [PAGE: 5, 7], [PAGE: 5-7], [Page 12]
+CITATION_PATTERN = re.compile(r"\[PAGE:?\s*([\d\s,\-–]+)\]", re.I)
+PAGE_MARKER_PATTERN = re.compile(r"\[--- Page (\d+) START ---\]")
+
+
+def extract_cited_pages(text):
+    """เลขหน้าทุกหน้าที่ถูกอ้างในคำตอบ ตามลำดับที่เจอ (ไม่ซ้ำ)"""
+    pages = []
+    for match in CITATION_PATTERN.finditer(text):
+        for part in re.split(r"\s*,\s*", match.group(1).strip()):
+            bounds = [b for b in re.split(r"\s*[\-–]\s*", part) if b.strip().isdigit()]
+            if not bounds:
+                continue
+            start, end = int(bounds[0]), int(bounds[-1])
+            if end < start or end - start > 20:
+                end = start  # ช่วงกลับด้าน/กว้างผิดปกติ เก็บแค่หน้าแรก
+            for page in range(start, end + 1):
+                if page not in pages:
+                    pages.append(page)
+    return pages
+
+
+# --- 📑 Citation Index ---
+class CitationIndex:
+    """
+    หน้าที่อ้างถึงได้จริงสำหรับคำถามนี้ สร้างจาก [CONTEXT] ที่ส่งให้ model
+    (โหมด retrieval = เฉพาะหน้าที่ถูกดึงมา, โหมด full = ทุกหน้าในเอกสาร)
+    เลขหน้าที่ model อ้างแต่ไม่อยู่ใน context ถือว่าแต่งขึ้นเอง จะไม่แนบรูปให้
+    """
+
+    def __init__(self, pages):
+        self.pages = set(pages)
+
+    @classmethod
+    def from_context(cls, context_text):
+        return cls(int(num) for num in PAGE_MARKER_PATTERN.findall(context_text))
+
+    def __contains__(self, page_num):
+        return page_num in self.pages
+
+    def resolve(self, text, max_pages=None):
+        """คืน (หน้าที่ใช้ได้, หน้าที่ถูกตัดทิ้ง) จากคำตอบ"""
+        valid, rejected = [], []
+        for page in extract_cited_pages(text):
+            if page in self.pages and (max_pages is None or len(valid) < max_pages):
+                valid.append(page)
+            else:
+                rejected.append(page)
+        return valid, rejected
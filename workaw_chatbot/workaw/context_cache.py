@@ -0,0 +1,157 @@
+import datetime
+import threading
+import time
+
+from instrumentation import log, metrics
+
+
+class ContextCacheManager:
+    """
+    ใช้ Gemini context caching กับ system instruction + เอกสารทั้งเล่ม (โหมด full-context)
+    สร้าง cached content ครั้งเดียว ต่ออายุก่อน TTL หมด แล้วแต่ละ turn ส่งแค่ history + คำถาม
+
+    - ถ้าปิดไว้ หรือสร้าง cache ไม่ได้ (model ไม่รองรับ / เอกสารสั้นกว่าขั้นต่ำ / API ล่ม)
+      จะคืน fallback_model (ส่ง system prompt เต็มทุกครั้งแบบเดิม) แล้วลองใหม่แบบ exponential backoff
+      (retry_base_seconds, 2 เท่า, ... ไม่เกิน retry_max_seconds) ไม่ปิดถาวร
+    - caching_api / model_factory ฉีดของปลอมเข้ามาได้ เพื่อทดสอบโดยไม่ต้องต่อ API จริง
+    - นับ token ที่มาจาก cache กับที่ไม่ได้มาจาก cache ต่อ request ผ่าน record_usage()
+    """
+
+    def __init__(self, model_name, system_instruction, contents, fallback_model, enabled=True,
+                 ttl_seconds=3600, refresh_margin_seconds=300, generation_config=None,
+                 safety_settings=None, caching_api=None, model_factory=None, clock=time.time,
+                 retry_base_seconds=30.0, retry_max_seconds=1800.0):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.fallback_model = fallback_model
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.generation_config = generation_config
+        self.safety_settings = safety_settings
+        self.caching_api = caching_api
+        self.model_factory = model_factory
+        self.clock = clock
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.failures = 0      # จำนวนครั้งที่ล้มเหลวติดกัน
+        self.retry_at = 0.0    # ก่อนเวลานี้ไม่เรียก API ของ cache (กำลัง backoff)
+        self.cached_content = None
+        self.cached_model = None
+        self.expires_at = 0.0
+        self.last_error = None
+        self.creates = 0
+        self.refreshes = 0
+        self.requests = 0
+        self.cached_tokens = 0
+        self.uncached_tokens = 0
+        self.last_usage = None
+        self._lock = threading.Lock()
+
+    def _api(self):
+        if self.caching_api is None:
+            from google.generativeai import caching
+            self.caching_api = caching.CachedContent
+        if self.model_factory is None:
+            import google.generativeai as genai
+            self.model_factory = genai.GenerativeModel.from_cached_content
+        return self.caching_api, self.model_factory
+
+    @property
+    def active(self):
+        return self.cached_model is not None
+
+    def get_model(self):
+        """คืน model ที่ผูกกับ cached content (สร้าง/ต่ออายุให้ถ้าจำเป็น) หรือ fallback_model"""
+        if not self.enabled:
+            return self.fallback_model
+        with self._lock:
+            now = self.clock()
+            usable = self.cached_content is not None and now < self.expires_at
+            if now < self.retry_at:
+                return self.cached_model if usable else self.fallback_model
+            try:
+                if not usable:
+                    self._create(now)
+                elif now >= self.expires_at - self.refresh_margin_seconds:
+                    self._refresh(now)
+                self.failures = 0
+            except Exception as e:
+                metrics.inc("errors_total", app="workaw", stage="context_cache")
+                log.error("context_cache_error", model=self.model_name, failures=self.failures + 1, error=repr(e))
+                self.last_error = str(e)
+                self.failures += 1
+                self.retry_at = now + min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (self.failures - 1))
+                if not usable:
+                    # ใช้ cache ไม่ได้แล้ว: กลับไปใช้แบบเดิมจนกว่าจะถึงรอบลองใหม่
+                    self.cached_content = None
+                    self.cached_model = None
+                    return self.fallback_model
+            return self.cached_model
+
+    def _create(self, now):
+        caching_api, model_factory = self._api()
+        self.cached_content = caching_api.create(
+            model=self.model_name,
+            display_name="workaw-document",
+            system_instruction=self.system_instruction,
+            contents=self.contents,
+            ttl=datetime.timedelta(seconds=self.ttl_seconds),
+        )
+        self.cached_model = model_factory(
+            self.cached_content,
+            generation_config=self.generation_config,
+            safety_settings=self.safety_settings,
+        )
+        self.expires_at = now + self.ttl_seconds
+        self.creates += 1
+
+    def _refresh(self, now):
+        self.cached_content.update(ttl=datetime.timedelta(seconds=self.ttl_seconds))
+        self.expires_at = now + self.ttl_seconds
+        self.refreshes += 1
+
+    def record_usage(self, usage_metadata):
+        """เก็บสถิติ token จาก response.usage_metadata ของแต่ละ request"""
+        if usage_metadata is None:
+            return
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+        cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+        with self._lock:
+            self.requests += 1
+            self.cached_tokens += cached
+            self.uncached_tokens += max(0, prompt_tokens - cached)
+            self.last_usage = {
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached,
+                "uncached_tokens": max(0, prompt_tokens - cached),
+                "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "active": self.active,
+                "creates": self.creates,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "retry_in": max(0.0, self.retry_at - self.clock()),
+                "requests": self.requests,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.uncached_tokens,
+                "last_usage": self.last_usage,
+                "last_error": self.last_error,
+            }
+
+    def delete(self):
+        with self._lock:
+            if self.cached_content is not None:
+                try:
+                    self.cached_content.delete()
+                except Exception as e:
+                    metrics.inc("errors_total", app="workaw", stage="context_cache_delete")
+                    log.error("context_cache_delete_error", model=self.model_name, error=repr(e))
+            self.cached_content = None
+            self.cached_model = None
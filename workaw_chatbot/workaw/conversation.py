@@ -0,0 +1,122 @@
+import re
+
+from chat_history import SUMMARY_ACK, SUMMARY_PREFIX, estimate_tokens
+from instrumentation import log, metrics
+
+# ส่วนที่แปะเพิ่มให้ model ตอนถาม ไม่ควรถูกเก็บเป็นประวัติ
+SECRET_INSTRUCTION_PATTERN = re.compile(r"\n?\(คำสั่งลับ:[^)]*\)\s*$")
+CONTEXT_WRAPPER_PATTERN = re.compile(r"^\[CONTEXT\]:.*?\n\[QUESTION\]:\n", re.S)
+
+
+def strip_instructions(text):
+    """ตัด [CONTEXT] ที่แนบมากับคำถามและ (คำสั่งลับ: ...) ออก เหลือแค่คำถามของผู้ใช้"""
+    text = SECRET_INSTRUCTION_PATTERN.sub("", text)
+    return CONTEXT_WRAPPER_PATTERN.sub("", text).strip()
+
+
+def compress_turns(dropped_turns, answer_chars=200):
+    """สรุปแบบไม่เรียก model: เก็บคำถามเต็ม + ต้นคำตอบ (พอให้รู้ว่าเคยคุยอะไรไปแล้ว)"""
+    lines = []
+    for turn in dropped_turns:
+        answer = " ".join(turn["model"].split())
+        if len(answer) > answer_chars:
+            answer = answer[:answer_chars] + "..."
+        lines.append(f"- ถาม: {turn['user']} / ตอบ: {answer}")
+    return "\n".join(lines)
+
+
+# --- 🧵 Conversation Manager (หนึ่งตัวต่อหนึ่ง Streamlit session) ---
+class ConversationManager:
+    """
+    ประวัติแชทที่ส่งให้ Gemini แบบนับ token แทนการตัด 10 ข้อความล่าสุด
+
+    - เก็บ turn ล่าสุดไว้ไม่เกิน max_history_tokens (turn ล่าสุดอยู่เสมอ)
+    - turn ที่หลุดหน้าต่างจะถูกรวมเป็น running summary ด้วย summarizer(old_summary, dropped_turns) -> str
+      ถ้าไม่มี summarizer หรือเรียกไม่สำเร็จ จะใช้ compress_turns() แล้วตัด summary ให้ไม่เกิน summary_max_tokens
+    - ChatSession ถูกใช้ซ้ำข้าม rerun ตราบที่ยังเป็น model ตัวเดิม แค่ตั้ง history ให้ตรงกับหน้าต่างก่อนส่ง
+    """
+
+    def __init__(self, max_history_tokens=3000, summary_max_tokens=500, summarizer=None,
+                 token_counter=estimate_tokens):
+        self.max_history_tokens = max_history_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self.turns = []  # [{"user": คำถามที่ตัด context/คำสั่งลับแล้ว, "model": คำตอบ}]
+        self.summary = ""
+        self.summarized_turns = 0
+        self.sessions_started = 0
+        self._session = None
+        self._session_model = None
+
+    def _turn_tokens(self, turn):
+        return self.token_counter(turn["user"]) + self.token_counter(turn["model"])
+
+    def history(self):
+        """history ในรูปแบบที่ model.start_chat(history=...) รับได้"""
+        history = []
+        if self.summary:
+            history.append({"role": "user", "parts": [{"text": f"{SUMMARY_PREFIX}\n{self.summary}"}]})
+            history.append({"role": "model", "parts": [{"text": SUMMARY_ACK}]})
+        for turn in self.turns:
+            history.append({"role": "user", "parts": [{"text": turn["user"]}]})
+            history.append({"role": "model", "parts": [{"text": turn["model"]}]})
+        return history
+
+    def history_tokens(self):
+        summary = self.token_counter(self.summary) + self.token_counter(SUMMARY_ACK) if self.summary else 0
+        return summary + sum(self._turn_tokens(t) for t in self.turns)
+
+    def session(self, model):
+        """ChatSession ของ model นี้ (ใช้ตัวเดิมถ้ายังเป็น model เดิม) โดย history = หน้าต่างปัจจุบัน"""
+        if self._session is None or self._session_model is not model:
+            self._session = model.start_chat(history=self.history())
+            self._session_model = model
+            self.sessions_started += 1
+        else:
+            # send_message รอบก่อนต่อท้ายคำถามเต็ม (มี context/คำสั่งลับ) ไว้ใน session จึงตั้งใหม่ทุกครั้ง
+            self._session.history = self.history()
+        return self._session
+
+    def discard_session(self):
+        """ทิ้ง session ที่อาจค้างครึ่งทาง (เช่น stream ถูกตัดเพราะ 429)"""
+        self._session = None
+        self._session_model = None
+
+    def append_turn(self, user_text, model_text):
+        self.turns.append({"user": strip_instructions(user_text), "model": model_text})
+        dropped = []
+        while len(self.turns) > 1 and sum(self._turn_tokens(t) for t in self.turns) > self.max_history_tokens:
+            dropped.append(self.turns.pop(0))
+        if dropped:
+            self._summarize(dropped)
+
+    def _summarize(self, dropped):
+        self.summarized_turns += len(dropped)
+        if self.summarizer is not None:
+            try:
+                self.summary = self.summarizer(self.summary, dropped).strip()
+                return
+            except Exception as e:
+                metrics.inc("errors_total", app="workaw", stage="summarize")
+                log.error("summarize_error", turns=len(dropped), error=repr(e))
+        summary = "\n".join(part for part in [self.summary, compress_turns(dropped)] if part)
+        # เกินงบ: ทิ้งบรรทัดเก่าสุดของ summary ก่อน
+        lines = summary.split("\n")
+        while len(lines) > 1 and self.token_counter("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def clear(self):
+        self.turns = []
+        self.summary = ""
+        self.discard_session()
+
+    def stats(self):
+        return {
+            "turns": len(self.turns),
+            "summarized_turns": self.summarized_turns,
+            "history_tokens": self.history_tokens(),
+            "summary_tokens": self.token_counter(self.summary) if self.summary else 0,
+            "sessions_started": self.sessions_started,
+        }
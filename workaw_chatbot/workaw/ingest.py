@@ -0,0 +1,176 @@
+"""
+Ingestion แบบขนานหลาย process สำหรับ PDF ขนาดใหญ่
+
+แบ่งหน้าของ PDF เป็น shard ให้แต่ละ worker เปิด fitz document ของตัวเอง แล้วส่งผลกลับมาเรียงตามลำดับหน้า
+ผลลัพธ์ถูกเขียนลง cache เดียวกับที่ app.py ใช้ (pdf_cache) จึงใช้ CLI นี้ ingest ไว้ล่วงหน้าได้
+
+    python ingest.py Graphic.pdf other.pdf --workers 4
+    python ingest.py Graphic.pdf --workers 4 --images     # render รูปทุกหน้าลง cache ด้วย
+    python ingest.py Graphic.pdf --bench                   # วัด scaling ที่ 1, 2, 4, 8 workers
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from pdf_cache import DEFAULT_CACHE_DIR, PdfCacheEntry, PdfCacheWriter, cache_key
+from page_images import image_block_rects, render_page_images
+
+DEFAULT_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEFAULT_SHARD_SIZE = 16
+
+
+# --- งานที่รันใน worker process (ต้องเป็นฟังก์ชันระดับ module เพื่อให้ pickle ได้) ---
+def _extract_shard(file_path, start, stop):
+    doc = fitz.open(file_path)
+    try:
+        results = []
+        for index in range(start, stop):
+            page = doc[index]
+            results.append({"page_num": index + 1, "text": page.get_text(), "image_rects": image_block_rects(page)})
+        return results
+    finally:
+        doc.close()
+
+
+def _render_shard(file_path, entry_root, entry_key, start, stop):
+    entry = PdfCacheEntry(entry_root, entry_key)
+    doc = fitz.open(file_path)
+    try:
+        for index in range(start, stop):
+            if entry.read_page_images(index + 1) is None:
+                entry.write_page_images(index + 1, render_page_images(doc[index], rects=entry.image_rects(index + 1)))
+        return stop - start
+    finally:
+        doc.close()
+
+
+def page_count(file_path):
+    doc = fitz.open(file_path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def shard_ranges(total_pages, shard_size):
+    return [(start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+
+
+class IngestStats:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pages = 0
+        self.seconds = 0.0
+        self.started = 0.0
+        self.cached = False
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        name = os.path.basename(self.file_path)
+        if self.cached:
+            return f"{name}: มี cache อยู่แล้ว ({self.pages} หน้า)"
+        return f"{name}: {self.pages} หน้า ใน {self.seconds:.2f}s ({self.pages_per_second:.1f} pages/s)"
+
+
+def submit_pages(file_path, pool, shard_size=DEFAULT_SHARD_SIZE):
+    """ส่งทุก shard ของไฟล์เข้า pool ทันที คืนค่า list ของ Future เรียงตามลำดับหน้า"""
+    return [pool.submit(_extract_shard, file_path, start, stop)
+            for start, stop in shard_ranges(page_count(file_path), shard_size)]
+
+
+def iter_pages(futures):
+    """ทยอย yield ผลทีละหน้าตามลำดับ (shard ถัดไปอาจเสร็จก่อนแล้วก็รอในคิว)"""
+    for future in futures:
+        yield from future.result()
+
+
+def ingest_files(file_paths, workers=DEFAULT_WORKERS, cache_dir=DEFAULT_CACHE_DIR,
+                 shard_size=DEFAULT_SHARD_SIZE, render_images=False, force=False):
+    """
+    ingest PDF หลายไฟล์พร้อมกันด้วย process pool เดียว เขียนผลลง cache แล้วคืนค่า {file_path: IngestStats}
+    force=True จะ parse ใหม่แม้มี cache อยู่แล้ว (ใช้ตอน benchmark)
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # เริ่มงานของทุกไฟล์ก่อน แล้วค่อยเก็บผลทีละไฟล์ worker จะได้ไม่ว่าง
+        jobs = []
+        for file_path in file_paths:
+            stats = IngestStats(file_path)
+            entry = PdfCacheEntry(cache_dir, cache_key(file_path))
+            results[file_path] = stats
+            if entry.exists() and not force:
+                stats.cached = True
+                stats.pages = len(entry.load())
+                jobs.append((file_path, entry, stats, None))
+                continue
+            stats.started = time.perf_counter()
+            jobs.append((file_path, entry, stats, submit_pages(file_path, pool, shard_size)))
+
+        for file_path, entry, stats, futures in jobs:
+            if futures is not None:
+                writer = PdfCacheWriter(entry)
+                try:
+                    for page in iter_pages(futures):
+                        writer.add_page(page["page_num"], page["text"], page["image_rects"])
+                        stats.pages += 1
+                    writer.commit(file_path, overwrite=force)
+                except Exception:
+                    writer.abort()
+                    raise
+                stats.seconds = time.perf_counter() - stats.started
+
+            if render_images:
+                started = time.perf_counter()
+                render_jobs = [pool.submit(_render_shard, file_path, os.path.dirname(entry.path), entry.key, start, stop)
+                               for start, stop in shard_ranges(stats.pages, shard_size)]
+                for future in render_jobs:
+                    future.result()
+                stats.seconds += time.perf_counter() - started
+    return results
+
+
+def run_benchmark(file_paths, worker_counts=(1, 2, 4, 8), shard_size=DEFAULT_SHARD_SIZE, render_images=False):
+    import tempfile
+
+    print(f"{'workers':>8} {'pages':>8} {'seconds':>10} {'pages/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as tmp_cache:
+            started = time.perf_counter()
+            stats = ingest_files(file_paths, workers=workers, cache_dir=tmp_cache,
+                                 shard_size=shard_size, render_images=render_images, force=True)
+            elapsed = time.perf_counter() - started
+        pages = sum(s.pages for s in stats.values())
+        rate = pages / elapsed if elapsed else 0.0
+        baseline = baseline or rate
+        print(f"{workers:>8} {pages:>8} {elapsed:>10.2f} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest PDF แบบขนานหลาย process")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--images", action="store_true", help="render รูปทุกหน้าลง cache ด้วย")
+    parser.add_argument("--force", action="store_true", help="parse ใหม่แม้มี cache อยู่แล้ว")
+    parser.add_argument("--bench", action="store_true", help="วัด scaling ที่ 1, 2, 4, 8 workers")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_benchmark(args.pdfs, shard_size=args.shard_size, render_images=args.images)
+    else:
+        started = time.perf_counter()
+        all_stats = ingest_files(args.pdfs, workers=args.workers, cache_dir=args.cache_dir,
+                                 shard_size=args.shard_size, render_images=args.images, force=args.force)
+        for s in all_stats.values():
+            print(s)
+        total_pages = sum(s.pages for s in all_stats.values() if not s.cached)
+        elapsed = time.perf_counter() - started
+        print(f"รวม {total_pages} หน้า ใน {elapsed:.2f}s ({total_pages / elapsed if elapsed else 0:.1f} pages/s)")
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from instrumentation import log, metrics
+
+
+def list_generate_models():
+    """รายชื่อ model ที่รองรับ generateContent (ชื่อแบบไม่มี prefix 'models/')"""
+    import google.generativeai as genai
+    return [
+        m.name.split("/", 1)[-1]
+        for m in genai.list_models()
+        if "generateContent" in m.supported_generation_methods
+    ]
+
+
+def probe_model(model_name, timeout):
+    """
+    เช็คว่า model ใช้งานได้ด้วย count_tokens (ไม่กินโควต้า generate เหมือน generate_content("Hi"))
+    """
+    import google.generativeai as genai
+    genai.GenerativeModel(model_name=model_name).count_tokens("Hi", request_options={"timeout": timeout})
+
+
+# --- 🧭 Model Registry ---
+class ModelRegistry:
+    """
+    เลือก model จาก candidates ตามลำดับที่ต้องการ โดยไม่ต้อง ping ทีละตัวทุกครั้งที่เปิดแอป
+
+    - probe ทุก candidate พร้อมกันด้วย timeout สั้นๆ แล้วเก็บผลลงไฟล์
+      (ผลที่ใช้ได้หมดอายุใน ttl_seconds ผลที่ใช้ไม่ได้หมดอายุเร็วกว่าใน failure_ttl_seconds)
+    - ระหว่างใช้งาน ถ้า model ที่ใช้อยู่พังหรือโดน 429 ให้เรียก report_failure()
+      model นั้นจะถูกพักไว้ cooldown_seconds แล้วสลับไปตัวถัดไปทันที (ไม่ต้อง restart แอป)
+    - model ที่พังระหว่างใช้งานจะถูก probe ใหม่ใน current() เมื่อผลหมดอายุ (failure_ttl_seconds)
+      ถ้าผ่านก็กลับไปใช้ตัวที่ต้องการมากกว่า
+    """
+
+    def __init__(self, candidates, state_path=None, ttl_seconds=6 * 3600, failure_ttl_seconds=300,
+                 probe_timeout=5.0, cooldown_seconds=60.0, probe_func=probe_model, list_models_func=None, clock=time.time):
+        self.candidates = list(candidates)
+        self.state_path = state_path
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.probe_timeout = probe_timeout
+        self.cooldown_seconds = cooldown_seconds
+        self.probe_func = probe_func
+        self.list_models_func = list_models_func
+        self.clock = clock
+        self.state = {}          # model -> {"ok": bool, "checked_at": float, "error": str}
+        self.cooldown_until = {}  # model -> เวลาที่พักครบ (เฉพาะใน process นี้)
+        self.failovers = 0
+        self.active = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def _save(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            metrics.inc("errors_total", app="workaw", stage="model_registry_save")
+            log.error("model_registry_save_error", path=self.state_path, error=repr(e))
+
+    def _is_fresh(self, model_name, now):
+        entry = self.state.get(model_name)
+        if entry is None:
+            return False
+        ttl = self.ttl_seconds if entry["ok"] else self.failure_ttl_seconds
+        return now - entry["checked_at"] < ttl
+
+    def probe(self, model_names):
+        """probe หลาย model พร้อมกัน ตัวที่เกิน timeout ถือว่าใช้ไม่ได้"""
+        now = self.clock()
+        results = {}
+        pool = ThreadPoolExecutor(max_workers=max(1, len(model_names)), thread_name_prefix="model-probe")
+        futures = {pool.submit(self.probe_func, name, self.probe_timeout): name for name in model_names}
+        done, _ = wait(futures, timeout=self.probe_timeout + 1)
+        for future, name in futures.items():
+            if future not in done:
+                results[name] = {"ok": False, "checked_at": now, "error": "timeout"}
+            elif future.exception() is not None:
+                results[name] = {"ok": False, "checked_at": now, "error": str(future.exception())}
+            else:
+                results[name] = {"ok": True, "checked_at": now, "error": ""}
+        pool.shutdown(wait=False)
+        return results
+
+    def refresh(self, force=False):
+        """probe เฉพาะ candidate ที่ยังไม่มีผลหรือผลหมดอายุ (force=True = probe ใหม่ทั้งหมด)"""
+        now = self.clock()
+        with self._lock:
+            stale = [m for m in self.candidates if force or not self._is_fresh(m, now)]
+        if not stale:
+            return
+        if self.list_models_func is not None:
+            # ตัด model ที่ไม่อยู่ในรายชื่อออกก่อน ไม่ต้องเสีย round trip ไป probe
+            try:
+                available = set(self.list_models_func())
+                missing = [m for m in stale if m not in available]
+                stale = [m for m in stale if m in available]
+                with self._lock:
+                    for m in missing:
+                        self.state[m] = {"ok": False, "checked_at": now, "error": "not in list_models"}
+            except Exception as e:
+                metrics.inc("errors_total", app="workaw", stage="list_models")
+                log.error("list_models_error", error=repr(e))
+        results = self.probe(stale) if stale else {}
+        with self._lock:
+            self.state.update(results)
+            self._save()
+
+    def select(self):
+        """คืนชื่อ model ตัวแรกตามลำดับที่ใช้ได้และไม่ได้พักอยู่ หรือ None"""
+        self.refresh()
+        with self._lock:
+            self.active = self._first_available(self.clock())
+            return self.active
+
+    def _first_available(self, now, exclude=None):
+        for name in self.candidates:
+            if name == exclude:
+                continue
+            entry = self.state.get(name)
+            if entry and entry["ok"] and self.cooldown_until.get(name, 0.0) <= now:
+                return name
+        return None
+
+    def _stale_preferred(self, now):
+        """candidate ที่ต้องการมากกว่าตัวที่ใช้อยู่ ซึ่งเคยใช้ไม่ได้แต่ผลหมดอายุแล้ว (ควร probe ใหม่)"""
+        stale = []
+        for name in self.candidates:
+            if name == self.active:
+                break
+            entry = self.state.get(name)
+            if entry and not entry["ok"] and not self._is_fresh(name, now):
+                stale.append(name)
+        return stale
+
+    def current(self):
+        """model ที่ควรใช้ตอนนี้ (กลับไปใช้ตัวที่ต้องการมากกว่าเมื่อพ้น cooldown หรือ probe ผ่านอีกครั้ง)"""
+        with self._lock:
+            stale = self._stale_preferred(self.clock())
+        # probe ครั้งละ thread เดียว ระหว่างนั้น session อื่นใช้ผลเดิมไปก่อน
+        if stale and self._refresh_lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+        with self._lock:
+            best = self._first_available(self.clock())
+            if best is not None:
+                self.active = best
+            return self.active
+
+    def report_failure(self, model_name, rate_limited=False, error=""):
+        """model พัง/โดน 429: พักไว้ชั่วคราว แล้วคืนชื่อ model ตัวถัดไปที่ใช้ได้"""
+        now = self.clock()
+        with self._lock:
+            self.cooldown_until[model_name] = now + self.cooldown_seconds
+            if not rate_limited:
+                self.state[model_name] = {"ok": False, "checked_at": now, "error": error or "runtime failure"}
+                self._save()
+            next_model = self._first_available(now, exclude=model_name)
+            if next_model is not None and next_model != self.active:
+                self.failovers += 1
+                self.active = next_model
+            return next_model
+
+    def errors(self):
+        with self._lock:
+            return {name: e["error"] for name, e in self.state.items() if not e["ok"]}
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            return {
+                "active": self.active,
+                "failovers": self.failovers,
+                "healthy": [m for m in self.candidates
+                            if self.state.get(m, {}).get("ok") and self.cooldown_until.get(m, 0.0) <= now],
+                "cooling_down": [m for m, t in self.cooldown_until.items() if t > now],
+            }
@@ -0,0 +1,210 @@
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+from pdf_cache import RENDER_SETTINGS
+
+
+def image_block_rects(page):
+    """[[x0, y0, x1, y1], ...] ของ image block ในหน้า (เก็บลง cache ตอน ingest จะได้ไม่ต้องแยก block ซ้ำตอน render)"""
+    return [list(b[:4]) for b in page.get_text("blocks") if b[6] == 1]
+
+
+def render_page_images(page, settings=RENDER_SETTINGS, rects=None):
+    """
+    ตัดรูปจาก image block ของหน้า ถ้าไม่มีรูปเลยจะ render ทั้งหน้าแทน
+    rects = ตำแหน่ง image block จาก cache (None = แยก block จากหน้าใหม่)
+    """
+    if rects is None:
+        rects = image_block_rects(page)
+    saved_images = []
+    pad = settings["padding"]
+    for img_rect in rects:
+        rect = fitz.Rect(img_rect)
+        if rect.width > settings["min_size"] and rect.height > settings["min_size"]:
+            rect.x0 -= pad; rect.y0 -= pad; rect.x1 += pad; rect.y1 += pad
+            try:
+                zoom = settings["crop_zoom"]
+                pix_crop = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=rect)
+                saved_images.append(pix_crop.tobytes("png"))
+            except: pass
+
+    if not saved_images:
+        zoom = settings["page_zoom"]
+        pix_full = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        saved_images.append(pix_full.tobytes("png"))
+    return saved_images
+
+
+def make_thumbnail(png_bytes, max_width=320):
+    """ย่อรูปด้วย Pixmap.shrink (หารครึ่งทีละเท่า) จนกว้างไม่เกิน max_width * 2"""
+    pix = fitz.Pixmap(png_bytes)
+    factor = int(math.log2(pix.width / max_width)) if pix.width > max_width * 2 else 0
+    if factor <= 0:
+        return png_bytes
+    pix.shrink(factor)
+    return pix.tobytes("png")
+
+
+# --- 🧠 LRU จำกัดขนาดเป็นจำนวน bytes ---
+class ByteLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(images):
+        return sum(len(img) for img in images)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, images):
+        size = self._size(images)
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._size(self._items.pop(key))
+            if size > self.max_bytes:
+                return  # ใหญ่เกิน cache ทั้งก้อน ไม่ต้องเก็บ
+            self._items[key] = images
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= self._size(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+# --- 🖼️ Render รูปของหน้าแบบ on-demand ---
+class PageImageRenderer:
+    """
+    dict-like {page_num: [png_bytes, ...]} ที่ render รูปของหน้าเมื่อถูกอ้างถึงครั้งแรกเท่านั้น
+    ลำดับการหา: LRU ในหน่วยความจำ -> cache บนดิสก์ -> render ใหม่ด้วย PyMuPDF (บน thread pool)
+    thumbnail ย่อจากรูปเต็มแล้วเก็บแยกใน LRU ของตัวเอง (ใช้แสดงในประวัติแชท ภาพเต็มโหลดเมื่อกดดู)
+    """
+
+    def __init__(self, file_path, page_count, cache_entry=None, max_bytes=64 * 1024 * 1024, workers=2,
+                 thumbnail_width=320):
+        self.file_path = file_path
+        self.page_count = page_count
+        self.cache_entry = cache_entry
+        self.thumbnail_width = thumbnail_width
+        self.lru = ByteLRU(max_bytes)
+        self.thumb_lru = ByteLRU(max(1, max_bytes // 8))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page-render")
+        self._doc = None
+        # PyMuPDF ไม่ thread-safe จึงให้ render ทีละหน้า แต่การอ่าน/เขียนดิสก์ทำขนานกันได้
+        self._render_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.RLock()
+
+    def __contains__(self, page_num):
+        return isinstance(page_num, int) and 1 <= page_num <= self.page_count
+
+    def __getitem__(self, page_num):
+        if page_num not in self:
+            raise KeyError(page_num)
+        return self.get(page_num)
+
+    def __len__(self):
+        return self.page_count
+
+    def get(self, page_num, timeout=None):
+        return self.submit(page_num).result(timeout=timeout)
+
+    def submit(self, page_num):
+        """
+        สั่ง render หน้าไว้ล่วงหน้า (ไม่บล็อก) คืนค่า Future; ขอหน้าเดียวกันซ้ำจะได้ Future เดิม
+        ทุกการขอรูปผ่าน LRU ก่อน (hit/miss ใน stats() จึงนับครบทุกครั้ง)
+        """
+        images = self.lru.get(page_num)
+        if images is not None:
+            future = Future()
+            future.set_result(images)
+            return future
+        with self._pending_lock:
+            future = self._pending.get(page_num)
+            if future is None:
+                future = self.executor.submit(self._load, page_num)
+                self._pending[page_num] = future
+                future.add_done_callback(lambda _f, p=page_num: self._forget(p))
+            return future
+
+    def prefetch(self, page_nums):
+        return [self.submit(p) for p in page_nums if p in self]
+
+    def submit_thumbnails(self, page_num):
+        """
+        เหมือน submit() แต่ได้ thumbnail; การย่อเป็นงานแยกบน executor เดียวกัน (ส่งตามหลังงาน render รูปเต็ม)
+        จึงไม่ไปย่อบน thread ที่เรียก แม้รูปเต็มจะอยู่ใน LRU แล้วก็ตาม
+        """
+        thumbs = self.thumb_lru.get(page_num)
+        if thumbs is not None:
+            result = Future()
+            result.set_result(thumbs)
+            return result
+        return self.executor.submit(self._shrink, page_num, self.submit(page_num))
+
+    def get_thumbnails(self, page_num, timeout=None):
+        return self.submit_thumbnails(page_num).result(timeout=timeout)
+
+    def stats(self):
+        return self.lru.stats()
+
+    def thumbnail_stats(self):
+        return self.thumb_lru.stats()
+
+    def _forget(self, page_num):
+        with self._pending_lock:
+            self._pending.pop(page_num, None)
+
+    def _shrink(self, page_num, full_future):
+        full_images = full_future.result()
+        with self._render_lock:
+            images = [make_thumbnail(img, self.thumbnail_width) for img in full_images]
+        self.thumb_lru.put(page_num, images)
+        return images
+
+    def _load(self, page_num):
+        images = None
+        if self.cache_entry is not None:
+            images = self.cache_entry.read_page_images(page_num)
+        if images is None:
+            images = self._render(page_num)
+            if self.cache_entry is not None:
+                self.cache_entry.write_page_images(page_num, images)
+        self.lru.put(page_num, images)
+        return images
+
+    def _render(self, page_num):
+        with self._render_lock:
+            if self._doc is None:
+                self._doc = fitz.open(self.file_path)
+            rects = self.cache_entry.image_rects(page_num) if self.cache_entry is not None else None
+            return render_page_images(self._doc[page_num - 1], rects=rects)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+# --- Cache Config ---
+DEFAULT_CACHE_DIR = os.getenv(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pdf_cache"),
+)
+CACHE_FORMAT_VERSION = 3
+
+# ค่าการ render ที่มีผลกับรูปที่ได้ (เปลี่ยนค่าไหน = cache key ใหม่)
+RENDER_SETTINGS = {
+    "crop_zoom": 3,       # ขยายรูปที่ crop จาก image block
+    "page_zoom": 2,       # ขยายทั้งหน้า (กรณีไม่มีรูปในหน้า)
+    "min_size": 50,       # image block ที่เล็กกว่านี้ไม่เอา
+    "padding": 5,         # ขอบรอบรูปที่ crop
+}
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file_path, settings=None):
+    """key = hash ของเนื้อไฟล์ PDF + hash ของค่า render"""
+    settings = settings or RENDER_SETTINGS
+    settings_blob = json.dumps({"v": CACHE_FORMAT_VERSION, **settings}, sort_keys=True).encode()
+    return f"{file_sha256(file_path)[:32]}-{hashlib.sha256(settings_blob).hexdigest()[:12]}"
+
+
+class PdfCacheEntry:
+    """
+    ไดเรกทอรี cache ของ PDF หนึ่งไฟล์: manifest.json + pages.json + image_rects.json + images/
+    pages.json มีแค่ข้อความ (warm start อ่านไฟล์นี้ไฟล์เดียว) ส่วนตำแหน่ง image block แยกไว้ใน image_rects.json
+    ที่อ่านตอน render รูปครั้งแรกเท่านั้น รูปของแต่ละหน้าจะถูกเขียนเพิ่มทีหลังเมื่อหน้านั้นถูก render ครั้งแรก
+    """
+
+    def __init__(self, root, key):
+        self.key = key
+        self.path = os.path.join(root, key)
+        self._image_rects = None
+        self._image_rects_lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def load(self):
+        """คืนค่า pages = [{"page_num", "text"}, ...]"""
+        with open(os.path.join(self.path, "pages.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def image_rects(self, page_num):
+        """คืนค่า [[x0, y0, x1, y1], ...] ของ image block ในหน้า หรือ None ถ้า cache ไม่มีข้อมูล"""
+        with self._image_rects_lock:
+            if self._image_rects is None:
+                try:
+                    with open(os.path.join(self.path, "image_rects.json"), encoding="utf-8") as f:
+                        self._image_rects = json.load(f)
+                except (OSError, ValueError):
+                    self._image_rects = {}
+        return self._image_rects.get(str(page_num))
+
+    def _image_index_path(self, page_num):
+        return os.path.join(self.path, "images", f"p{page_num:05d}.json")
+
+    def read_page_images(self, page_num):
+        """คืนค่า [png_bytes, ...] ของหน้า หรือ None ถ้ายังไม่เคย render"""
+        try:
+            with open(self._image_index_path(page_num), encoding="utf-8") as f:
+                names = json.load(f)
+            images = []
+            for name in names:
+                with open(os.path.join(self.path, "images", name), "rb") as f:
+                    images.append(f.read())
+            return images
+        except (OSError, ValueError):
+            return None
+
+    def write_page_images(self, page_num, images):
+        names = []
+        for i, png in enumerate(images):
+            name = f"p{page_num:05d}_{i:02d}.png"
+            with open(os.path.join(self.path, "images", name), "wb") as f:
+                f.write(png)
+            names.append(name)
+        # เขียน index ทีหลังสุดแบบ atomic: มี index = รูปครบแล้ว
+        tmp_index = f"{self._image_index_path(page_num)}.{os.getpid()}.tmp"
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(names, f)
+        os.replace(tmp_index, self._image_index_path(page_num))
+
+
+class PdfCacheWriter:
+    """เขียน cache ลงโฟลเดอร์ชั่วคราวก่อน แล้วค่อย rename ทีเดียว (กันไฟล์ครึ่งๆ กลางๆ)"""
+
+    def __init__(self, entry):
+        self.entry = entry
+        parent = os.path.dirname(entry.path)
+        os.makedirs(parent, exist_ok=True)
+        self.tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+        os.makedirs(os.path.join(self.tmp_path, "images"))
+        self.pages = []
+        self.image_rects = {}
+
+    def add_page(self, page_num, text, image_rects):
+        self.pages.append({"page_num": page_num, "text": text})
+        self.image_rects[str(page_num)] = image_rects
+
+    def commit(self, source_path, overwrite=False):
+        with open(os.path.join(self.tmp_path, "pages.json"), "w", encoding="utf-8") as f:
+            json.dump(self.pages, f, ensure_ascii=False)
+        with open(os.path.join(self.tmp_path, "image_rects.json"), "w", encoding="utf-8") as f:
+            json.dump(self.image_rects, f)
+        manifest = {
+            "version": CACHE_FORMAT_VERSION,
+            "source": os.path.basename(source_path),
+            "settings": RENDER_SETTINGS,
+            "page_count": len(self.pages),
+        }
+        with open(os.path.join(self.tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        if overwrite and os.path.exists(self.entry.path):
+            shutil.rmtree(self.entry.path, ignore_errors=True)
+        try:
+            os.replace(self.tmp_path, self.entry.path)
+        except OSError:
+            # มี process อื่นเขียน cache เดียวกันเสร็จก่อนแล้ว ใช้ของเขาได้เลย
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
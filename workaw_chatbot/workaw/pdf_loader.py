@@ -0,0 +1,72 @@
+import os
+import fitz  # PyMuPDF
+
+from pdf_cache import DEFAULT_CACHE_DIR, PdfCacheEntry, PdfCacheWriter, cache_key
+from page_images import PageImageRenderer, image_block_rects
+import ingest
+from instrumentation import log, metrics
+
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "64")) * 1024 * 1024
+IMAGE_RENDER_WORKERS = int(os.getenv("IMAGE_RENDER_WORKERS", "2"))
+INGEST_WORKERS = ingest.DEFAULT_WORKERS
+INGEST_PARALLEL_MIN_PAGES = int(os.getenv("INGEST_PARALLEL_MIN_PAGES", "64"))
+
+
+def format_page_text(page_num, text):
+    return f"\n[--- Page {page_num} START ---]\n{text}\n[--- Page {page_num} END ---]\n"
+
+
+def build_cache(file_path, entry):
+    """อ่าน PDF ครั้งแรก แล้วเขียนข้อความและตำแหน่ง image block ลง cache (รูปจะ render ทีหลังเมื่อถูกอ้างถึง)"""
+    doc = fitz.open(file_path)
+    total_pages = doc.page_count
+
+    # ไฟล์ใหญ่: กระจายหน้าไปหลาย process (ดู ingest.py)
+    if INGEST_WORKERS > 1 and total_pages >= INGEST_PARALLEL_MIN_PAGES:
+        doc.close()
+        stats = ingest.ingest_files([file_path], workers=INGEST_WORKERS, cache_dir=os.path.dirname(entry.path))
+        file_stats = stats[file_path]
+        log.info("pdf_ingested", file=os.path.basename(file_path), pages=file_stats.pages,
+                 seconds=round(file_stats.seconds, 2), workers=INGEST_WORKERS)
+        return
+
+    writer = PdfCacheWriter(entry)
+    try:
+        for i, page in enumerate(doc):
+            writer.add_page(i + 1, page.get_text(), image_block_rects(page))
+        writer.commit(file_path)
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        doc.close()
+
+
+# --- ระบบอ่านไฟล์แบบ Hybrid (ข้อความ + รูปภาพ) ---
+def load_pdf_data_hybrid(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    อ่านข้อความทุกหน้า (ครอบด้วย [--- Page N START/END ---]) จาก cache บนดิสก์
+    (key = hash ไฟล์ + ค่า render) ถ้ายังไม่มี cache จะ parse PDF แล้วเขียนเก็บไว้
+    คืนค่า (text_content, page_images_map) โดย page_images_map เป็น PageImageRenderer
+    ที่ render รูปของหน้าเมื่อถูกอ้างถึงครั้งแรกเท่านั้น
+    """
+    if not os.path.exists(file_path):
+        return "", {}
+    try:
+        entry = PdfCacheEntry(cache_dir, cache_key(file_path))
+        if not entry.exists():
+            build_cache(file_path, entry)
+        pages = entry.load()
+        text_content = "".join(format_page_text(p["page_num"], p["text"]) for p in pages)
+        page_images_map = PageImageRenderer(
+            file_path,
+            page_count=len(pages),
+            cache_entry=entry,
+            max_bytes=IMAGE_CACHE_MAX_BYTES,
+            workers=IMAGE_RENDER_WORKERS,
+        )
+        return text_content, page_images_map
+    except Exception as e:
+        metrics.inc("errors_total", app="workaw", stage="pdf_load")
+        log.error("pdf_load_error", file=os.path.basename(file_path), error=repr(e))
+        return "", {}
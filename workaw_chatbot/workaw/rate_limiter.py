@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import random
+import sqlite3
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    """รอคิวเกิน deadline ที่กำหนด"""
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0, rng=random):
+    """exponential backoff แบบ full jitter: สุ่มระหว่าง 0 ถึง min(cap, base * 2^attempt)"""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+def _plan(states, requests, cooldown_until, now):
+    """
+    คำนวณว่าต้องรออีกกี่วินาที (0 = หยิบได้เลย) และ state ใหม่ของแต่ละ bucket
+    states: {key: (tokens, updated)}, requests: [(key, capacity, rate, amount), ...]
+    """
+    if cooldown_until > now:
+        return cooldown_until - now, None
+    wait = 0.0
+    new_states = {}
+    for key, capacity, rate, amount in requests:
+        tokens, updated = states.get(key, (capacity, now))
+        tokens = _refill(tokens, updated, capacity, rate, now)
+        amount = min(amount, capacity)  # request ที่ใหญ่กว่า bucket ก็ให้ผ่านเมื่อ bucket เต็ม
+        if tokens < amount:
+            wait = max(wait, (amount - tokens) / rate)
+        new_states[key] = (tokens - amount, now)
+    return (wait, None) if wait > 0 else (0.0, new_states)
+
+
+# --- Backend: เก็บสถานะ bucket ---
+class MemoryBackend:
+    """ใช้ร่วมกันภายใน process เดียว (ทุก Streamlit session)"""
+
+    def __init__(self):
+        self._states = {}
+        self._cooldowns = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, scope, requests, now):
+        with self._lock:
+            wait, new_states = _plan(self._states, requests, self._cooldowns.get(scope, 0.0), now)
+            if new_states:
+                self._states.update(new_states)
+            return wait
+
+    def set_cooldown(self, scope, until):
+        with self._lock:
+            self._cooldowns[scope] = max(self._cooldowns.get(scope, 0.0), until)
+
+
+class SQLiteBackend:
+    """ใช้ร่วมกันหลาย process ผ่านไฟล์ SQLite (ล็อกด้วย BEGIN IMMEDIATE)"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cooldowns (scope TEXT PRIMARY KEY, until REAL)")
+        self._lock = threading.Lock()
+
+    def try_acquire(self, scope, requests, now):
+        keys = [r[0] for r in requests]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT key, tokens, updated FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                ).fetchall()
+                cooldown = self._conn.execute("SELECT until FROM cooldowns WHERE scope = ?", (scope,)).fetchone()
+                states = {key: (tokens, updated) for key, tokens, updated in rows}
+                wait, new_states = _plan(states, requests, cooldown[0] if cooldown else 0.0, now)
+                if new_states:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(k, t, u) for k, (t, u) in new_states.items()],
+                    )
+                self._conn.execute("COMMIT")
+                return wait
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def set_cooldown(self, scope, until):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cooldowns (scope, until) VALUES (?, ?) "
+                "ON CONFLICT(scope) DO UPDATE SET until = MAX(until, excluded.until)",
+                (scope, until),
+            )
+
+
+# --- 🚦 Rate Limiter ---
+class RateLimiter:
+    """
+    token bucket ต่อ model: จำกัดทั้งจำนวน request ต่อนาที (rpm) และ token ต่อนาที (tpm)
+
+    - คำขอที่ยังไม่ได้โควต้า จะรอตามลำดับ priority (ตัวเลขน้อย = มาก่อน) แล้วตามลำดับที่เข้ามา
+    - deadline (เวลา epoch) ถ้ารอเกินจะ raise DeadlineExceeded แทนการรอไปเรื่อยๆ
+    - เมื่อโดน 429 ให้เรียก penalize() ทุก session/process จะหยุดยิงจนพ้นช่วง cooldown
+    """
+
+    def __init__(self, rpm, tpm, backend=None, clock=time.time, burst_seconds=10.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst_seconds = burst_seconds
+        self.backend = backend or MemoryBackend()
+        self.clock = clock
+        self.granted = 0
+        self.timeouts = 0
+        self.penalties = 0
+        self.total_wait = 0.0
+        self._cond = threading.Condition()
+        self._waiters = {}  # model -> heap ของ (priority, seq)
+        self._seq = itertools.count()
+
+    def _requests(self, model, tokens):
+        # ขนาด bucket = โควต้าในช่วง burst_seconds: ถ้าใหญ่เท่าโควต้าทั้งนาที จะยิงได้เกือบ 2 เท่าใน window
+        # ของ Gemini (bucket เต็ม + ที่เติมระหว่างนาที) จึงให้ burst เล็กกว่า 1 นาที
+        scale = self.burst_seconds / 60.0
+        return [
+            (f"{model}:requests", self.rpm * scale, self.rpm / 60.0, 1),
+            (f"{model}:tokens", self.tpm * scale, self.tpm / 60.0, tokens),
+        ]
+
+    def acquire(self, model, tokens=1, priority=0, deadline=None):
+        """รอจนได้โควต้า คืนค่าจำนวนวินาทีที่รอ"""
+        started = self.clock()
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heap = self._waiters.setdefault(model, [])
+            heapq.heappush(heap, ticket)
+            try:
+                while True:
+                    now = self.clock()
+                    if heap[0] == ticket:
+                        wait = self.backend.try_acquire(model, self._requests(model, tokens), now)
+                        if wait <= 0:
+                            heapq.heappop(heap)
+                            self.granted += 1
+                            self.total_wait += now - started
+                            self._cond.notify_all()
+                            return now - started
+                    else:
+                        wait = 0.25  # ยังไม่ถึงคิว รอให้คนข้างหน้าปลุก
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0 or (heap[0] == ticket and wait > remaining):
+                            self.timeouts += 1
+                            raise DeadlineExceeded(f"รอคิว {model} เกิน deadline")
+                        wait = min(wait, remaining)
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                if ticket in heap:
+                    heap.remove(ticket)
+                    heapq.heapify(heap)
+                    self._cond.notify_all()
+                raise
+
+    def penalize(self, model, seconds):
+        """โดน 429: ให้ทุกคนหยุดยิง model นี้ไป seconds วินาที"""
+        self.penalties += 1
+        self.backend.set_cooldown(model, self.clock() + seconds)
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "granted": self.granted,
+                "timeouts": self.timeouts,
+                "penalties": self.penalties,
+                "waiting": sum(len(h) for h in self._waiters.values()),
+                "avg_wait": (self.total_wait / self.granted) if self.granted else 0.0,
+            }
+
+
+def call_with_rate_limit(func, limiter, model, tokens, retry_on, priority=0, deadline=None,
+                         retries=5, base_delay=1.0, max_delay=30.0):
+    """
+    เรียก func() ภายใต้ limiter ถ้าโดน exception ใน retry_on (เช่น 429) จะ penalize ด้วย jittered backoff
+    แล้วกลับไปต่อคิวใหม่ (limiter จะปล่อยเมื่อพ้น cooldown)
+    """
+    for attempt in range(retries):
+        limiter.acquire(model, tokens=tokens, priority=priority, deadline=deadline)
+        try:
+            return func()
+        except retry_on:
+            if attempt == retries - 1:
+                raise
+            limiter.penalize(model, backoff_delay(attempt, base=base_delay, cap=max_delay))
@@ -0,0 +1,165 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+# --- Tokenizer ภาษาไทย (ใช้ pythainlp ถ้ามี ไม่งั้นตัดคำแบบง่าย) ---
+try:
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:
+    _thai_word_tokenize = None
+
+# --- Vector index (ใช้ scikit-learn ถ้ามี) ---
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import linear_kernel
+except ImportError:
+    TfidfVectorizer = None
+
+PAGE_PATTERN = re.compile(r"\[--- Page (\d+) START ---\]\n(.*?)\n\[--- Page \1 END ---\]", re.S)
+SECTION_SPLIT_PATTERN = re.compile(r"\n\s*\n")
+TOKEN_PATTERN = re.compile(r"[\u0e00-\u0e7f]+|[a-zA-Z]+|\d+")
+THAI_PATTERN = re.compile(r"[\u0e00-\u0e7f]")
+
+
+def tokenize(text):
+    """ตัดคำสำหรับทำ index: ตัวพิมพ์เล็ก ตัดช่องว่างและเครื่องหมายวรรคตอนทิ้ง"""
+    text = text.lower()
+    if _thai_word_tokenize is not None and THAI_PATTERN.search(text):
+        words = _thai_word_tokenize(text, engine="newmm", keep_whitespace=False)
+    else:
+        words = TOKEN_PATTERN.findall(text)
+    return [w.strip() for w in words if w.strip() and TOKEN_PATTERN.search(w)]
+
+
+def split_pages(pdf_text):
+    """แยก pdf_text (รูปแบบจาก load_pdf_data_hybrid) ออกเป็น [(page_num, text), ...]"""
+    return [(int(num), body.strip()) for num, body in PAGE_PATTERN.findall(pdf_text)]
+
+
+class Chunk:
+    def __init__(self, chunk_id, page_num, text):
+        self.chunk_id = chunk_id
+        self.page_num = page_num
+        self.text = text
+
+    def __repr__(self):
+        return f"Chunk(id={self.chunk_id}, page={self.page_num}, chars={len(self.text)})"
+
+
+def chunk_pages(pdf_text, max_chars=1200):
+    """
+    แบ่งเอกสารเป็น chunk ตามหน้าและตามหัวข้อ (ย่อหน้าที่คั่นด้วยบรรทัดว่าง)
+    ย่อหน้าที่สั้นจะถูกรวมกันจนยาวไม่เกิน max_chars และ chunk จะไม่ข้ามหน้า
+    """
+    chunks = []
+    for page_num, page_text in split_pages(pdf_text):
+        if not page_text:
+            continue
+        buffer = ""
+        for section in SECTION_SPLIT_PATTERN.split(page_text):
+            section = section.strip()
+            if not section:
+                continue
+            if buffer and len(buffer) + len(section) + 2 > max_chars:
+                chunks.append(Chunk(len(chunks), page_num, buffer))
+                buffer = ""
+            # ย่อหน้าที่ยาวเกินก็ตัดเป็นท่อนๆ
+            while len(section) > max_chars:
+                chunks.append(Chunk(len(chunks), page_num, section[:max_chars]))
+                section = section[max_chars:]
+            buffer = f"{buffer}\n\n{section}" if buffer else section
+        if buffer:
+            chunks.append(Chunk(len(chunks), page_num, buffer))
+    return chunks
+
+
+# --- 🔎 Lexical Index (BM25) ---
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings = defaultdict(list)  # term -> [(chunk_idx, tf), ...]
+        for idx, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk.text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((idx, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(posts) + 0.5) / (len(posts) + 0.5))
+            for term, posts in self.postings.items()
+        }
+
+    def search(self, query, k=5):
+        """คืนค่า [(chunk, score), ...] เรียงจากคะแนนมากไปน้อย"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * (self.doc_lengths[idx] / self.avg_length if self.avg_length else 0)
+                scores[idx] += idf * (tf * (self.k1 + 1)) / (tf + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chunks[idx], score) for idx, score in ranked]
+
+
+# --- 🧭 Vector Index (TF-IDF + cosine) แบบเลือกใช้ได้ ---
+class TfidfVectorIndex:
+    def __init__(self, chunks):
+        if TfidfVectorizer is None:
+            raise ImportError("ต้องติดตั้ง scikit-learn เพื่อใช้ vector index")
+        self.chunks = chunks
+        self.vectorizer = TfidfVectorizer(tokenizer=tokenize, lowercase=False, token_pattern=None)
+        self.matrix = self.vectorizer.fit_transform([c.text for c in chunks])
+
+    def search(self, query, k=5):
+        query_vec = self.vectorizer.transform([query])
+        scores = linear_kernel(query_vec, self.matrix).ravel()
+        ranked = scores.argsort()[::-1][:k]
+        return [(self.chunks[idx], float(scores[idx])) for idx in ranked if scores[idx] > 0]
+
+
+class DocumentRetriever:
+    """
+    รวม BM25 กับ vector index (ถ้าเปิดใช้) ด้วย Reciprocal Rank Fusion
+    แล้วคืนเฉพาะ chunk ที่เกี่ยวข้องพร้อมเลขหน้า
+    """
+
+    def __init__(self, pdf_text, max_chars=1200, use_vector=False):
+        self.chunks = chunk_pages(pdf_text, max_chars=max_chars)
+        self.bm25 = BM25Index(self.chunks)
+        self.vector = None
+        if use_vector and TfidfVectorizer is not None and self.chunks:
+            self.vector = TfidfVectorIndex(self.chunks)
+
+    def retrieve(self, query, k=5, rrf_k=60):
+        candidates = k * 3
+        rankings = [self.bm25.search(query, candidates)]
+        if self.vector is not None:
+            rankings.append(self.vector.search(query, candidates))
+
+        fused = defaultdict(float)
+        for ranking in rankings:
+            for rank, (chunk, _score) in enumerate(ranking):
+                fused[chunk.chunk_id] += 1.0 / (rrf_k + rank + 1)
+        ranked_ids = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [self.chunks[cid] for cid in ranked_ids]
+
+    def build_context(self, query, k=5):
+        """สร้าง [CONTEXT] จาก top-k chunk โดยเรียงตามหน้าและคงป้าย [--- Page N ---] ไว้"""
+        return format_context(self.retrieve(query, k=k))
+
+
+def format_context(chunks):
+    by_page = defaultdict(list)
+    for chunk in sorted(chunks, key=lambda c: c.chunk_id):
+        by_page[chunk.page_num].append(chunk.text)
+    parts = []
+    for page_num in sorted(by_page):
+        body = "\n...\n".join(by_page[page_num])
+        parts.append(f"[--- Page {page_num} START ---]\n{body}\n[--- Page {page_num} END ---]")
+    return "\n".join(parts)